@@ -0,0 +1,329 @@
+"""ASGI serving mode for the recommendation API.
+
+The scoring endpoints are served as async handlers on the event loop; the
+CPU-bound scoring itself runs on a bounded executor, and requests beyond its
+queue limit are answered immediately with 503 instead of piling up. Every
+other path (UI, static files) is handed to the Flask app through a small
+WSGI bridge on the same executor.
+
+    uvicorn asgi:app                               # development
+    SERVING_MODE=asgi gunicorn -c gunicorn.conf.py # production, see gunicorn.conf.py
+
+Scoring threads keep the event loop responsive; parallelism across cores
+comes from running several workers (see gunicorn.conf.py), or, with
+SCORING_SERVICE_WORKERS set, from the scoring processes of one
+scoring_service.py supervisor that /api/ai-recommendation and
+/api/analyze-symptoms are dispatched to. Live analysis keeps its sessions in
+this process, so /api/analyze-symptoms/live always runs on the executor.
+
+Settings:
+    ASGI_EXECUTOR_THREADS  executor size, default 4
+    ASGI_MAX_PENDING       queued + running scoring calls before 503, default 256
+    ASGI_MAX_BODY_BYTES    largest accepted request body, default 1 MiB
+    SCORING_SERVICE_*      see scoring_service.py
+"""
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import explain
+import main
+import metrics
+import response_format
+from scoring_service import service_from_env
+from validation import RecommendationRequest, ValidationError, symptom_text_from_payload
+
+EXECUTOR_THREADS = int(os.environ.get("ASGI_EXECUTOR_THREADS", 4))
+MAX_PENDING = int(os.environ.get("ASGI_MAX_PENDING", 256))
+MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when the scoring executor queue is full"""
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds ASGI_MAX_BODY_BYTES"""
+
+
+class BoundedExecutor:
+    """Executor wrapper that refuses work once max_pending calls are queued or running"""
+
+    def __init__(self, workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scoring")
+        self.max_pending = max_pending
+        # Only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise Overloaded()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+executor = BoundedExecutor(EXECUTOR_THREADS, MAX_PENDING)
+
+# Recommendations and symptom analyses scored by worker processes instead of executor threads;
+# None unless SCORING_SERVICE_WORKERS is set
+scoring_service = service_from_env(main)
+
+if scoring_service is not None:
+    metrics.registry.register_collector(scoring_service.metrics)
+
+
+def _json_response(status, payload):
+    return status, [(b"content-type", b"application/json")], response_format.dumps(payload)
+
+
+def _error(status, message):
+    return _json_response(status, {"success": False, "error": message})
+
+
+def _invalid(error):
+    return _json_response(400, {"success": False, "error": str(error), "errors": error.errors})
+
+
+def _client_id(scope):
+    """Rate-limit key, as main._client_id derives it for Flask requests"""
+    if main.RATE_LIMIT_CLIENT_HEADER:
+        wanted = main.RATE_LIMIT_CLIENT_HEADER.lower().encode("latin-1")
+        for name, value in scope["headers"]:
+            if name == wanted and value:
+                return value.decode("latin-1").split(",")[0].strip()
+    return (scope.get("client") or ("", 0))[0]
+
+
+def _query(scope):
+    return {name: values[-1] for name, values in parse_qs(scope["query_string"].decode("latin-1")).items()}
+
+
+def _analyze_symptoms_payload(symptom_text, respond=False, sampled=False):
+    """Same response body as the Flask /api/analyze-symptoms view"""
+    with explain.recording(respond or sampled) as trace:
+        results = main.analyze_symptoms(symptom_text)
+    return main.attach_trace("analyze-symptoms", {"success": True if results else False, "results": results},
+                             trace, respond, sampled)
+
+
+def _live_analysis_payload(session_id, symptom_text):
+    """Same response body as the Flask /api/analyze-symptoms/live view"""
+    session_id, results = main.analyze_symptoms_live(session_id, symptom_text)
+    return {"success": True if results else False, "sessionId": session_id, "results": results}
+
+
+def _ai_recommendation_response(req, compact, respond=False, sampled=False):
+    """Same response as the Flask /api/ai-recommendation view, as (recommendation, encoded body)"""
+    with explain.recording(respond or sampled) as trace:
+        recommendation = main.recommend(req)
+    payload = {"success": True, "recommendation": recommendation}
+    if compact:
+        dictionary = response_format.dictionary_for(main.get_knowledge_base(), main.get_dosing_guidance)
+        payload["recommendation"] = dictionary.compact(recommendation)
+    body = response_format.dumps(main.attach_trace("ai-recommendation", payload, trace, respond, sampled))
+    return recommendation, body
+
+
+async def analyze_symptoms(data, query):
+    try:
+        symptom_text = symptom_text_from_payload(data)
+    except ValidationError as e:
+        return _invalid(e)
+    respond, sampled = main.explain_options(query)
+    # Traces are recorded in this process, so traced requests are not sent to the scoring service
+    if scoring_service is not None and not (respond or sampled):
+        if scoring_service.queued >= MAX_PENDING:
+            raise Overloaded()
+        body = await asyncio.wrap_future(scoring_service.submit_analysis(symptom_text))
+        return 200, [(b"content-type", b"application/json")], body
+    payload = await executor.run(_analyze_symptoms_payload, symptom_text, respond, sampled)
+    return _json_response(200, payload)
+
+
+async def analyze_symptoms_live(data, query):
+    try:
+        symptom_text = symptom_text_from_payload(data)
+        if not isinstance(data.get('sessionId'), (str, type(None))):
+            raise ValidationError([{"field": "sessionId", "message": "Must be a string."}])
+    except ValidationError as e:
+        return _invalid(e)
+    payload = await executor.run(_live_analysis_payload, data.get('sessionId'), symptom_text)
+    return _json_response(200, payload)
+
+
+async def ai_recommendation(data, query):
+    response_format_name = query.get("format", "full")
+    if response_format_name not in main.RESPONSE_FORMATS:
+        return _error(400, f"Unknown format '{response_format_name}'; expected full or compact.")
+    try:
+        req = RecommendationRequest.from_payload(data)
+    except ValidationError as e:
+        return _invalid(e)
+    compact = response_format_name == "compact"
+    respond, sampled = main.explain_options(query)
+    # Traces are recorded in this process, so traced requests are not sent to the scoring service
+    if scoring_service is not None and not (respond or sampled):
+        if scoring_service.queued >= MAX_PENDING:
+            raise Overloaded()
+        # The recommendation itself only comes back from the worker when it is to be recorded
+        label, body, recommendation = await asyncio.wrap_future(
+            scoring_service.submit(req, compact, record=main.recommendation_store is not None))
+    else:
+        recommendation, body = await executor.run(_ai_recommendation_response, req, compact, respond, sampled)
+        label = main._condition_label(recommendation)
+    metrics.count_recommendation(label)
+    if main.recommendation_store is not None:
+        main.recommendation_store.record(req, recommendation, data)
+    return 200, [(b"content-type", b"application/json")], body
+
+
+API_ROUTES = {
+    "/api/analyze-symptoms": ("analyze-symptoms", analyze_symptoms),
+    "/api/analyze-symptoms/live": ("analyze-symptoms-live", analyze_symptoms_live),
+    "/api/ai-recommendation": ("ai-recommendation", ai_recommendation),
+}
+
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _call_wsgi(scope, body):
+    """Run the Flask app for one request and collect its complete response"""
+    headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers:
+        key = name.upper().replace("-", "_")
+        if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[key] = value
+        else:
+            key = f"HTTP_{key}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in response_headers]
+
+    result = main.app.wsgi_app(environ, start_response)
+    try:
+        content = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], content
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if scoring_service is not None:
+                    scoring_service.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                executor.shutdown()
+                if scoring_service is not None:
+                    scoring_service.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    started = time.perf_counter()
+    route = API_ROUTES.get(scope["path"])
+    # Limited clients are turned away before their body is even read
+    retry_after = 0
+    body = None
+    if route and scope["method"] == "POST" and main.rate_limiter is not None:
+        retry_after = main.rate_limiter.acquire(_client_id(scope))
+    try:
+        body = b"" if retry_after else await _read_body(receive)
+        if body is None:
+            return
+        if retry_after:
+            status, headers, content = _error(429, "Too many requests, please retry shortly.")
+            headers.append((b"retry-after", str(math.ceil(retry_after)).encode()))
+        elif route and scope["method"] == "POST":
+            try:
+                data = json.loads(body)
+            except ValueError:
+                status, headers, content = _error(400, "Request body must be valid JSON.")
+            else:
+                if not isinstance(data, dict):
+                    status, headers, content = _error(400, "Request body must be a JSON object.")
+                else:
+                    status, headers, content = await route[1](data, _query(scope))
+        elif scope["path"] == "/metrics":
+            status, headers, content = 200, [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")], \
+                metrics.registry.render().encode()
+        else:
+            status, headers, content = await executor.run(_call_wsgi, scope, body)
+    except Overloaded:
+        status, headers, content = _error(503, "Server busy, please retry shortly.")
+        headers.append((b"retry-after", b"1"))
+    except BodyTooLarge:
+        status, headers, content = _error(413, f"Request body exceeds {MAX_BODY_BYTES} bytes.")
+    except Exception:
+        logger.exception("Unhandled error serving %s", scope["path"])
+        status, headers, content = _error(500, "Internal server error.")
+
+    headers = [(name, value) for name, value in headers if name != b"content-length"]
+    headers.append((b"content-length", str(len(content)).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": content})
+    if route:
+        elapsed = time.perf_counter() - started
+        metrics.observe_request(route[0], elapsed)
+        # Routes served here never reach the Flask app, so its capture middleware does not see them
+        capture = main.traffic_capture
+        if capture is not None and body is not None and not retry_after and capture.sample(scope["method"], scope["path"]):
+            capture.record(time.time() - elapsed, scope["method"], scope["path"],
+                           scope["query_string"].decode("latin-1"), body, status, elapsed, len(content))
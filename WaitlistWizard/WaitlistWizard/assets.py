@@ -0,0 +1,306 @@
+"""Build step for the static assets: minified, bundled, fingerprinted and precompressed.
+
+    python assets.py build            # writes static/dist/ and its manifest
+    python assets.py build --clean    # drops earlier builds first
+
+Each bundle in BUNDLES is its sources concatenated in page order, minified,
+and written as static/dist/<name>.<content hash>.<ext> together with .gz and
+(when brotli is installed) .br variants. The manifest maps bundle names to
+those files; templates ask for asset_urls(name) and get the fingerprinted
+bundle when a build is present and current, or the unbundled sources when it
+is not, so development needs no build at all. Fingerprinted files never change,
+so they are served with immutable cache headers (see main.serve_static).
+
+rjsmin and rcssmin are used for minification when installed. Without them
+comments and indentation are stripped by a conservative minifier that keeps
+every line break, so automatic semicolon insertion sees the same code.
+Earlier builds are kept by default: pages cached by clients may still refer
+to them.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Bundle name -> sources under static/, in the order the page loads them
+BUNDLES = {
+    "css/styles.css": ("css/styles.css",),
+    "js/bundle.js": ("js/drugDatabase.js", "js/app.js", "js/patientApp.js"),
+}
+
+# Content-Encoding -> file suffix of a precompressed variant, in order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+
+# Precompressed variants are only kept when they are meaningfully smaller
+MIN_COMPRESSION_SAVING = 0.05
+
+_CSS_TOKENS = re.compile(r'/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|\s+|[^"\'/\s]+|/', re.S)
+_CSS_PUNCTUATION = re.compile(r"\s*([{};,])\s*")
+
+# After one of these (or at the start) a slash opens a regular expression, elsewhere it divides
+_REGEX_AFTER_CHARS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_AFTER_WORDS = {"return", "typeof", "case", "do", "else", "in", "of", "new", "delete", "void",
+                      "throw", "instanceof", "yield", "await"}
+_WORD_CHAR = re.compile(r"[\w$]")
+
+
+def minify_css(source):
+    """CSS without comments and redundant whitespace"""
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    # Runs of code between quoted strings, which are kept exactly as written
+    parts = [""]
+    for token in _CSS_TOKENS.findall(source):
+        if token[0] in "'\"":
+            parts += [token, ""]
+        elif not token.startswith("/*"):
+            parts[-1] += " " if token.isspace() else token
+    for i in range(0, len(parts), 2):
+        parts[i] = _CSS_PUNCTUATION.sub(r"\1", parts[i]).replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def _skip_quoted(source, i, quote):
+    """Index just past the string starting at source[i]"""
+    i += 1
+    while source[i] != quote:
+        i += 2 if source[i] == "\\" else 1
+    return i + 1
+
+
+def _skip_regex(source, i):
+    """Index just past the regular expression literal (flags included) starting at source[i]"""
+    i += 1
+    in_class = False
+    while in_class or source[i] != "/":
+        if source[i] == "\\":
+            i += 1
+        elif source[i] == "[":
+            in_class = True
+        elif source[i] == "]":
+            in_class = False
+        i += 1
+    i += 1
+    while i < len(source) and _WORD_CHAR.match(source[i]):
+        i += 1
+    return i
+
+
+def _regex_allowed(out):
+    code = "".join(out[-64:]).rstrip()
+    if not code or code[-1] in _REGEX_AFTER_CHARS:
+        return True
+    word = re.search(r"[\w$]+$", code)
+    return word is not None and word.group() in _REGEX_AFTER_WORDS
+
+
+def _whitespace(out, newline):
+    """Append the separator a run of whitespace or comments reduces to; literals are never touched"""
+    if out and out[-1] == " ":
+        out.pop()
+    if not out or out[-1] == "\n":
+        return
+    out.append("\n" if newline else " ")
+
+
+def minify_js(source):
+    """JavaScript without comments, indentation or blank lines; line breaks are kept"""
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    out = []
+    # Brace depth at which each enclosing template literal's ${...} closes
+    templates = []
+    depth = 0
+    i = 0
+    n = len(source)
+    while i < n:
+        c = source[i]
+        if c in "'\"":
+            end = _skip_quoted(source, i, c)
+            out.append(source[i:end])
+            i = end
+        elif c == "`" or (c == "}" and templates and templates[-1] == depth):
+            if c == "}":
+                templates.pop()
+            # Template literal text up to its end or its next ${
+            j = i + 1
+            while source[j] != "`" and not source.startswith("${", j):
+                j += 2 if source[j] == "\\" else 1
+            if source[j] == "`":
+                out.append(source[i:j + 1])
+                i = j + 1
+            else:
+                out.append(source[i:j + 2])
+                templates.append(depth)
+                i = j + 2
+        elif source.startswith("//", i):
+            i = source.find("\n", i)
+            i = n if i < 0 else i
+        elif source.startswith("/*", i):
+            end = source.index("*/", i + 2) + 2
+            # A comment spanning lines still ends a statement for semicolon insertion
+            _whitespace(out, "\n" in source[i:end])
+            i = end
+        elif c == "/" and _regex_allowed(out):
+            end = _skip_regex(source, i)
+            out.append(source[i:end])
+            i = end
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            _whitespace(out, "\n" in source[i:j])
+            i = j
+        else:
+            if c == "{":
+                depth += 1
+            elif c == "}":
+                depth -= 1
+            out.append(c)
+            i += 1
+    return "".join(out).strip() + "\n"
+
+
+def _minify(name, source):
+    return minify_css(source) if name.endswith(".css") else minify_js(source)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, clean=False):
+    """Write every bundle and its variants under static_dir/dist; returns the manifest"""
+    dist = os.path.join(static_dir, DIST_DIR)
+    if clean and os.path.isdir(dist):
+        shutil.rmtree(dist)
+    assets = {}
+    for name, sources in BUNDLES.items():
+        texts = []
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding="utf-8") as f:
+                texts.append(f.read())
+        # Scripts are joined with a statement break, in case one ends without a semicolon
+        joined = "\n".join(texts) if name.endswith(".css") else "\n;\n".join(texts)
+        data = _minify(name, joined).encode()
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        filename = f"{DIST_DIR}/{stem}.{digest}{ext}"
+        _write(os.path.join(static_dir, filename), data)
+        variants = {}
+        if brotli is not None:
+            variants["br"] = brotli.compress(data, quality=11)
+        variants["gzip"] = gzip.compress(data, compresslevel=9, mtime=0)
+        encodings = []
+        for encoding, compressed in variants.items():
+            if len(compressed) <= len(data) * (1 - MIN_COMPRESSION_SAVING):
+                _write(os.path.join(static_dir, filename + ENCODINGS[encoding]), compressed)
+                encodings.append(encoding)
+        assets[name] = {
+            "file": filename,
+            "digest": digest,
+            "sources": list(sources),
+            "bytes": len(data),
+            "source_bytes": sum(len(text.encode()) for text in texts),
+            "encodings": {encoding: len(variants[encoding]) for encoding in encodings},
+        }
+    manifest = {"version": MANIFEST_VERSION, "assets": assets}
+    _write(os.path.join(dist, MANIFEST_NAME), json.dumps(manifest, indent=2).encode())
+    return manifest
+
+
+class AssetManifest:
+    """A build's bundles, looked up by name for templates and by file for serving"""
+
+    def __init__(self, manifest):
+        self.assets = manifest["assets"]
+        # Fingerprinted file -> (digest, available encodings in order of preference)
+        self._files = {
+            asset["file"]: (asset["digest"], tuple(e for e in ENCODINGS if e in asset["encodings"]))
+            for asset in self.assets.values()
+        }
+
+    def files(self, name):
+        """Files under static/ to load for a bundle name"""
+        return [self.assets[name]["file"]]
+
+    def fingerprinted(self, path):
+        """(digest, encodings) for a fingerprinted file of this build, or None"""
+        return self._files.get(path)
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    """The current build's manifest, or None when there is none or a source changed after it"""
+    path = os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)
+    try:
+        built = os.stat(path).st_mtime
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    for asset in manifest["assets"].values():
+        for source in asset["sources"]:
+            if os.stat(os.path.join(static_dir, source)).st_mtime > built:
+                logger.warning("%s changed after the last asset build; serving unbundled sources until "
+                               "`python assets.py build` is run again", source)
+                return None
+    return AssetManifest(manifest)
+
+
+def asset_files(manifest, name):
+    """Files under static/ a page loads for a bundle: the build's, or the sources without one"""
+    return manifest.files(name) if manifest is not None else list(BUNDLES[name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build minified, fingerprinted and precompressed static bundles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="write static/dist and its manifest")
+    build_parser.add_argument("--clean", action="store_true", help="remove earlier builds first")
+    args = parser.parse_args(argv)
+
+    manifest = build(clean=args.clean)
+    for name, asset in manifest["assets"].items():
+        sizes = ", ".join(f"{encoding} {size}" for encoding, size in asset["encodings"].items())
+        print(f"{name:20s} {asset['source_bytes']:8d} -> {asset['bytes']:8d} bytes ({sizes})  {asset['file']}",
+              file=sys.stderr)
+    if rjsmin is None or rcssmin is None or brotli is None:
+        print("install rjsmin, rcssmin and brotli for smaller bundles and .br variants", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""Prefix index behind /api/autocomplete.
+
+Names are indexed once into a sorted array of lowercase keys (the full name
+plus every suffix that starts at a word boundary), so a prefix query is two
+bisections instead of a scan. Prefixes matching more than DENSE_PREFIX_KEYS
+keys (short queries such as "a") have their ranking precomputed at build
+time. Queries with too few prefix hits fall back to a substring search over
+postings of every 1-3 character gram, each kept in rank order: a query of up
+to three characters reads its own posting list, a longer one scans the rarest
+of its trigrams, and either stops once enough substring hits are found.
+Results are ranked exact match, name prefix, word prefix, then substring;
+shorter names first within a tier.
+"""
+import hashlib
+import os
+import re
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from heapq import nsmallest
+
+AUTOCOMPLETE_DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      "static", "js", "autocompleteData.js")
+
+KINDS = ("condition", "medication")
+
+# Most results one query can return
+MAX_RESULTS = 50
+
+# Prefix ranges wider than this are ranked once at build time rather than per query
+DENSE_PREFIX_KEYS = 256
+
+_JS_ARRAY = re.compile(r"const\s+(\w+)\s*=\s*\[(.*?)\];", re.S)
+_JS_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_WORD_START = re.compile(r"(?<![a-z0-9])[a-z0-9]")
+_SPACES = re.compile(r"\s+")
+
+# Rank tiers
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+
+
+def normalize_query(text):
+    """Lowercase and collapse whitespace, as names are indexed"""
+    return _SPACES.sub(" ", text).strip().lower()
+
+
+@lru_cache(maxsize=None)
+def load_frontend_lists(path=AUTOCOMPLETE_DATA_PATH):
+    """The string arrays declared in autocompleteData.js, by variable name"""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    return {name: tuple(_JS_STRING.findall(body)) for name, body in _JS_ARRAY.findall(source)}
+
+
+class PrefixIndex:
+    """Immutable sorted-key index over (name, kind) entries"""
+
+    def __init__(self, entries):
+        names = []
+        kinds = []
+        seen = set()
+        for name, kind in entries:
+            key = normalize_query(name)
+            # First spelling wins, so the curated frontend names beat raw table keys
+            if key and key not in seen:
+                seen.add(key)
+                names.append(name)
+                kinds.append(kind)
+        self.names = tuple(names)
+        self.kinds = tuple(kinds)
+        self.lowered = tuple(normalize_query(name) for name in names)
+        self.version = hashlib.sha1("\n".join(f"{k}:{n}" for n, k in zip(names, kinds)).encode()).hexdigest()[:16]
+
+        keys = []
+        for entry, lowered in enumerate(self.lowered):
+            for match in _WORD_START.finditer(lowered):
+                keys.append((lowered[match.start():], entry))
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._entries = [entry for _, entry in keys]
+
+        # entry ids containing each gram of up to three characters, in substring-tier rank order
+        postings = {}
+        for entry in sorted(range(len(names)), key=self._rank_key):
+            lowered = self.lowered[entry]
+            grams = {lowered[i:i + n] for n in (1, 2, 3) for i in range(len(lowered) - n + 1)}
+            for gram in grams:
+                postings.setdefault(gram, []).append(entry)
+        self._grams = {gram: tuple(entries) for gram, entries in postings.items()}
+
+        self._dense = {}
+        self._rank_dense_prefixes("", 0, len(self._keys))
+
+        self.search = lru_cache(maxsize=4096)(self._search)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _rank_key(self, entry):
+        """Order of entries within a tier"""
+        return len(self.lowered[entry]), self.lowered[entry]
+
+    def _rank(self, hits, limit):
+        return nsmallest(limit, hits.items(), key=lambda hit: (hit[1], *self._rank_key(hit[0])))
+
+    def _rank_dense_prefixes(self, prefix, lo, hi):
+        """Precompute the top MAX_RESULTS for every prefix whose key range exceeds DENSE_PREFIX_KEYS"""
+        if hi - lo <= DENSE_PREFIX_KEYS:
+            return
+        if prefix:
+            self._dense[prefix] = tuple(self._rank(self._range_hits(prefix, lo, hi), MAX_RESULTS))
+        depth = len(prefix)
+        # Keys equal to the prefix sort first and have no next character
+        while lo < hi and len(self._keys[lo]) == depth:
+            lo += 1
+        while lo < hi:
+            child = self._keys[lo][:depth + 1]
+            child_hi = bisect_right(self._keys, child + "\uffff", lo, hi)
+            self._rank_dense_prefixes(child, lo, child_hi)
+            lo = child_hi
+
+    def _range_hits(self, query, lo, hi):
+        """entry -> best tier among the keys in [lo, hi), all of which start with query"""
+        hits = {}
+        for position in range(lo, hi):
+            entry = self._entries[position]
+            lowered = self.lowered[entry]
+            if len(self._keys[position]) == len(lowered):
+                tier = EXACT if lowered == query else PREFIX
+            else:
+                tier = WORD_PREFIX
+            if tier < hits.get(entry, SUBSTRING + 1):
+                hits[entry] = tier
+        return hits
+
+    def _prefix_hits(self, query):
+        lo = bisect_left(self._keys, query)
+        hi = bisect_right(self._keys, query + "\uffff", lo)
+        return self._range_hits(query, lo, hi)
+
+    def _substring_hits(self, query, hits, wanted):
+        """Add the best `wanted` substring-only matches to hits"""
+        if len(query) <= 3:
+            candidates = self._grams.get(query, ())
+        else:
+            # Every entry containing the query contains each of its trigrams; the rarest one bounds the scan
+            grams = [self._grams.get(query[i:i + 3], ()) for i in range(len(query) - 2)]
+            candidates = min(grams, key=len)
+        # Candidates come in rank order, so the first matches found are the ones that rank
+        for entry in candidates:
+            if wanted <= 0:
+                return
+            if entry not in hits and query in self.lowered[entry]:
+                hits[entry] = SUBSTRING
+                wanted -= 1
+
+    def _search(self, query, limit=10):
+        """Top `limit` (name, kind) pairs for an already normalized query"""
+        limit = min(limit, MAX_RESULTS)
+        if not query or limit <= 0:
+            return ()
+        ranked = self._dense.get(query)
+        if ranked is None or len(ranked) < limit:
+            hits = self._prefix_hits(query)
+            if len(hits) < limit:
+                self._substring_hits(query, hits, limit - len(hits))
+            ranked = self._rank(hits, limit)
+        return tuple((self.names[entry], self.kinds[entry]) for entry, _ in ranked[:limit])
+
+
+def build_indexes(medication_effectiveness, path=AUTOCOMPLETE_DATA_PATH):
+    """One index per kind plus a combined one, keyed by kind name and "all"
+
+    Conditions are the frontend list plus the knowledge base's condition keys;
+    medications are the frontend list plus every medication the knowledge base
+    can recommend.
+    """
+    lists = load_frontend_lists(path)
+    conditions = list(lists.get("healthConditionsAutocomplete", ()))
+    conditions += [condition.title() for condition in medication_effectiveness]
+    medications = list(lists.get("medicationsAutocomplete", ()))
+    medications += [medication for scores in medication_effectiveness.values() for medication in scores]
+
+    entries = {
+        "condition": [(name, "condition") for name in conditions],
+        "medication": [(name, "medication") for name in medications],
+    }
+    indexes = {kind: PrefixIndex(entries[kind]) for kind in KINDS}
+    indexes["all"] = PrefixIndex(entries["condition"] + entries["medication"])
+    return indexes
+
+
+_built = (None, None)
+
+
+def indexes_for(kb):
+    """Indexes for a knowledge base, rebuilt only when its fingerprint changes"""
+    global _built
+    fingerprint, indexes = _built
+    if fingerprint != kb.fingerprint:
+        indexes = build_indexes(kb.tables["medication_effectiveness"])
+        _built = (kb.fingerprint, indexes)
+    return indexes
@@ -0,0 +1,210 @@
+"""Reproducible benchmarks for the symptom-analysis and recommendation hot paths.
+
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output candidate.json
+    python benchmark.py compare baseline.json candidate.json --threshold 0.10
+
+`run` reports p50/p95/p99 latency, throughput and tracemalloc allocations per
+case and saves them as JSON. `compare` flags cases whose latency regressed by
+more than the threshold and exits non-zero if any did.
+"""
+import argparse
+import gc
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import main
+from autocomplete import PrefixIndex
+from metrics import percentile
+from synthetic_data import (AGES, GENDERS, adversarial_symptom_texts, generate_patients,
+                            generate_symptom_texts, long_symptom_text, synthetic_names)
+
+
+def measure(fn, inputs, iterations, warmup=50, alloc_iterations=200):
+    """Time fn over inputs (cycled) and sample its allocations under tracemalloc"""
+    cycle = itertools.cycle(inputs)
+    for _ in range(warmup):
+        fn(next(cycle))
+
+    timings = []
+    gc.disable()
+    try:
+        started = time.perf_counter_ns()
+        for _ in range(iterations):
+            arg = next(cycle)
+            t0 = time.perf_counter_ns()
+            fn(arg)
+            timings.append(time.perf_counter_ns() - t0)
+        elapsed = time.perf_counter_ns() - started
+    finally:
+        gc.enable()
+
+    # Allocation pass is separate because tracing distorts timings
+    peaks = []
+    allocated = []
+    tracemalloc.start()
+    try:
+        for _ in range(min(alloc_iterations, iterations)):
+            arg = next(cycle)
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            fn(arg)
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            allocated.append(current - before)
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "p50_us": percentile(timings, 0.50) / 1000,
+        "p95_us": percentile(timings, 0.95) / 1000,
+        "p99_us": percentile(timings, 0.99) / 1000,
+        "mean_us": sum(timings) / len(timings) / 1000,
+        "throughput_per_s": iterations / (elapsed / 1e9) if elapsed else 0.0,
+        "peak_alloc_bytes": sum(peaks) / len(peaks) if peaks else 0,
+        "retained_bytes": sum(allocated) / len(allocated) if allocated else 0,
+    }
+
+
+def benchmark_cases(seed):
+    """Yield (name, fn, inputs) for every benchmarked case"""
+    rng = random.Random(seed)
+
+    short_texts = [text for _, text in generate_symptom_texts(500, seed=seed)]
+    long_texts = [long_symptom_text(rng) for _ in range(20)]
+    yield "analyze_symptoms/short", main.analyze_symptoms, short_texts
+    yield "analyze_symptoms/long", main.analyze_symptoms, long_texts
+    for name, text in adversarial_symptom_texts().items():
+        yield f"analyze_symptoms/adversarial/{name}", main.analyze_symptoms, [text]
+
+    combinations = [
+        (condition, gender, age, "", "")
+        for condition in main.medication_effectiveness
+        for gender in GENDERS
+        for age in AGES
+    ]
+    yield "get_ai_recommendation/all-combinations", lambda args: main.get_ai_recommendation(*args), combinations
+    with_drugs = [(c, g, a, drug, "") for (c, g, a, _, _), drug in
+                  zip(combinations, itertools.cycle(["aspirin", "ibuprofen", "warfarin", "Lisinopril"]))]
+    yield "get_ai_recommendation/existing-drug", lambda args: main.get_ai_recommendation(*args), with_drugs
+    with_text = [main.recommendation_args(p) for p in generate_patients(500, seed=seed, symptom_rate=1.0)]
+    yield "get_ai_recommendation/symptom-text", lambda args: main.get_ai_recommendation(*args), with_text
+
+    # Uncached searches over an index far larger than the shipped lists; short queries used to scan every entry
+    names = synthetic_names(50_000, seed=seed)
+    index = PrefixIndex((name, "medication") for name in names)
+    lowered = [name.lower() for name in rng.sample(names, 500)]
+    short_queries = [name[rng.randrange(len(name) - 1):][:rng.randint(1, 2)] for name in lowered]
+    long_queries = [name[rng.randrange(len(name) - 3):][:rng.randint(4, 6)] for name in lowered]
+    yield "autocomplete/short-query", lambda query: index._search(query, 10), short_queries
+    yield "autocomplete/substring-query", lambda query: index._search(query, 10), long_queries
+
+    client = main.app.test_client()
+    yield ("endpoint/analyze-symptoms",
+           lambda text: client.post("/api/analyze-symptoms", json={"symptoms": text}),
+           short_texts)
+    yield ("endpoint/ai-recommendation",
+           lambda payload: client.post("/api/ai-recommendation", json=payload),
+           list(generate_patients(500, seed=seed)))
+
+
+def run(args):
+    # Endpoint cases must not fill the audit log or hit the per-client rate limit
+    main.recommendation_store = None
+    main.rate_limiter = None
+    if not args.with_cache:
+        # Measure the scoring code itself, not the memoization layer
+        main.symptom_cache = None
+        main.recommendation_cache = None
+
+    pattern = args.filter or ""
+    results = {}
+    for name, fn, inputs in benchmark_cases(args.seed):
+        if pattern not in name:
+            continue
+        iterations = args.iterations if name.startswith(("analyze", "get_ai", "autocomplete")) else max(1, args.iterations // 10)
+        results[name] = stats = measure(fn, inputs, iterations)
+        print(f"{name:55s} p50 {stats['p50_us']:9.1f}us  p95 {stats['p95_us']:9.1f}us  "
+              f"p99 {stats['p99_us']:9.1f}us  {stats['throughput_per_s']:10.0f}/s  "
+              f"peak {stats['peak_alloc_bytes'] / 1024:8.1f}KiB", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "with_cache": args.with_cache,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["results"]
+
+    regressions = 0
+    for name in sorted(baseline.keys() & candidate.keys()):
+        changes = {
+            metric: (candidate[name][metric] - baseline[name][metric]) / baseline[name][metric]
+            if baseline[name][metric] else 0.0
+            for metric in args.metrics.split(",")
+        }
+        flags = [f"{metric} +{change:.0%}" for metric, change in changes.items() if change > args.threshold]
+        status = "REGRESSION " + ", ".join(flags) if flags else "ok"
+        regressions += bool(flags)
+        p50_change = (candidate[name]["p50_us"] - baseline[name]["p50_us"]) / baseline[name]["p50_us"]
+        print(f"{name:55s} p50 {baseline[name]['p50_us']:9.1f} -> {candidate[name]['p50_us']:9.1f}us "
+              f"({p50_change:+.0%})  {status}")
+    for name in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{name:55s} only in {'baseline' if name in baseline else 'candidate'}")
+
+    return 1 if regressions else 0
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark symptom analysis and recommendation scoring.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and save results as JSON")
+    run_parser.add_argument("--output", help="file to write JSON results to (default: stdout)")
+    run_parser.add_argument("--iterations", type=int, default=2000, help="timed calls per case (default: 2000)")
+    run_parser.add_argument("--seed", type=int, default=1234, help="seed for synthetic inputs (default: 1234)")
+    run_parser.add_argument("--filter", help="only run cases whose name contains this text")
+    run_parser.add_argument("--with-cache", action="store_true", help="leave the response caches enabled")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="relative slowdown counted as a regression (default: 0.10)")
+    compare_parser.add_argument("--metrics", default="p50_us,p95_us,peak_alloc_bytes",
+                                help="comma-separated metrics to check; p99 is noisy on short runs "
+                                     "(default: p50_us,p95_us,peak_alloc_bytes)")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
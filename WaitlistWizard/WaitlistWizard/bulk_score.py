@@ -0,0 +1,98 @@
+"""Score newline-delimited JSON patient records offline, without going through HTTP.
+
+Each input line is a JSON object with the /api/ai-recommendation payload fields
+(healthProblem, gender, age, existingDrug, symptomText). Each output line is the
+matching result in input order: {"success": true, "recommendation": {...}} or
+{"success": false, "error": "...", "line": n} for records that could not be scored.
+
+    python bulk_score.py patients.ndjson > scored.ndjson
+    zcat export.ndjson.gz | python bulk_score.py --workers 8 > scored.ndjson
+"""
+import argparse
+import json
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from main import get_ai_recommendations_batch
+
+
+def read_chunks(lines, chunk_size):
+    """Group (line_number, line) pairs into lists of at most chunk_size, skipping blank lines"""
+    numbered = ((n, line) for n, line in enumerate(lines, 1) if line.strip())
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def score_chunk(chunk):
+    """Score one chunk of raw NDJSON lines and return the serialized result lines"""
+    parsed = []
+    for _, line in chunk:
+        try:
+            parsed.append(json.loads(line))
+        except ValueError as e:
+            parsed.append(e)
+
+    scored = iter(get_ai_recommendations_batch([r for r in parsed if not isinstance(r, ValueError)]))
+
+    output = []
+    for (line_number, _), record in zip(chunk, parsed):
+        if isinstance(record, ValueError):
+            result = {"success": False, "error": f"Invalid JSON: {record}"}
+        else:
+            result = next(scored)
+        if not result["success"]:
+            result["line"] = line_number
+        output.append(json.dumps(result, separators=(",", ":")))
+    return output
+
+
+def ordered_map(executor, fn, iterable, window):
+    """Like executor.map, but keeps at most window tasks in flight so input is read lazily"""
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def score_stream(lines, workers=1, chunk_size=256):
+    """Yield output lines for an iterable of input lines, in input order, in constant memory"""
+    chunks = read_chunks(lines, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from score_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for output in ordered_map(executor, score_chunk, chunks, window=workers * 4):
+            yield from output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score NDJSON patient records and write NDJSON results to stdout.")
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON file to read (default: stdin)")
+    parser.add_argument("--workers", type=int, default=1, help="number of scoring processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="records sent to a worker at a time (default: 256)")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        for line in score_stream(source, workers=args.workers, chunk_size=args.chunk_size):
+            sys.stdout.write(line)
+            sys.stdout.write("\n")
+    except BrokenPipeError:
+        # Downstream consumer (e.g. head) closed early
+        sys.stderr.close()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Generate common_words.txt, the ordinary words typo correction must leave alone.
+
+    pip install wordfreq
+    python common_words.py [common_words.txt] [--top 30000]
+
+A word is listed when it is among the most frequent English words, has at
+least FUZZY_MIN_TOKEN_LENGTH letters, and the fuzzy index would otherwise
+correct it into a symptom word at distance 1 (tried -> tired). Two kinds of
+hit are left out: inflections, where one word is a prefix of the other
+(headaches -> headache), because correcting them is what the index is for;
+and the proper names and slang in DROPPED. Rerun it whenever the symptom
+vocabulary changes.
+"""
+import argparse
+import os
+import sys
+
+from symptom_matcher import FUZZY_MIN_TOKEN_LENGTH, SymptomMatcher
+
+COMMON_WORDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "common_words.txt")
+
+# Frequent in the corpus but names or slang, not words a patient's sentence depends on
+DROPPED = frozenset("""
+    pinterest carly ching nadal soros bitching turing earle hines hearst gough ronny hough wright wight changer
+""".split())
+
+HEADER = """\
+# Ordinary English words one edit away from a symptom word, which typo correction
+# must never turn into one (tried -> tired, right -> light, pension -> tension).
+# Used whether or not FUZZY_DICTIONARY_PATH names a full word list. Generated by
+# common_words.py from the {top} most frequent English words; rerun it when the
+# symptom vocabulary changes.
+"""
+
+
+def common_words(matcher, words):
+    """The words among `words` that matcher's fuzzy index would correct at distance 1"""
+    index = matcher.fuzzy_index
+    kept = set()
+    for word in words:
+        if not word.isalpha() or len(word) < FUZZY_MIN_TOKEN_LENGTH or word in index.vocabulary or word in DROPPED:
+            continue
+        hit = index.lookup(word, 1)
+        if hit and not (word.startswith(hit[0]) or hit[0].startswith(word)):
+            kept.add(word)
+    return sorted(kept)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Regenerate the list of common words typo correction must keep.")
+    parser.add_argument("output", nargs="?", default=COMMON_WORDS_PATH, help="file to write (default: common_words.txt)")
+    parser.add_argument("--top", type=int, default=30000, help="how many of the most frequent words to check (default: 30000)")
+    args = parser.parse_args(argv)
+
+    from wordfreq import top_n_list
+
+    import main as app
+    matcher = SymptomMatcher(app.condition_symptoms, app.symptom_synonyms, app.condition_context_keywords,
+                             max_fuzzy_distance=1)
+    words = common_words(matcher, top_n_list("en", args.top))
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(HEADER.format(top=args.top))
+        f.writelines(word + "\n" for word in words)
+    print(f"wrote {len(words)} words to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
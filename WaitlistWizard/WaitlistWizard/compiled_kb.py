@@ -0,0 +1,391 @@
+"""Compiled, memory-mapped knowledge-base files.
+
+A built KnowledgeBase (tables plus every precomputed index) is written into
+one versioned binary file:
+
+    header      magic, format version, fingerprint, section directory
+    strings     interned UTF-8 strings addressed by id
+    records     tagged values; dicts are (key, value) entry arrays plus an
+                open-addressing slot table over the encoded keys, so a lookup
+                probes the mapped bytes instead of building a Python dict
+    scores      the float64 score matrix, 8-byte aligned
+
+Opening a file maps it read-only and wraps the records in lazy Mapping views,
+so startup cost does not grow with the data and every worker forked from the
+same file shares its pages. Rebuild with
+
+    python compiled_kb.py knowledge_base.kb [--tables formulary.json]
+
+which writes a temporary file and renames it over the old one; servers started
+with KNOWLEDGE_BASE_PATH pick the new version up without a restart. The same
+bytes can be read from a shared memory block instead of a file (see
+scoring_service.py).
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+
+import numpy as np
+
+MAGIC = b"WWKB"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<4sHH16sI")
+_SECTION = struct.Struct("<16sQQ")
+_U32 = struct.Struct("<I")
+_ENTRY = struct.Struct("<III")
+
+# Record tags
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _LIST, _DICT = range(8)
+
+_KEY_SEPARATOR = b"\x1e"
+
+# Decoded records and dict lookups kept per process; the hot working set, not the whole file
+DECODE_CACHE_SIZE = 65536
+
+
+def _key_bytes(key):
+    """Byte encoding of a dict key; lookups encode the probe the same way"""
+    if isinstance(key, str):
+        return b"s" + key.encode("utf-8")
+    if isinstance(key, tuple):
+        return b"t" + _KEY_SEPARATOR.join(_key_bytes(part) for part in key)
+    if key is None:
+        return b"n"
+    if isinstance(key, bool):
+        return b"b1" if key else b"b0"
+    if isinstance(key, int):
+        return b"i" + str(key).encode()
+    if isinstance(key, float):
+        return b"f" + repr(key).encode()
+    # Same failure a dict lookup gives for unhashable keys
+    hash(key)
+    return None
+
+
+def _align(buffer, boundary):
+    buffer.extend(b"\0" * (-len(buffer) % boundary))
+
+
+class _Writer:
+    """Accumulates the string and record sections, interning repeated values"""
+
+    def __init__(self):
+        self.strings = []
+        self.string_ids = {}
+        self.records = bytearray()
+        self.record_offsets = {}
+
+    def string(self, value):
+        data = value if isinstance(value, bytes) else value.encode("utf-8")
+        string_id = self.string_ids.get(data)
+        if string_id is None:
+            string_id = self.string_ids[data] = len(self.strings)
+            self.strings.append(data)
+        return string_id
+
+    def _record(self, tag, payload=b""):
+        record = bytes((tag, 0, 0, 0)) + payload
+        offset = self.record_offsets.get(record)
+        if offset is None:
+            offset = self.record_offsets[record] = len(self.records)
+            self.records.extend(record)
+            _align(self.records, 8)
+        return offset
+
+    def value(self, value):
+        """Write a value and its children; returns the record offset"""
+        if value is None:
+            return self._record(_NONE)
+        if value is True:
+            return self._record(_TRUE)
+        if value is False:
+            return self._record(_FALSE)
+        if isinstance(value, (int, np.integer)):
+            return self._record(_INT, struct.pack("<4xq", int(value)))
+        if isinstance(value, (float, np.floating)):
+            return self._record(_FLOAT, struct.pack("<4xd", float(value)))
+        if isinstance(value, str):
+            return self._record(_STR, _U32.pack(self.string(value)))
+        if isinstance(value, Mapping):
+            # Sorted so identical dicts compile to identical (deduplicated) records
+            entries = sorted((_key_bytes(key), self.value(key), self.value(item)) for key, item in value.items())
+            slot_count = 1
+            while slot_count < 2 * len(entries):
+                slot_count *= 2
+            # Slot -> entry number + 1 (0 is empty), linear probing from crc32(key)
+            slots = [0] * slot_count
+            for number, (key, _, _) in enumerate(entries):
+                slot = zlib.crc32(key) & (slot_count - 1)
+                while slots[slot]:
+                    slot = (slot + 1) & (slot_count - 1)
+                slots[slot] = number + 1
+            payload = struct.pack("<II", len(entries), slot_count) + b"".join(
+                _ENTRY.pack(self.string(key), key_offset, value_offset)
+                for key, key_offset, value_offset in entries) + struct.pack(f"<{slot_count}I", *slots)
+            return self._record(_DICT, payload)
+        if isinstance(value, (list, tuple)):
+            children = [self.value(item) for item in value]
+            return self._record(_LIST, _U32.pack(len(children)) + b"".join(_U32.pack(c) for c in children))
+        raise TypeError(f"Cannot compile value of type {type(value).__name__}")
+
+    def strings_section(self):
+        offsets = [0]
+        for data in self.strings:
+            offsets.append(offsets[-1] + len(data))
+        return (_U32.pack(len(self.strings)) + b"".join(_U32.pack(o) for o in offsets)
+                + b"".join(self.strings))
+
+
+def encode_compiled(kb, reference=None):
+    """Compiled bytes of a built KnowledgeBase plus optional reference tables"""
+    writer = _Writer()
+    root = writer.value({
+        "tables": kb.tables,
+        "ranked_medications": kb.ranked_medications,
+        "adjustment_index": kb.adjustment_index,
+        "interaction_nodes": kb.interactions.nodes_of,
+        "interaction_adjacency": kb.interactions.adjacency,
+        "condition_ids": kb.condition_ids,
+        "profile_ids": kb.profile_ids,
+        "profile_adjustments": kb.profile_adjustments,
+        "score_shape": kb.score_matrix.shape,
+        "reference": reference or {},
+    })
+
+    sections = [
+        (b"strings", writer.strings_section()),
+        (b"records", bytes(writer.records)),
+        (b"root", _U32.pack(root)),
+        (b"scores", np.ascontiguousarray(kb.score_matrix, dtype="<f8").tobytes()),
+    ]
+    out = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, kb.fingerprint.encode("ascii").ljust(16, b"\0"),
+                                 len(sections)))
+    directory_at = len(out)
+    out.extend(b"\0" * (_SECTION.size * len(sections)))
+    directory = []
+    for name, data in sections:
+        _align(out, 8)
+        directory.append(_SECTION.pack(name, len(out), len(data)))
+        out.extend(data)
+    out[directory_at:directory_at + len(directory) * _SECTION.size] = b"".join(directory)
+    return out
+
+
+def write_compiled(kb, path, reference=None):
+    """Write a built KnowledgeBase (plus optional reference tables) to path atomically"""
+    out = encode_compiled(kb, reference)
+
+    # Readers holding the old file keep their mapping; new opens see the complete new file
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(out)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CompiledFile:
+    """Read-only mapping of a compiled file with record decoding helpers"""
+
+    def __init__(self, path, buffer=None):
+        # buffer: already mapped compiled bytes (e.g. a shared memory block); path then only names it
+        if buffer is not None:
+            self.identity = None
+            self.map = buffer
+        else:
+            with open(path, "rb") as f:
+                self.identity = os.fstat(f.fileno())
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _, fingerprint, count = _HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a compiled knowledge base")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}; this server reads version {FORMAT_VERSION}")
+            self.fingerprint = fingerprint.rstrip(b"\0").decode("ascii")
+            self.sections = {}
+            for i in range(count):
+                name, offset, length = _SECTION.unpack_from(self.map, _HEADER.size + i * _SECTION.size)
+                if offset + length > len(self.map):
+                    raise ValueError(f"{path} is truncated")
+                self.sections[name.rstrip(b"\0").decode()] = (offset, length)
+        except struct.error:
+            raise ValueError(f"{path} is truncated") from None
+        self._strings_at = self.sections["strings"][0]
+        self._string_count = _U32.unpack_from(self.map, self._strings_at)[0]
+        self._string_data = self._strings_at + 4 + 4 * (self._string_count + 1)
+        self._records_at = self.sections["records"][0]
+        # Records are immutable, so decoded values can be reused until the file is swapped
+        self.value = lru_cache(maxsize=DECODE_CACHE_SIZE)(self._value)
+        self.lookup = lru_cache(maxsize=DECODE_CACHE_SIZE)(self._lookup)
+        self.root = self.value(_U32.unpack_from(self.map, self.sections["root"][0])[0])
+
+    def string_bytes(self, string_id):
+        start, end = struct.unpack_from("<II", self.map, self._strings_at + 4 + 4 * string_id)
+        # bytes() copies only for buffers whose slices are views
+        return bytes(self.map[self._string_data + start:self._string_data + end])
+
+    def _value(self, offset):
+        at = self._records_at + offset
+        tag = self.map[at]
+        if tag == _DICT:
+            return RecordMap(self, at)
+        if tag == _STR:
+            return self.string_bytes(_U32.unpack_from(self.map, at + 4)[0]).decode("utf-8")
+        if tag == _FLOAT:
+            return struct.unpack_from("<d", self.map, at + 8)[0]
+        if tag == _INT:
+            return struct.unpack_from("<q", self.map, at + 8)[0]
+        if tag == _LIST:
+            # Lists are short leaves (medication tuples, adjustments); decode them eagerly
+            count = _U32.unpack_from(self.map, at + 4)[0]
+            return tuple(self.value(child) for child in struct.unpack_from(f"<{count}I", self.map, at + 8))
+        return None if tag == _NONE else tag == _TRUE
+
+    def _lookup(self, at, key):
+        """Value offset for key in the dict record at `at`, or None"""
+        probe = _key_bytes(key)
+        if probe is None:
+            return None
+        count, slot_count = struct.unpack_from("<II", self.map, at + 4)
+        entries = at + 12
+        slots = entries + count * _ENTRY.size
+        slot = zlib.crc32(probe) & (slot_count - 1)
+        while True:
+            number = _U32.unpack_from(self.map, slots + 4 * slot)[0]
+            if not number:
+                return None
+            key_id, _, value_offset = _ENTRY.unpack_from(self.map, entries + (number - 1) * _ENTRY.size)
+            if self.string_bytes(key_id) == probe:
+                return value_offset
+            slot = (slot + 1) & (slot_count - 1)
+
+    def scores(self):
+        """Zero-copy, read-only view of the score matrix"""
+        offset, length = self.sections["scores"]
+        shape = tuple(self.root["score_shape"])
+        return np.frombuffer(self.map, dtype="<f8", count=length // 8, offset=offset).reshape(shape)
+
+
+class RecordMap(Mapping):
+    """Lazy, read-only dict view over a compiled dict record"""
+
+    def __init__(self, compiled, at):
+        self._file = compiled
+        self._at = at
+        self._count = _U32.unpack_from(compiled.map, at + 4)[0]
+        self._entries = at + 12
+        self._items = None
+
+    def _entry(self, i):
+        return _ENTRY.unpack_from(self._file.map, self._entries + i * _ENTRY.size)
+
+    def __getitem__(self, key):
+        value_offset = self._file.lookup(self._at, key)
+        if value_offset is None:
+            raise KeyError(key)
+        return self._file.value(value_offset)
+
+    def get(self, key, default=None):
+        value_offset = self._file.lookup(self._at, key)
+        return default if value_offset is None else self._file.value(value_offset)
+
+    def __contains__(self, key):
+        return self._file.lookup(self._at, key) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._file.value(self._entry(i)[1])
+
+    def items(self):
+        if self._items is None:
+            self._items = tuple((self._file.value(key), self._file.value(value))
+                                for _, key, value in (self._entry(i) for i in range(self._count)))
+        return self._items
+
+    def values(self):
+        return [self._file.value(self._entry(i)[2]) for i in range(self._count)]
+
+    def __repr__(self):
+        return f"RecordMap({len(self)} entries)"
+
+
+def load_fields(path, buffer=None):
+    """KnowledgeBase constructor fields (except interactions) read from a compiled file or buffer"""
+    compiled = CompiledFile(path, buffer)
+    root = compiled.root
+    return compiled, {
+        "tables": root["tables"],
+        "fingerprint": compiled.fingerprint,
+        "ranked_medications": root["ranked_medications"],
+        "adjustment_index": root["adjustment_index"],
+        "condition_ids": root["condition_ids"],
+        "profile_ids": root["profile_ids"],
+        "score_matrix": compiled.scores(),
+        "profile_adjustments": root["profile_adjustments"],
+        "reference": root["reference"],
+    }
+
+
+_JS_OBJECT = r"const\s+{}\s*=\s*(\{{.*?\n\}});"
+_JS_COMMENT = re.compile(r"^\s*//.*$", re.M)
+_JS_BARE_KEY = re.compile(r"([{,]\s*)([A-Za-z_]\w*)\s*:")
+_JS_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+def js_object(source, name):
+    """Parse a `const name = {...};` data literal (quoted values, bare or quoted keys) as JSON"""
+    match = re.search(_JS_OBJECT.format(re.escape(name)), source, re.S)
+    if not match:
+        raise ValueError(f"{name} not found")
+    body = _JS_COMMENT.sub("", match.group(1))
+    body = _JS_TRAILING_COMMA.sub(r"\1", _JS_BARE_KEY.sub(r'\1"\2":', body))
+    return json.loads(body)
+
+
+def reference_tables(main_module):
+    """Symptom vocabularies from main.py and the drug reference tables from drugDatabase.js"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "js", "drugDatabase.js")
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    return {
+        "condition_symptoms": main_module.condition_symptoms,
+        "symptom_synonyms": main_module.symptom_synonyms,
+        "condition_context_keywords": main_module.condition_context_keywords,
+        "health_conditions": js_object(source, "healthConditionsDB"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile the clinical tables into a memory-mapped knowledge base file.")
+    parser.add_argument("output", help="file to write, replaced atomically (e.g. knowledge_base.kb)")
+    parser.add_argument("--tables", help="JSON rule tables (knowledge_base.load_tables format) overriding main.py's")
+    args = parser.parse_args(argv)
+
+    # The literals in main.py are the source; never start from a previously compiled file
+    os.environ.pop("KNOWLEDGE_BASE_PATH", None)
+    import main as main_module
+    from knowledge_base import KnowledgeBase, load_tables
+
+    tables = dict(main_module.knowledge_base_tables)
+    if args.tables:
+        tables.update(load_tables(args.tables))
+    kb = KnowledgeBase.build(tables)
+    write_compiled(kb, args.output, reference_tables(main_module))
+    print(f"Wrote {args.output}: fingerprint {kb.fingerprint}, {os.path.getsize(args.output)} bytes", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
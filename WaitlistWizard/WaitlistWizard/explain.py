@@ -0,0 +1,309 @@
+"""Explain traces: every contribution behind one request's symptom analysis and recommendation.
+
+While a trace is open for a request, analyze_symptoms and get_ai_recommendation
+bypass their caches and append an event for each contribution they apply:
+
+    (stage, rule, subject, detail, value)
+
+stage is "symptoms" or "recommendation"; subject is the condition or
+medication the contribution went to, or None for events that only say what
+happened (a typo correction, a condition dropped below the threshold).
+Symptom values are points of the condition's match percentage, so a
+condition's events add up to its score; recommendation values are
+confidence, adding up to a medication's confidence_score.
+
+    symptoms        correction, phrase, synonym, word, context, co_occurrence,
+                    breadth, cap, threshold, rank
+    recommendation  condition, dangerous_combination, drug_interaction,
+                    effectiveness, adjustment, interaction, clamp
+
+With no trace open the scoring code pays one check of the module-level
+`active` count. The API returns a trace with ?explain=1 and, when
+EXPLAIN_LOG_PATH is set, writes a sample of traces to a rotating JSON-lines
+log, one {"t", "endpoint", "events", "truncated"} record per request.
+Summarize such logs offline with
+
+    python explain.py summarize explain.log explain.log.1 ... [--detail] [--json]
+
+which reports, per rule, how often it fired, its total contribution and how
+often it was the largest contribution to a condition's or medication's score.
+
+Settings:
+    EXPLAIN_LOG_PATH        log file; "{pid}" is replaced by the worker's pid, sampling is off without it
+    EXPLAIN_SAMPLE_RATE     fraction of scoring requests traced into the log, default 0.01
+    EXPLAIN_LOG_MAX_BYTES   size at which the log is rotated, default 64 MiB
+    EXPLAIN_LOG_BACKUPS     rotated files kept as <path>.1 ... <path>.N, default 5
+    EXPLAIN_LOG_QUEUE_SIZE  traces buffered before new ones are dropped, default 1000
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("stage", "rule", "subject", "detail", "value")
+
+# Bound on one request's buffer; a trace past it is marked truncated
+MAX_EVENTS = 4096
+
+# Traces open in this process; scoring code checks this before looking for its own
+active = 0
+
+_current = contextvars.ContextVar("explain_trace", default=None)
+_active_lock = threading.Lock()
+
+
+class Trace:
+    """Event buffer of one request"""
+
+    __slots__ = ("events", "truncated")
+
+    def __init__(self):
+        self.events = []
+        self.truncated = False
+
+    def add(self, stage, rule, subject, detail, value=None):
+        if len(self.events) < MAX_EVENTS:
+            self.events.append((stage, rule, subject, detail, value))
+        else:
+            self.truncated = True
+
+    def as_json(self):
+        """The events as objects, for API responses"""
+        return {"events": [dict(zip(FIELDS, event)) for event in self.events], "truncated": self.truncated}
+
+
+def current():
+    """The trace open in this context, or None"""
+    return _current.get()
+
+
+@contextmanager
+def recording(enabled=True):
+    """Open a trace for the scoring calls made inside the block; yields it, or None when not enabled"""
+    global active
+    if not enabled:
+        yield None
+        return
+    trace = Trace()
+    token = _current.set(trace)
+    with _active_lock:
+        active += 1
+    try:
+        yield trace
+    finally:
+        with _active_lock:
+            active -= 1
+        _current.reset(token)
+
+
+class ExplainLog:
+    """Sampler plus a background writer appending traces to a size-rotated log file"""
+
+    def __init__(self, path, sample_rate=0.01, max_bytes=64 << 20, backups=5, queue_size=1000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.backups = max(1, backups)
+        self.queue_size = queue_size
+        self.logged = 0
+        self.dropped = 0
+        self._file = None
+        self._pid = None
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Threads do not survive fork, so each worker starts its own writer
+                self._file = None
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._writer = threading.Thread(target=self._run, name="explain-writer", daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+
+    def sample(self):
+        """Whether to trace this request into the log"""
+        return random.random() < self.sample_rate
+
+    def record(self, endpoint, trace):
+        """Queue one finished trace; never blocks the caller"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((time.time(), endpoint, trace.events, trace.truncated))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < 1000:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            records = [record for record in records if record is not None]
+            try:
+                self._write(records)
+            except Exception:
+                self.dropped += len(records)
+                logger.exception("Failed to write %d explain traces", len(records))
+            if stop:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        path = self.path.replace("{pid}", str(os.getpid()))
+        if self._file is None:
+            self._file = open(path, "a", encoding="utf-8")
+        self._file.write("".join(
+            json.dumps({"t": round(started, 3), "endpoint": endpoint, "events": events, "truncated": truncated},
+                       separators=(",", ":")) + "\n"
+            for started, endpoint, events, truncated in records))
+        self._file.flush()
+        self.logged += len(records)
+        if self._file.tell() >= self.max_bytes:
+            self._rotate(path)
+
+    def _rotate(self, path):
+        """Shift path.1 ... path.N-1 up by one, drop path.N and start path afresh"""
+        self._file.close()
+        self._file = None
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        os.replace(path, f"{path}.1")
+
+    def close(self, timeout=10):
+        """Write everything queued so far and stop the writer"""
+        if self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def metrics(self):
+        """Logged and dropped trace counts, read at scrape time"""
+        yield "waitlistwizard_explain_logged_total", "counter", (), self.logged
+        yield "waitlistwizard_explain_dropped_total", "counter", (), self.dropped
+
+
+def explain_log_from_env():
+    """Build the explain log from environment settings, or None when EXPLAIN_LOG_PATH is unset"""
+    path = os.environ.get("EXPLAIN_LOG_PATH")
+    if not path:
+        return None
+    explain_log = ExplainLog(
+        path,
+        sample_rate=float(os.environ.get("EXPLAIN_SAMPLE_RATE", 0.01)),
+        max_bytes=int(os.environ.get("EXPLAIN_LOG_MAX_BYTES", 64 << 20)),
+        backups=int(os.environ.get("EXPLAIN_LOG_BACKUPS", 5)),
+        queue_size=int(os.environ.get("EXPLAIN_LOG_QUEUE_SIZE", 1000)),
+    )
+    atexit.register(explain_log.close)
+    return explain_log
+
+
+def load_traces(paths):
+    """Every logged trace in the given files"""
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def summarize(traces, detail=False):
+    """Per-rule statistics over logged traces.
+
+    Returns {"requests", "rules": [...]} with one entry per (stage, rule), or
+    per (stage, rule, detail) with detail=True, most dominant first. A rule
+    dominates a subject in a request when its contributions to that subject
+    add up to the largest absolute amount of any rule's.
+    """
+    requests = 0
+    stats = defaultdict(lambda: {"events": 0, "requests": 0, "total": 0.0, "dominant": 0})
+    stage_totals = defaultdict(float)
+    subjects = defaultdict(int)
+    for trace in traces:
+        requests += 1
+        seen = set()
+        # (stage, subject) -> rule key -> summed contribution
+        contributions = defaultdict(lambda: defaultdict(float))
+        for stage, rule, subject, event_detail, value in trace["events"]:
+            key = (stage, rule, event_detail) if detail else (stage, rule)
+            entry = stats[key]
+            entry["events"] += 1
+            if key not in seen:
+                seen.add(key)
+                entry["requests"] += 1
+            if subject is not None and value is not None:
+                entry["total"] += value
+                stage_totals[stage] += abs(value)
+                contributions[(stage, subject)][key] += value
+        for (stage, _), by_key in contributions.items():
+            subjects[stage] += 1
+            stats[max(by_key, key=lambda key: abs(by_key[key]))]["dominant"] += 1
+
+    rules = []
+    for key, entry in stats.items():
+        stage = key[0]
+        rules.append(dict(
+            stage=stage, rule=key[1], **({"detail": key[2]} if detail else {}), **entry,
+            mean=entry["total"] / entry["events"],
+            share=abs(entry["total"]) / stage_totals[stage] if stage_totals[stage] else 0.0,
+            dominant_share=entry["dominant"] / subjects[stage] if subjects[stage] else 0.0,
+        ))
+    rules.sort(key=lambda rule: (rule["stage"], -rule["dominant"], -abs(rule["total"])))
+    return {"requests": requests, "rules": rules}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate explain logs into per-rule scoring statistics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summarize_parser = commands.add_parser("summarize", help="which rules dominate scoring across logged traces")
+    summarize_parser.add_argument("logs", nargs="+", help="explain log files, rotated ones included")
+    summarize_parser.add_argument("--detail", action="store_true",
+                                  help="break rules down by detail (symptom, keyword, factor, ...)")
+    summarize_parser.add_argument("--top", type=int, default=30, help="rows printed per stage (default: 30)")
+    summarize_parser.add_argument("--json", action="store_true", help="print the full summary as JSON")
+    args = parser.parse_args(argv)
+
+    summary = summarize(load_traces(args.logs), detail=args.detail)
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return 0
+    print(f"{summary['requests']} traced requests")
+    printed = defaultdict(int)
+    for rule in summary["rules"]:
+        if printed[rule["stage"]] >= args.top:
+            continue
+        if not printed[rule["stage"]]:
+            print(f"\n{rule['stage']:14s} {'rule':40s} {'events':>8s} {'requests':>9s} {'total':>12s} "
+                  f"{'mean':>9s} {'share':>7s} {'dominant':>9s}")
+        printed[rule["stage"]] += 1
+        name = f"{rule['rule']}: {rule['detail']}" if args.detail and rule["detail"] is not None else rule["rule"]
+        print(f"{'':14s} {name[:40]:40s} {rule['events']:8d} {rule['requests']:9d} {rule['total']:12.2f} "
+              f"{rule['mean']:9.3f} {rule['share']:7.1%} {rule['dominant_share']:9.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Production launcher settings: [SERVING_MODE=asgi] gunicorn -c gunicorn.conf.py
+
+Pass no app argument: the app is chosen by SERVING_MODE (wsgi_app below), and
+a positional one would override it, so a conflicting one is refused at start.
+
+SERVING_MODE=wsgi (default) runs the Flask app on threaded sync workers;
+SERVING_MODE=asgi runs asgi:app on uvicorn workers, where connections are
+handled by an event loop and scoring by a bounded thread pool.
+
+The app is preloaded in the master so the clinical tables, compiled symptom
+matcher and knowledge base (plus the recommendation table, with
+RECOMMENDATION_MATRIX=1) are built once and shared copy-on-write by every
+forked worker. With KNOWLEDGE_BASE_PATH pointing at a compiled file (see
+compiled_kb.py) the knowledge base is memory-mapped instead: workers share
+its pages through the page cache and each picks up a renamed-in replacement.
+
+The waitlist, the reminder schedule and live symptom sessions live in the
+serving process, so both modes run a single worker: threads (wsgi) or the
+event loop (asgi) handle concurrency, and SCORING_SERVICE_WORKERS (see
+scoring_service.py) spreads scoring across the cores. WEB_CONCURRENCY above 1
+is refused at startup unless ALLOW_PER_WORKER_STATE=1 accepts that each
+worker then keeps a waitlist, schedule and sessions of its own. Workers are
+not recycled, and one that is replaced after a crash restores the waitlist and
+reminders from their snapshots rather than inheriting the master's copy.
+"""
+import gc
+import multiprocessing
+import os
+
+SERVING_MODE = os.environ.get("SERVING_MODE", "wsgi")
+CORES = multiprocessing.cpu_count()
+
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+if workers > 1 and os.environ.get("ALLOW_PER_WORKER_STATE") != "1":
+    raise RuntimeError(
+        f"WEB_CONCURRENCY={workers}: the waitlist, reminders and live symptom sessions are kept per worker "
+        "process and would split between workers. Run one worker (use SCORING_SERVICE_WORKERS to score on "
+        "more cores), or set ALLOW_PER_WORKER_STATE=1 if per-worker copies are acceptable."
+    )
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+preload_app = True
+
+if SERVING_MODE == "asgi":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    # Idle keep-alive connections cost almost nothing on an event loop
+    keepalive = 75
+else:
+    wsgi_app = "main:app"
+    worker_class = "gthread"
+    threads = int(os.environ.get("GUNICORN_THREADS", max(4, CORES * 2)))
+    keepalive = 5
+
+timeout = 30
+graceful_timeout = 30
+# No periodic recycling: a worker holds the waitlist and reminders, which a fresh
+# fork of the master would replace with the master's startup copy
+max_requests = 0
+
+
+def on_starting(server):
+    # A positional app on the command line wins over wsgi_app; refuse one that
+    # does not match SERVING_MODE rather than serve e.g. the WSGI app to uvicorn
+    app_uri = getattr(server.app, "app_uri", None)
+    if app_uri and app_uri != wsgi_app:
+        raise RuntimeError(
+            f"SERVING_MODE={SERVING_MODE} serves {wsgi_app}, not {app_uri}; "
+            "launch with gunicorn -c gunicorn.conf.py and no app argument"
+        )
+
+
+def post_fork(server, worker):
+    # The preloaded master's waitlist and reminders date from startup; a worker
+    # replacing a crashed one starts from what its predecessor last saved
+    import main
+    from reminders import reminders_from_env
+    from waitlist import waitlist_from_env
+
+    if os.environ.get("WAITLIST_SNAPSHOT_PATH"):
+        main.waitlist = waitlist_from_env()
+    if os.environ.get("REMINDER_SNAPSHOT_PATH"):
+        main.reminders = reminders_from_env()
+
+
+def when_ready(server):
+    # Move everything built at preload into the permanent generation so the
+    # garbage collector never touches (and un-shares) those pages after fork
+    gc.freeze()
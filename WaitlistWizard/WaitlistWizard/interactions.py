@@ -0,0 +1,119 @@
+"""Drug-drug interaction checking over a precomputed adjacency index.
+
+Rules name either a drug or a drug class on each side. At build time every
+rule becomes an edge between two nodes, and every drug is mapped to its
+nodes (itself plus its classes), so checking a pair costs a few dict lookups
+however many rules exist, and checking a list of n drugs walks only the
+edges of the drugs in it instead of comparing all n² name pairs.
+"""
+import re
+from dataclasses import dataclass
+from types import MappingProxyType
+
+SEVERITY_ORDER = {"high": 0, "medium": 1, "low": 2}
+
+_LIST_SEPARATORS = re.compile(r"[,;\n]")
+
+
+def normalize_drug(name):
+    return " ".join(name.split()).lower()
+
+
+def parse_medications(value):
+    """Medication names from a list or a comma/semicolon separated string, duplicates removed"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        names = _LIST_SEPARATORS.split(value)
+    elif isinstance(value, (list, tuple)):
+        names = value
+    else:
+        raise TypeError("Medications must be a list or a comma-separated string")
+    medications = []
+    seen = set()
+    for name in names:
+        if not isinstance(name, str):
+            raise TypeError("Medication names must be strings")
+        name = " ".join(name.split())
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            medications.append(name)
+    return medications
+
+
+@dataclass(frozen=True)
+class InteractionIndex:
+    """Frozen drug -> nodes and node -> interacting node lookups"""
+    # drug -> (drug, *classes), all normalized
+    nodes_of: MappingProxyType
+    # node -> {other node: (severity, description, rule)}
+    adjacency: MappingProxyType
+
+    @classmethod
+    def build(cls, drug_interactions, drug_classes):
+        """Index rules keyed by (drug or class, drug or class) pairs"""
+        classes_of = {}
+        for class_name, members in drug_classes.items():
+            for member in members:
+                classes_of.setdefault(normalize_drug(member), []).append(normalize_drug(class_name))
+        nodes_of = {drug: (drug, *classes) for drug, classes in classes_of.items()}
+
+        adjacency = {}
+        for (first, second), details in drug_interactions.items():
+            edge = (details["severity"], details["description"], f"{first} + {second}")
+            a, b = normalize_drug(first), normalize_drug(second)
+            adjacency.setdefault(a, {})[b] = edge
+            adjacency.setdefault(b, {})[a] = edge
+
+        return cls(
+            nodes_of=MappingProxyType(nodes_of),
+            adjacency=MappingProxyType({node: MappingProxyType(edges) for node, edges in adjacency.items()}),
+        )
+
+    def nodes(self, drug):
+        """The drug itself plus every class it belongs to"""
+        drug = normalize_drug(drug)
+        return self.nodes_of.get(drug) or (drug,)
+
+    def check_pair(self, first, second):
+        """Most severe rule between two drugs as (severity, description, rule), or None"""
+        found = None
+        for a in self.nodes(first):
+            edges = self.adjacency.get(a)
+            if not edges:
+                continue
+            for b in self.nodes(second):
+                edge = edges.get(b)
+                if edge and (found is None or SEVERITY_ORDER[edge[0]] < SEVERITY_ORDER[found[0]]):
+                    found = edge
+        return found
+
+    def check(self, medications, candidates=()):
+        """Interactions among medications, and between each candidate and the medications.
+
+        Candidates are alternatives under consideration, so they are not
+        checked against each other. Returns one entry per interacting pair,
+        most severe first, then in input order.
+        """
+        drugs = list(medications) + list(candidates)
+        checked = len(drugs) - len(candidates)
+        # node -> indexes of the medications seen so far that have it
+        seen = {}
+        found = {}
+        for j, drug in enumerate(drugs):
+            nodes = self.nodes(drug)
+            for node in nodes:
+                for other, edge in self.adjacency.get(node, {}).items():
+                    for i in seen.get(other, ()):
+                        if i != j and (found.get((i, j)) is None
+                                       or SEVERITY_ORDER[edge[0]] < SEVERITY_ORDER[found[(i, j)][0]]):
+                            found[(i, j)] = edge
+            if j < checked:
+                for node in nodes:
+                    seen.setdefault(node, []).append(j)
+
+        ordered = sorted(found.items(), key=lambda item: (SEVERITY_ORDER[item[1][0]], item[0]))
+        return [
+            {"drugs": [drugs[i], drugs[j]], "severity": severity, "description": description, "rule": rule}
+            for (i, j), (severity, description, rule) in ordered
+        ]
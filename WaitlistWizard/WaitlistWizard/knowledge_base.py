@@ -0,0 +1,324 @@
+"""Immutable, pre-indexed clinical rule tables for the recommendation engine"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+import numpy as np
+
+import compiled_kb
+from interactions import InteractionIndex
+
+logger = logging.getLogger(__name__)
+
+AGE_CATEGORIES = ("pediatric", "adult", "elderly")
+
+# Names of the raw tables a knowledge base is built from
+TABLE_NAMES = (
+    "medication_effectiveness",
+    "dangerous_combinations",
+    "drug_interactions",
+    "drug_classes",
+    "age_adjustment",
+    "gender_adjustment",
+    "condition_factor",
+    "lifestyle_recommendations",
+    "monitoring_recommendations",
+    "default_lifestyle_recommendations",
+    "default_monitoring_recommendations",
+)
+
+
+def age_category_for(age):
+    """Bucket an age into the categories used by the adjustment tables"""
+    age = int(age)
+    if age < 18:
+        return "pediatric"
+    if age >= 65:
+        return "elderly"
+    return "adult"
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _matching_rules(medication, rules):
+    """Adjustments of the rules whose drug class occurs in the medication name, in table order"""
+    medication_lower = medication.lower()
+    return [adjustment for drug_class, adjustment in rules.items()
+            if drug_class.lower() in medication_lower]
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    """Frozen rule tables plus the lookups precomputed from them"""
+    tables: MappingProxyType
+    # Content hash of the tables; identical across processes built from the same data
+    fingerprint: str
+    # condition -> ((medication, base_score), ...) sorted by effectiveness
+    ranked_medications: MappingProxyType
+    # (medication, age_category, gender, condition) -> (score, adjustments)
+    adjustment_index: MappingProxyType
+    # Drug-drug and class-level interaction rules
+    interactions: InteractionIndex
+    # Dense view of adjustment_index for batch scoring:
+    # score_matrix[condition_id, profile_id, rank] with NaN past the last medication,
+    # and the matching per-rank adjustments keyed by (condition_id, profile_id)
+    condition_ids: MappingProxyType
+    profile_ids: MappingProxyType
+    score_matrix: np.ndarray
+    profile_adjustments: MappingProxyType
+    # Reference data carried by compiled files (symptom vocabularies, drug reference tables)
+    reference: Mapping = field(default_factory=lambda: MappingProxyType({}))
+
+    @classmethod
+    def build(cls, tables):
+        """Index raw rule tables; the expensive substring matching happens only here"""
+        missing = [name for name in TABLE_NAMES if name not in tables]
+        if missing:
+            raise ValueError(f"Knowledge base tables missing: {', '.join(missing)}")
+        tables = {name: tables[name] for name in TABLE_NAMES}
+
+        ranked = {}
+        index = {}
+        genders = list(tables["gender_adjustment"]) + [None]
+        for condition, medications in tables["medication_effectiveness"].items():
+            ranked[condition] = tuple(sorted(medications.items(), key=lambda x: x[1], reverse=True))
+            for medication, base_score in ranked[condition]:
+                condition_rules = [
+                    (f"Condition specific ({condition})", adjustment)
+                    for adjustment in _matching_rules(medication, tables["condition_factor"].get(condition, {}))
+                ]
+                for age_category in AGE_CATEGORIES:
+                    age_rules = [
+                        (f"Age category ({age_category})", adjustment)
+                        for adjustment in _matching_rules(medication, tables["age_adjustment"].get(age_category, {}))
+                    ]
+                    for gender in genders:
+                        gender_rules = [] if gender is None else [
+                            (f"Gender ({gender})", adjustment)
+                            for adjustment in _matching_rules(medication, tables["gender_adjustment"][gender])
+                        ]
+                        adjustments = tuple(age_rules + gender_rules + condition_rules)
+                        # Sum in application order so the result matches incremental scoring
+                        score = base_score
+                        for _, adjustment in adjustments:
+                            score += adjustment
+                        index[(medication, age_category, gender, condition)] = (score, adjustments)
+
+        condition_ids = {condition: i for i, condition in enumerate(ranked)}
+        profile_ids = {(age_category, gender): i for i, (age_category, gender)
+                       in enumerate((a, g) for a in AGE_CATEGORIES for g in genders)}
+        width = max((len(meds) for meds in ranked.values()), default=0)
+        score_matrix = np.full((len(condition_ids), len(profile_ids), width), np.nan)
+        profile_adjustments = {}
+        for condition, c in condition_ids.items():
+            for (age_category, gender), p in profile_ids.items():
+                entries = [index[(medication, age_category, gender, condition)] for medication, _ in ranked[condition]]
+                score_matrix[c, p, :len(entries)] = [score for score, _ in entries]
+                profile_adjustments[(c, p)] = tuple(adjustments for _, adjustments in entries)
+        score_matrix.flags.writeable = False
+
+        return cls(
+            tables=_freeze(tables),
+            fingerprint=hashlib.sha1(repr(sorted(tables.items())).encode()).hexdigest()[:16],
+            ranked_medications=MappingProxyType(ranked),
+            adjustment_index=MappingProxyType(index),
+            interactions=InteractionIndex.build(tables["drug_interactions"], tables["drug_classes"]),
+            condition_ids=MappingProxyType(condition_ids),
+            profile_ids=MappingProxyType(profile_ids),
+            score_matrix=score_matrix,
+            profile_adjustments=MappingProxyType(profile_adjustments),
+        )
+
+    @classmethod
+    def load(cls, path, buffer=None):
+        """Open a compiled file or buffer (see compiled_kb.py); tables and indexes stay in the shared mapping"""
+        compiled, fields = compiled_kb.load_fields(path, buffer)
+        root = compiled.root
+        return cls(
+            interactions=InteractionIndex(nodes_of=root["interaction_nodes"], adjacency=root["interaction_adjacency"]),
+            **fields,
+        )
+
+    def medications_for(self, condition):
+        """Candidate medications for a condition, most effective first"""
+        return self.ranked_medications.get(condition, ())
+
+    def interaction_warning(self, condition, existing_drug):
+        """Warning text for a known dangerous (condition, drug) combination, or None"""
+        return self.tables["dangerous_combinations"].get((condition, existing_drug.lower()))
+
+    def score_medication(self, medication, age_category, gender, condition):
+        """Pre-interaction score and the (factor, adjustment) pairs that produced it"""
+        if gender not in self.tables["gender_adjustment"]:
+            gender = None
+        return self.adjustment_index[(medication, age_category, gender, condition)]
+
+    def profile_id(self, age_category, gender):
+        """Row of score_matrix for a patient profile"""
+        if gender not in self.tables["gender_adjustment"]:
+            gender = None
+        return self.profile_ids[(age_category, gender)]
+
+    def score_batch(self, condition_ids, profile_ids, top=3):
+        """Pre-interaction scores of the top medications for many patients at once.
+
+        Returns an array of shape (len(condition_ids), top); ranks past the end
+        of a condition's medication list are NaN.
+        """
+        return self.score_matrix[np.asarray(condition_ids, dtype=np.intp)[:, None],
+                                 np.asarray(profile_ids, dtype=np.intp)[:, None],
+                                 np.arange(min(top, self.score_matrix.shape[2]))]
+
+    def lifestyle_recommendations(self, condition):
+        return self.tables["lifestyle_recommendations"].get(
+            condition, self.tables["default_lifestyle_recommendations"])
+
+    def monitoring_recommendations(self, condition):
+        return self.tables["monitoring_recommendations"].get(
+            condition, self.tables["default_monitoring_recommendations"])
+
+
+def load_tables(path):
+    """Read rule tables from a JSON file.
+
+    Dangerous combinations are stored as a list of
+    {"condition": ..., "drug": ..., "warning": ...} objects and drug interactions
+    as a list of {"drugs": [..., ...], "severity": ..., "description": ...}
+    objects, since JSON has no tuple keys.
+    """
+    with open(path) as f:
+        tables = json.load(f)
+    if "dangerous_combinations" in tables:
+        tables["dangerous_combinations"] = {
+            (item["condition"].lower(), item["drug"].lower()): item["warning"]
+            for item in tables["dangerous_combinations"]
+        }
+    if "drug_interactions" in tables:
+        tables["drug_interactions"] = {
+            tuple(item["drugs"]): {"severity": item["severity"], "description": item["description"]}
+            for item in tables["drug_interactions"]
+        }
+    return tables
+
+
+_active = None
+_reload_lock = threading.Lock()
+
+# Compiled file being served and watched for replacement: [path, stat identity, interval, next check]
+_watched = None
+
+
+def get_knowledge_base():
+    """The knowledge base currently serving requests; take one reference per request"""
+    watched = _watched
+    if watched is not None and time.monotonic() >= watched[3]:
+        _check_compiled_file()
+    return _active
+
+
+def install_compiled_knowledge_base(path, check_interval=5.0):
+    """Serve a compiled knowledge base file, swapping in a new version when the file is replaced.
+
+    The path is re-checked at most every check_interval seconds (0 disables
+    checking); replace the file by rename, as compiled_kb.py does.
+    """
+    global _active, _watched
+    kb = KnowledgeBase.load(path)
+    with _reload_lock:
+        _active = kb
+        _watched = [path, _identity(os.stat(path)), check_interval, time.monotonic() + check_interval] \
+            if check_interval > 0 else None
+    return kb
+
+
+def install_shared_knowledge_base(name, buffer):
+    """Serve a compiled knowledge base held in a buffer, such as a multiprocessing shared memory block.
+
+    The buffer must stay mapped, and its contents unchanged, for as long as the
+    knowledge base is in use; a new version arrives as a new buffer.
+    """
+    global _active, _watched
+    kb = KnowledgeBase.load(name, buffer)
+    with _reload_lock:
+        _active = kb
+        _watched = None
+    return kb
+
+
+def _identity(stat):
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _check_compiled_file():
+    global _active
+    if not _reload_lock.acquire(blocking=False):
+        # Another thread is already checking or reloading
+        return
+    try:
+        # Read under the lock: an install or reload may have stopped the watch since the unlocked check
+        watched = _watched
+        if watched is None:
+            return
+        path, identity, interval, _ = watched
+        watched[3] = time.monotonic() + interval
+        try:
+            current = _identity(os.stat(path))
+            if current != identity:
+                _active = KnowledgeBase.load(path)
+                watched[1] = current
+                logger.info("Loaded knowledge base %s from %s", _active.fingerprint, path)
+        except (OSError, ValueError):
+            # Keep serving the version already loaded
+            logger.exception("Could not load replaced knowledge base %s", path)
+    finally:
+        _reload_lock.release()
+
+
+def install_knowledge_base(tables):
+    """Build a knowledge base from raw tables and make it the active one"""
+    global _active, _watched
+    kb = KnowledgeBase.build(tables)
+    with _reload_lock:
+        _active = kb
+        _watched = None
+    return kb
+
+
+def reload_knowledge_base(path=None, **tables):
+    """Rebuild with some tables replaced and swap it in atomically.
+
+    Tables come from a JSON file, keyword arguments, or both; anything not
+    supplied is carried over from the active knowledge base. Requests already
+    running keep the instance they started with.
+    """
+    global _active, _watched
+    overrides = load_tables(path) if path else {}
+    overrides.update(tables)
+    with _reload_lock:
+        merged = {name: _thaw(value) for name, value in _active.tables.items()} if _active else {}
+        merged.update(overrides)
+        kb = KnowledgeBase.build(merged)
+        _active = kb
+        # An explicit reload wins over a watched compiled file
+        _watched = None
+    return kb
+
+
+def _thaw(value):
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
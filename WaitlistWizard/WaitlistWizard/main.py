@@ -1,10 +1,40 @@
-from flask import Flask, render_template, send_from_directory, request, jsonify
+from flask import Flask, render_template, send_from_directory, request, jsonify, g, url_for
+import cProfile
+import functools
+import io
+import marshal
+import math
+import mimetypes
 import os
 import json
-import re
+import pstats
+import time
 from datetime import datetime
 
-app = Flask(__name__)
+import explain
+import metrics
+from metrics import span
+from assets import ENCODINGS as ASSET_ENCODINGS, asset_files, load_manifest
+from response_cache import cache_from_env
+from storage import store_from_env
+from knowledge_base import (get_knowledge_base, install_compiled_knowledge_base,
+                            install_knowledge_base)
+from symptom_matcher import SymptomMatcher, load_word_list, normalize_symptom_text
+from symptom_sessions import sessions_from_env
+from autocomplete import MAX_RESULTS as AUTOCOMPLETE_MAX_LIMIT, indexes_for, normalize_query
+from interactions import parse_medications
+from recommendation_matrix import matrix_for
+from response_format import compress, dictionary_for, dumps
+from validation import (RecommendationRequest, ValidationError, reminder_from_payload, symptom_text_from_payload,
+                        urgency_from_payload, waitlist_reference_from_payload)
+from reminders import MAX_WINDOW_MINUTES as REMINDER_MAX_WINDOW, RemindersFull, reminders_from_env
+from explain import explain_log_from_env
+from traffic_capture import capture_from_env
+from waitlist import WaitlistFull, urgency_for, waitlist_from_env
+from rate_limit import CLIENT_HEADER as RATE_LIMIT_CLIENT_HEADER, limiter_from_env
+
+# Static files go through serve_static, which knows about the asset build, not Flask's default route
+app = Flask(__name__, static_folder=None)
 
 # AI recommendation data
 condition_symptoms = {
@@ -93,6 +123,302 @@ medication_effectiveness = {
     }
 }
 
+# Known dangerous condition/drug combinations and contraindications
+dangerous_combinations = {
+    ("asthma", "aspirin"): "Aspirin should NOT be used by people with asthma. It can trigger bronchospasm and serious respiratory problems.",
+    ("hypertension", "ibuprofen"): "NSAIDs like ibuprofen may increase blood pressure and reduce effectiveness of hypertension medications.",
+    ("anxiety", "caffeine"): "Caffeine can worsen anxiety symptoms and reduce the effectiveness of anxiety medications.",
+    ("gerd", "aspirin"): "Aspirin and other NSAIDs can worsen GERD symptoms by irritating the esophagus and stomach lining.",
+    ("depression", "alcohol"): "Alcohol is a depressant and can worsen depression symptoms and interact with antidepressants."
+}
+
+# Drug-drug interactions; either side may name a drug or a class from drug_classes
+drug_interactions = {
+    ("Lisinopril", "Spironolactone"): {"severity": "medium", "description": "May increase risk of hyperkalemia (high potassium levels)"},
+    ("Metformin", "Iodinated contrast"): {"severity": "high", "description": "May cause lactic acidosis, a dangerous condition"},
+    ("Warfarin", "Aspirin"): {"severity": "high", "description": "Significantly increases bleeding risk"},
+    ("Warfarin", "NSAIDs"): {"severity": "high", "description": "Warfarin with NSAIDs or aspirin increases bleeding risk."},
+    ("Aspirin", "Albuterol"): {"severity": "high", "description": "Aspirin should NOT be used by people with asthma. It can trigger bronchospasm and serious respiratory problems."},
+    ("Sertraline", "Tramadol"): {"severity": "medium", "description": "May increase risk of serotonin syndrome"},
+    ("Sumatriptan", "Fluoxetine"): {"severity": "medium", "description": "May increase risk of serotonin syndrome"},
+    ("SSRIs", "MAOIs"): {"severity": "high", "description": "SSRIs with MAOIs can cause serotonin syndrome, a potentially life-threatening condition."},
+    ("Alprazolam", "Alcohol"): {"severity": "high", "description": "Can cause dangerous levels of sedation and respiratory depression"},
+    ("Simvastatin", "Clarithromycin"): {"severity": "high", "description": "Increases risk of muscle damage and rhabdomyolysis"},
+    ("Sildenafil", "Nitroglycerin"): {"severity": "high", "description": "Can cause severe hypotension (low blood pressure)"},
+    ("Theophylline", "Ciprofloxacin"): {"severity": "medium", "description": "May increase theophylline levels and risk of toxicity"},
+    ("Methotrexate", "NSAIDs"): {"severity": "medium", "description": "May increase methotrexate levels and toxicity"},
+    ("ACE inhibitors", "ARBs"): {"severity": "medium", "description": "Increased risk of kidney injury and hyperkalemia"},
+    ("Digoxin", "Amiodarone"): {"severity": "medium", "description": "Increases digoxin levels with risk of toxicity"}
+}
+
+# Drug classes for class-level interactions
+drug_classes = {
+    "ACE inhibitors": ["Lisinopril", "Enalapril", "Ramipril", "Benazepril"],
+    "ARBs": ["Losartan", "Valsartan", "Irbesartan", "Candesartan"],
+    "NSAIDs": ["Ibuprofen", "Naproxen", "Celecoxib", "Diclofenac"],
+    "Statins": ["Atorvastatin", "Simvastatin", "Rosuvastatin", "Pravastatin"],
+    "SSRIs": ["Sertraline", "Fluoxetine", "Escitalopram", "Paroxetine"],
+    "MAOIs": ["Phenelzine", "Tranylcypromine", "Isocarboxazid", "Selegiline"],
+    "Benzodiazepines": ["Alprazolam", "Lorazepam", "Diazepam", "Clonazepam"]
+}
+
+# Age-specific adjustments by drug class
+age_adjustment = {
+    "elderly": {
+        "Benzodiazepines": -0.25,  # Higher risk of falls and cognitive impairment
+        "NSAIDs": -0.20,  # Increased risk of GI bleeding and kidney problems
+        "Zolpidem": -0.15,  # Higher risk of falls and confusion
+        "Anticholinergics": -0.25,  # Increased risk of confusion, memory problems
+        "Insulin": -0.10,  # Risk of hypoglycemia
+        "Warfarin": -0.10,  # Increased bleeding risk
+        "Muscle relaxants": -0.20,  # Increased sedation risk
+        "Statins": -0.05,  # Consider lower doses
+        "Digoxin": -0.15,  # Narrow therapeutic window
+        "Antipsychotics": -0.25  # Risk of stroke in dementia patients
+    },
+    "pediatric": {
+        "Tetracyclines": -0.70,  # Can affect bone growth in children
+        "Aspirin": -0.80,  # Risk of Reye's syndrome
+        "Fluoroquinolones": -0.70,  # Can affect cartilage development
+        "Statins": -0.70,  # Generally not recommended
+        "ACE inhibitors": -0.60,  # Caution in growing children
+        "Adult-strength formulations": -0.50,  # Need pediatric dosing
+        "Dextromethorphan": -0.30,  # Use caution in young children
+        "Codeine": -0.60  # Respiratory concerns in young children
+    },
+    "adult": {
+        "Pediatric formulations": -0.50,  # Inadequate dosing
+        "Geriatric-specific medications": -0.30  # May not be appropriate
+    }
+}
+
+# Gender-specific adjustments by drug class
+gender_adjustment = {
+    "female": {
+        "ACE inhibitors": -0.15,  # Potential teratogenic effects in pregnancy
+        "Statins": -0.10,  # Caution in women who may become pregnant
+        "Warfarin": -0.15,  # Teratogenic risk in pregnancy
+        "Valproate": -0.20,  # Teratogenic risk and PCOS association
+        "Finasteride": -0.90,  # Not indicated, risk in pregnancy
+        "Sildenafil": -0.40,  # Less evidence for female use
+        "Minoxidil": -0.20,  # Different dosing may be needed
+        "Isotretinoin": -0.20  # Teratogenic risk
+    },
+    "male": {
+        "Finasteride": 0.10,  # Used for male pattern baldness and BPH
+        "Sildenafil": 0.10,  # More commonly prescribed
+        "Tamsulosin": 0.15,  # Used for BPH
+        "Spironolactone": -0.10,  # May cause gynecomastia
+        "Estrogen medications": -0.90  # Generally not indicated
+    },
+    "other": {
+        # Neutral adjustments
+    }
+}
+
+# Condition-specific factors by drug class
+condition_factor = {
+    "hypertension": {"Diuretics": 0.1, "Calcium channel blockers": 0.1},
+    "diabetes": {"Metformin": 0.1, "GLP-1 agonists": 0.1, "SGLT2 inhibitors": 0.1},
+    "asthma": {"Inhaled corticosteroids": 0.1, "Long-acting beta agonists": 0.1},
+    "depression": {"SSRIs": 0.1, "SNRIs": 0.05},
+    "anxiety": {"SSRIs": 0.1, "Buspirone": 0.1},
+    "insomnia": {"Melatonin": 0.05, "Cognitive behavioral therapy": 0.2}
+}
+
+# Lifestyle change recommendations by condition
+lifestyle_recommendations = {
+    "hypertension": [
+        "Reduce sodium intake to less than 2,300mg per day",
+        "Regular aerobic exercise for 30 minutes most days",
+        "Maintain healthy weight",
+        "DASH diet rich in fruits, vegetables, and low-fat dairy",
+        "Limit alcohol consumption"
+    ],
+    "diabetes": [
+        "Regular blood glucose monitoring",
+        "Balanced diet with controlled carbohydrate intake",
+        "Regular physical activity for 150 minutes per week",
+        "Maintain healthy weight",
+        "Avoid smoking"
+    ],
+    "depression": [
+        "Regular physical exercise",
+        "Maintain regular sleep schedule",
+        "Consider psychotherapy or counseling",
+        "Social engagement and support networks",
+        "Mindfulness and stress reduction techniques"
+    ],
+    "anxiety": [
+        "Breathing exercises and meditation",
+        "Regular physical activity",
+        "Limit caffeine and alcohol",
+        "Adequate sleep",
+        "Consider cognitive behavioral therapy"
+    ],
+    "insomnia": [
+        "Consistent sleep schedule",
+        "Create relaxing bedtime routine",
+        "Avoid screens before bed",
+        "Make bedroom comfortable and dark",
+        "Avoid caffeine and large meals before bed"
+    ],
+    "asthma": [
+        "Identify and avoid triggers",
+        "Use air purifiers at home",
+        "Regular exercise with appropriate precautions",
+        "Maintain healthy weight",
+        "Annual flu vaccination"
+    ],
+    "allergies": [
+        "Identify and avoid allergens",
+        "HEPA filters for home",
+        "Keep windows closed during high pollen seasons",
+        "Regular cleaning to reduce dust and pet dander",
+        "Consider allergen covers for bedding"
+    ],
+    "migraine": [
+        "Identify and avoid personal triggers",
+        "Maintain regular sleep and meal schedule",
+        "Stress management techniques",
+        "Stay hydrated",
+        "Regular physical activity"
+    ],
+    "gerd": [
+        "Avoid lying down after eating",
+        "Elevate head of bed",
+        "Avoid trigger foods (spicy, acidic, fatty)",
+        "Smaller, more frequent meals",
+        "Maintain healthy weight"
+    ],
+    "hypercholesterolemia": [
+        "Mediterranean or DASH diet",
+        "Regular physical activity",
+        "Limit saturated and trans fats",
+        "Increase fiber intake",
+        "Maintain healthy weight"
+    ]
+}
+
+default_lifestyle_recommendations = ["Maintain a balanced diet", "Regular physical activity", "Adequate sleep", "Stress management", "Regular medical check-ups"]
+
+# Monitoring recommendations by condition
+monitoring_recommendations = {
+    "hypertension": [
+        "Regular blood pressure checks",
+        "Monitor for medication side effects",
+        "Periodic kidney function tests",
+        "Regular physician follow-up",
+        "Home blood pressure monitoring if recommended"
+    ],
+    "diabetes": [
+        "Regular blood glucose monitoring",
+        "HbA1c testing every 3-6 months",
+        "Annual eye examination",
+        "Regular foot examinations",
+        "Kidney function monitoring"
+    ],
+    "depression": [
+        "Regular follow-up with healthcare provider",
+        "Monitor for side effects of medication",
+        "Track mood changes",
+        "Watch for warning signs of suicidal thoughts",
+        "Evaluate effectiveness of treatment"
+    ],
+    "anxiety": [
+        "Track anxiety symptoms and triggers",
+        "Monitor response to medication",
+        "Watch for side effects",
+        "Regular therapy sessions if applicable",
+        "Evaluate stress levels"
+    ]
+}
+
+default_monitoring_recommendations = ["Regular follow-up with healthcare provider", "Monitor for medication side effects", "Track symptom changes", "Report any new symptoms promptly"]
+
+# Rule tables are indexed once into an immutable knowledge base; see reload_knowledge_base
+knowledge_base_tables = {
+    "medication_effectiveness": medication_effectiveness,
+    "dangerous_combinations": dangerous_combinations,
+    "drug_interactions": drug_interactions,
+    "drug_classes": drug_classes,
+    "age_adjustment": age_adjustment,
+    "gender_adjustment": gender_adjustment,
+    "condition_factor": condition_factor,
+    "lifestyle_recommendations": lifestyle_recommendations,
+    "monitoring_recommendations": monitoring_recommendations,
+    "default_lifestyle_recommendations": default_lifestyle_recommendations,
+    "default_monitoring_recommendations": default_monitoring_recommendations
+}
+
+# A compiled file (python compiled_kb.py knowledge_base.kb) is memory-mapped instead of
+# rebuilt in every worker, and swapped in when replaced on disk
+KNOWLEDGE_BASE_PATH = os.environ.get("KNOWLEDGE_BASE_PATH")
+
+# Scoring service workers install the knowledge base and symptom matcher from the
+# supervisor's shared memory block (see scoring_service.py) instead of building them
+SCORING_WORKER = os.environ.get("SCORING_SERVICE_WORKER") == "1"
+
+if KNOWLEDGE_BASE_PATH:
+    install_compiled_knowledge_base(KNOWLEDGE_BASE_PATH,
+                                    float(os.environ.get("KNOWLEDGE_BASE_CHECK_SECONDS", 5)))
+elif not SCORING_WORKER:
+    install_knowledge_base(knowledge_base_tables)
+
+# Common symptom synonyms and related terms used to expand patient text
+symptom_synonyms = {
+    "headache": ["head pain", "migraine", "tension headache", "head pressure", "throbbing head"],
+    "nausea": ["sick to stomach", "feel like vomiting", "queasy", "upset stomach"],
+    "fatigue": ["tired", "exhaustion", "lethargy", "lack of energy", "exhausted", "weary"],
+    "dizziness": ["lightheaded", "vertigo", "feeling faint", "spinning", "unsteady"],
+    "pain": ["ache", "discomfort", "soreness", "hurt", "aching", "tender"],
+    "rash": ["hives", "skin eruption", "breakout", "skin irritation", "dermatitis"],
+    "fever": ["high temperature", "elevated temperature", "hot", "feverish", "running a temperature"],
+    "cough": ["hack", "wheeze", "barking", "persistent cough", "dry cough"],
+    "shortness of breath": ["difficulty breathing", "breathlessness", "can't catch breath", "labored breathing", "dyspnea"]
+}
+
+# Condition-specific contextual keywords that add a small bonus when present
+condition_context_keywords = {
+    "hypertension": ["pressure", "high", "stress", "heart"],
+    "diabetes": ["sugar", "thirsty", "glucose", "insulin"],
+    "asthma": ["breath", "chest", "wheeze", "trigger"]
+}
+
+# Maximum edit distance for typo-tolerant matching ("dizzyness"); 0 turns it off. One edit by default:
+# ordinary words that one edit turns into symptom words (tried -> tired, right -> light) are listed in
+# common_words.txt, generated by common_words.py, and never corrected. Two edits also need FUZZY_DICTIONARY_PATH
+FUZZY_MAX_DISTANCE = int(os.environ.get("FUZZY_MAX_DISTANCE", 1))
+
+# Full word list whose words are never corrected either (FUZZY_DICTIONARY_PATH, e.g. /usr/share/dict/words);
+# without one, no token is corrected by more than one edit
+FUZZY_DICTIONARY = load_word_list(os.environ["FUZZY_DICTIONARY_PATH"]) if os.environ.get("FUZZY_DICTIONARY_PATH") else None
+
+# Compiled once at import; analyze_symptoms only walks the text
+symptom_matcher = None if SCORING_WORKER else \
+    SymptomMatcher(condition_symptoms, symptom_synonyms, condition_context_keywords,
+                   max_fuzzy_distance=FUZZY_MAX_DISTANCE, dictionary=FUZZY_DICTIONARY)
+
+# Incremental analysis state for clients analyzing symptoms as they are typed
+symptom_sessions = sessions_from_env(symptom_matcher, FUZZY_MAX_DISTANCE)
+
+# Audit log of every API recommendation; None unless RECORD_RECOMMENDATIONS=1
+recommendation_store = store_from_env()
+
+# Assessed patients waiting for care, most urgent first (see waitlist.py)
+waitlist = waitlist_from_env()
+
+# Patients' weekly medication reminders, indexed by time of day (see reminders.py)
+reminders = reminders_from_env()
+
+# Serve recommendations without symptom text or existing medications from a
+# table precomputed per knowledge base; check it with `python recommendation_matrix.py`
+RECOMMENDATION_MATRIX = os.environ.get("RECOMMENDATION_MATRIX") == "1"
+
+# Memoization of the pure scoring functions; None when RESPONSE_CACHE_SIZE=0
+symptom_cache = cache_from_env("symptoms")
+recommendation_cache = cache_from_env("recommendations")
+
 # AI recommendation functions
 def analyze_symptoms(symptom_text):
     """Use enhanced NLP to analyze patient-described symptoms and match to conditions"""
@@ -100,66 +426,60 @@ def analyze_symptoms(symptom_text):
         return None
     
     # Normalize text: lowercase, remove punctuation
-    text = symptom_text.lower()
-    text = re.sub(r'[^\w\s]', '', text)
-    words = text.split()
-    
-    # Enhanced processing with context awareness
-    # Add common symptom synonyms and related terms
-    symptom_synonyms = {
-        "headache": ["head pain", "migraine", "tension headache", "head pressure", "throbbing head"],
-        "nausea": ["sick to stomach", "feel like vomiting", "queasy", "upset stomach"],
-        "fatigue": ["tired", "exhaustion", "lethargy", "lack of energy", "exhausted", "weary"],
-        "dizziness": ["lightheaded", "vertigo", "feeling faint", "spinning", "unsteady"],
-        "pain": ["ache", "discomfort", "soreness", "hurt", "aching", "tender"],
-        "rash": ["hives", "skin eruption", "breakout", "skin irritation", "dermatitis"],
-        "fever": ["high temperature", "elevated temperature", "hot", "feverish", "running a temperature"],
-        "cough": ["hack", "wheeze", "barking", "persistent cough", "dry cough"],
-        "shortness of breath": ["difficulty breathing", "breathlessness", "can't catch breath", "labored breathing", "dyspnea"]
-    }
+    with span("symptoms.normalize"):
+        text = normalize_symptom_text(symptom_text)
+    
+    # A traced request is scored in full so every contribution is seen
+    trace = explain.current() if explain.active else None
+    if trace is not None:
+        return _analyze_normalized_symptoms(text, trace)
+    if symptom_cache is None:
+        return _analyze_normalized_symptoms(text)
+    return symptom_cache.get_or_compute(text, lambda: _analyze_normalized_symptoms(text))
+
+def _analyze_normalized_symptoms(text, trace=None):
+    """Score conditions for already-normalized symptom text"""
+    # Correct likely misspellings against the symptom vocabulary before matching
+    with span("symptoms.fuzzy"):
+        text, corrections = symptom_matcher.correct(text, FUZZY_MAX_DISTANCE)
+    
+    # Single pass over the text: synonym expansion, phrase, word and context matches
+    with span("symptoms.match"):
+        matches = symptom_matcher.match(text)
+    
+    if trace is not None:
+        for token, word, distance in corrections:
+            trace.add("symptoms", "correction", None, f"{token} -> {word} (distance {distance})")
+        return _rank_conditions(matches, corrections, trace, symptom_matcher.explain(text))
+    with span("symptoms.rank"):
+        return _rank_conditions(matches, corrections)
+
+def analyze_symptoms_live(session_id, symptom_text):
+    """analyze_symptoms for text that is still being typed; returns (session_id, results).
+
+    The session remembers the previous text's matches, so only the edited
+    span is rescanned. Unknown or expired session ids start a new session.
+    """
+    with span("symptoms.normalize"):
+        text = normalize_symptom_text(symptom_text) if symptom_text else ""
+    
+    with span("symptoms.incremental"):
+        session_id, (matches, corrections) = symptom_sessions.update(session_id, text)
+    if not symptom_text:
+        return session_id, None
     
-    # Expand text with recognized synonyms
-    expanded_text = text
-    for main_symptom, synonyms in symptom_synonyms.items():
-        for synonym in synonyms:
-            if synonym in text:
-                expanded_text += f" {main_symptom}"
+    with span("symptoms.rank"):
+        return session_id, _rank_conditions(matches, corrections)
+
+def _rank_conditions(matches, corrections=(), trace=None, evidence=None):
+    """Turn raw per-condition matches into the top scored conditions.
     
-    # Calculate match scores for each condition based on symptom keywords
+    With a trace, evidence is symptom_matcher.explain() of the same text and
+    every contribution to a condition's percentage is recorded.
+    """
     condition_scores = {}
-    for condition, symptoms in condition_symptoms.items():
-        score = 0
-        matched_symptoms = []
-        
-        for symptom in symptoms:
-            # Check if symptom phrase is in text
-            if symptom in expanded_text:
-                score += 1
-                matched_symptoms.append(symptom)
-            else:
-                # Check individual words in symptom phrase with weighting
-                symptom_words = symptom.split()
-                word_matched = False
-                
-                for word in symptom_words:
-                    if word in words and len(word) > 3:  # Only match significant words
-                        # More weight for specific medical terms
-                        if word in ["severe", "chronic", "acute", "recurring", "persistent"]:
-                            score += 0.7
-                        else:
-                            score += 0.5
-                        
-                        if not word_matched:
-                            matched_symptoms.append(symptom)
-                            word_matched = True
-        
-        # Apply condition-specific contextual analysis
-        if condition == "hypertension" and any(w in expanded_text for w in ["pressure", "high", "stress", "heart"]):
-            score += 0.5
-        elif condition == "diabetes" and any(w in expanded_text for w in ["sugar", "thirsty", "glucose", "insulin"]):
-            score += 0.5
-        elif condition == "asthma" and any(w in expanded_text for w in ["breath", "chest", "wheeze", "trigger"]):
-            score += 0.5
+    for condition, (score, matched_symptoms) in matches.items():
+        symptoms = condition_symptoms[condition]
         
         # Apply advanced scoring factors based on symptom co-occurrence
         symptom_count = len(matched_symptoms)
@@ -178,6 +498,13 @@ def analyze_symptoms(symptom_text):
                 "score": min(98, base_score + adjustment),  # Cap at 98% to acknowledge uncertainty
                 "matched_symptoms": list(set(matched_symptoms))  # Remove duplicates
             }
+            if trace is not None:
+                _trace_condition(trace, condition, evidence[condition], len(symptoms), symptom_count, base_score + adjustment)
+            
+            # Report typo corrections that fed this condition's matches
+            fuzzy_matches = symptom_matcher.fuzzy_contributions(condition, matched_symptoms, corrections) if corrections else None
+            if fuzzy_matches:
+                condition_scores[condition]["fuzzy_matches"] = fuzzy_matches
     
     # Sort conditions by score
     sorted_conditions = sorted(condition_scores.items(), key=lambda x: x[1]["score"], reverse=True)
@@ -186,28 +513,54 @@ def analyze_symptoms(symptom_text):
     top_matches = [{"condition": cond, "match_data": data} 
                   for cond, data in sorted_conditions if data["score"] >= 25]
     
+    if trace is not None:
+        for cond, data in sorted_conditions:
+            if data["score"] < 25:
+                trace.add("symptoms", "threshold", None, f"{cond} below 25% ({data['score']:.1f}%)")
+        for match in top_matches[3:]:
+            trace.add("symptoms", "rank", None, f"{match['condition']} outside the top 3")
+    
     return top_matches[:3] if top_matches else None  # Return top 3 matches or None
 
-def get_ai_recommendation(health_condition, gender, age, existing_drug=None, symptom_text=None):
-    """Generate AI-powered medication recommendation with advanced personalization and safety analysis"""
+def _trace_condition(trace, condition, contributions, symptom_total, symptom_count, uncapped):
+    """Record a condition's evidence in points of its match percentage, mirroring _rank_conditions"""
+    points = 100 / symptom_total
+    for rule, detail, weight in contributions:
+        trace.add("symptoms", rule, condition, detail, weight * points)
+    if symptom_count >= 3:
+        trace.add("symptoms", "co_occurrence", condition, f"{symptom_count} matched", 1.0 * points)
+    trace.add("symptoms", "breadth", condition, f"{symptom_count} matched", min(20, symptom_count * 5))
+    if uncapped > 98:
+        trace.add("symptoms", "cap", condition, "98%", 98 - uncapped)
+
+def _prepare_recommendation(kb, req, trace=None):
+    """Build everything in a recommendation except the per-medication scores.
+    
+    Returns (recommendation, top_medications); top_medications is None when no
+    valid condition could be determined and recommendation is the error response.
+    """
     # Default to the provided health condition
-    primary_condition = health_condition.lower() if health_condition else ""
+    primary_condition = req.condition
     
     # If symptom text is provided, use enhanced NLP to analyze and suggest conditions
     suggested_conditions = None
-    if symptom_text:
-        suggested_conditions = analyze_symptoms(symptom_text)
+    if req.symptom_text:
+        with span("recommendation.symptom_analysis"):
+            suggested_conditions = analyze_symptoms(req.symptom_text)
         
         # If we found strong symptom matches and the user didn't specify a condition,
         # use the top matched condition
-        if suggested_conditions and (not health_condition or health_condition.lower() == "unknown"):
+        if suggested_conditions and (not req.health_condition or req.condition == "unknown"):
             primary_condition = suggested_conditions[0]["condition"]
+    if trace is not None:
+        trace.add("recommendation", "condition", None,
+                  f"{primary_condition} ({'as given' if primary_condition == req.condition else 'from symptoms'})")
     
-    # Get medication effectiveness for this condition
-    effectiveness_data = medication_effectiveness.get(primary_condition, {})
+    # Medications for this condition, already sorted by effectiveness
+    sorted_medications = kb.medications_for(primary_condition)
     
     # If no valid condition or no medication data, provide a meaningful response
-    if not primary_condition or not effectiveness_data:
+    if not primary_condition or not sorted_medications:
         return {
             "timestamp": datetime.now().isoformat(),
             "error": True,
@@ -216,124 +569,53 @@ def get_ai_recommendation(health_condition, gender, age, existing_drug=None, sym
                 "is_ai_enhanced": True,
                 "symptom_analysis": suggested_conditions if suggested_conditions else None
             }
-        }
-    
-    # Sort medications by effectiveness
-    sorted_medications = sorted(effectiveness_data.items(), key=lambda x: x[1], reverse=True)
+        }, None
     
     # Check for dangerous combinations and contraindications
     has_dangerous_interaction = False
     interaction_warning = None
     alternative_medication = None
     safety_notes = []
+    existing_medications = req.medications
     
-    # Define comprehensive drug interactions and contraindications
-    dangerous_combinations = {
-        ("asthma", "aspirin"): "Aspirin should NOT be used by people with asthma. It can trigger bronchospasm and serious respiratory problems.",
-        ("hypertension", "ibuprofen"): "NSAIDs like ibuprofen may increase blood pressure and reduce effectiveness of hypertension medications.",
-        ("anxiety", "caffeine"): "Caffeine can worsen anxiety symptoms and reduce the effectiveness of anxiety medications.",
-        ("gerd", "aspirin"): "Aspirin and other NSAIDs can worsen GERD symptoms by irritating the esophagus and stomach lining.",
-        ("depression", "alcohol"): "Alcohol is a depressant and can worsen depression symptoms and interact with antidepressants."
-    }
-    
-    # Check for specific dangerous combinations
-    if existing_drug:
-        existing_drug_lower = existing_drug.lower()
-        combination_key = (primary_condition, existing_drug_lower)
-        
-        if combination_key in dangerous_combinations:
-            has_dangerous_interaction = True
-            interaction_warning = dangerous_combinations[combination_key]
-            # Suggest alternative (first medication that's not the dangerous one)
-            if sorted_medications:
+    with span("recommendation.safety"):
+        # Check for specific dangerous combinations
+        for drug in existing_medications:
+            interaction_warning = kb.interaction_warning(primary_condition, drug)
+            
+            if interaction_warning:
+                if trace is not None:
+                    trace.add("recommendation", "dangerous_combination", None, f"{primary_condition} with {drug}")
+                has_dangerous_interaction = True
+                # Suggest alternative (first medication that's not the dangerous one)
                 alternative_medication = sorted_medications[0][0]
+                break
         
-        # Additional general safety checks
-        if "warfarin" in existing_drug_lower and any(m for m, _ in sorted_medications if "nsaid" in m.lower() or "aspirin" in m.lower()):
-            safety_notes.append("Warfarin with NSAIDs or aspirin increases bleeding risk.")
-        
-        if "ssri" in existing_drug_lower and any(m for m, _ in sorted_medications if "maoi" in m.lower()):
-            safety_notes.append("SSRIs with MAOIs can cause serotonin syndrome, a potentially life-threatening condition.")
+        # Drug-drug interactions among current medications and with the top candidates
+        drug_interactions = kb.interactions.check(
+            existing_medications, [medication for medication, _ in sorted_medications[:3]]) if existing_medications else []
+        for interaction in drug_interactions:
+            if interaction["severity"] == "high":
+                safety_notes.append(f"{' with '.join(interaction['drugs'])}: {interaction['description']}")
+            if trace is not None:
+                trace.add("recommendation", "drug_interaction", None,
+                          f"{' with '.join(interaction['drugs'])} ({interaction['severity']})")
     
     # Personalize recommendation based on age and gender with enhanced adjustments
-    age_category = "adult"
-    if int(age) < 18:
-        age_category = "pediatric"
-    elif int(age) >= 65:
-        age_category = "elderly"
-    
-    # More comprehensive age-specific adjustments
-    age_adjustment = {
-        "elderly": {
-            "Benzodiazepines": -0.25,  # Higher risk of falls and cognitive impairment
-            "NSAIDs": -0.20,  # Increased risk of GI bleeding and kidney problems
-            "Zolpidem": -0.15,  # Higher risk of falls and confusion
-            "Anticholinergics": -0.25,  # Increased risk of confusion, memory problems
-            "Insulin": -0.10,  # Risk of hypoglycemia
-            "Warfarin": -0.10,  # Increased bleeding risk
-            "Muscle relaxants": -0.20,  # Increased sedation risk
-            "Statins": -0.05,  # Consider lower doses
-            "Digoxin": -0.15,  # Narrow therapeutic window
-            "Antipsychotics": -0.25  # Risk of stroke in dementia patients
-        },
-        "pediatric": {
-            "Tetracyclines": -0.70,  # Can affect bone growth in children
-            "Aspirin": -0.80,  # Risk of Reye's syndrome
-            "Fluoroquinolones": -0.70,  # Can affect cartilage development
-            "Statins": -0.70,  # Generally not recommended
-            "ACE inhibitors": -0.60,  # Caution in growing children
-            "Adult-strength formulations": -0.50,  # Need pediatric dosing
-            "Dextromethorphan": -0.30,  # Use caution in young children
-            "Codeine": -0.60  # Respiratory concerns in young children
-        },
-        "adult": {
-            "Pediatric formulations": -0.50,  # Inadequate dosing
-            "Geriatric-specific medications": -0.30  # May not be appropriate
-        }
-    }
+    age_category = req.age_category
     
-    # Enhanced gender-specific adjustments
-    gender_adjustment = {
-        "female": {
-            "ACE inhibitors": -0.15,  # Potential teratogenic effects in pregnancy
-            "Statins": -0.10,  # Caution in women who may become pregnant
-            "Warfarin": -0.15,  # Teratogenic risk in pregnancy
-            "Valproate": -0.20,  # Teratogenic risk and PCOS association
-            "Finasteride": -0.90,  # Not indicated, risk in pregnancy
-            "Sildenafil": -0.40,  # Less evidence for female use
-            "Minoxidil": -0.20,  # Different dosing may be needed
-            "Isotretinoin": -0.20  # Teratogenic risk
-        },
-        "male": {
-            "Finasteride": 0.10,  # Used for male pattern baldness and BPH
-            "Sildenafil": 0.10,  # More commonly prescribed
-            "Tamsulosin": 0.15,  # Used for BPH
-            "Spironolactone": -0.10,  # May cause gynecomastia
-            "Estrogen medications": -0.90  # Generally not indicated
-        },
-        "other": {
-            # Neutral adjustments
-        }
-    }
-    
-    # Add condition-specific factors
-    condition_factor = {
-        "hypertension": {"Diuretics": 0.1, "Calcium channel blockers": 0.1},
-        "diabetes": {"Metformin": 0.1, "GLP-1 agonists": 0.1, "SGLT2 inhibitors": 0.1},
-        "asthma": {"Inhaled corticosteroids": 0.1, "Long-acting beta agonists": 0.1},
-        "depression": {"SSRIs": 0.1, "SNRIs": 0.05},
-        "anxiety": {"SSRIs": 0.1, "Buspirone": 0.1},
-        "insomnia": {"Melatonin": 0.05, "Cognitive behavioral therapy": 0.2}
-    }
+    with span("recommendation.lifestyle_monitoring"):
+        lifestyle_changes = get_lifestyle_recommendations(primary_condition)
+        monitoring = get_monitoring_recommendations(primary_condition)
     
     # Build enhanced recommendation object
     recommendation = {
         "timestamp": datetime.now().isoformat(),
         "patient": {
-            "gender": gender,
-            "age": age,
+            "gender": req.gender,
+            "age": req.age,
             "age_category": age_category,
-            "existing_medication": existing_drug if existing_drug else None
+            "existing_medication": req.existing_drug if req.existing_drug else None
         },
         "primary_condition": primary_condition,
         "ai_analysis": {
@@ -346,185 +628,183 @@ def get_ai_recommendation(health_condition, gender, age, existing_drug=None, sym
             "has_dangerous_interaction": has_dangerous_interaction,
             "interaction_warning": interaction_warning,
             "alternative_medication": alternative_medication,
-            "safety_notes": safety_notes
+            "safety_notes": safety_notes,
+            "drug_interactions": drug_interactions
         },
         "additional_recommendations": {
-            "lifestyle_changes": get_lifestyle_recommendations(primary_condition),
-            "monitoring": get_monitoring_recommendations(primary_condition)
+            "lifestyle_changes": lifestyle_changes,
+            "monitoring": monitoring
         }
     }
     
+    return recommendation, [medication for medication, _ in sorted_medications[:3]]  # Top 3 medications
+
+def _medication_recommendation(medication, score, applied, recommendation, existing_medications, trace=None):
+    """Finish one medication entry from its precomputed score and adjustments"""
+    patient = recommendation["patient"]
+    adjustments = [{"factor": factor, "adjustment": adjustment} for factor, adjustment in applied]
+    
+    # Apply existing medication adjustment
+    is_dangerous = False
+    if existing_medications and recommendation["safety"]["has_dangerous_interaction"] and \
+            medication.lower() in (drug.lower() for drug in existing_medications):
+        score -= 0.5
+        is_dangerous = True
+        adjustments.append({
+            "factor": "Drug interaction",
+            "adjustment": -0.5
+        })
+        if trace is not None:
+            trace.add("recommendation", "interaction", medication, "Drug interaction", -0.5)
+    
+    # Cap score between 0 and 1
+    if trace is not None and not 0 <= score <= 1:
+        trace.add("recommendation", "clamp", medication, "0-1", max(0, min(1, score)) - score)
+    score = max(0, min(1, score))
+    
+    with span("recommendation.dosing"):
+        dosing_guidance = get_dosing_guidance(medication, patient["age_category"], patient["gender"], recommendation["primary_condition"])
+    
+    return {
+        "medication": medication,
+        "confidence_score": round(score, 2),
+        "is_dangerous_with_existing_medication": is_dangerous,
+        "score_adjustments": adjustments,
+        "dosing_guidance": dosing_guidance
+    }
+
+def get_ai_recommendation(health_condition, gender, age, existing_drug=None, symptom_text=None):
+    """Generate AI-powered medication recommendation with advanced personalization and safety analysis"""
+    return recommend(RecommendationRequest(health_condition, gender, age, existing_drug, symptom_text))
+
+def recommend(req):
+    """get_ai_recommendation for an already built RecommendationRequest"""
+    # Take one reference so a concurrent reload cannot mix table versions
+    kb = get_knowledge_base()
+    
+    # A traced request skips the precomputed table and the cache so every contribution is seen
+    trace = explain.current() if explain.active else None
+    if trace is not None:
+        return _compute_recommendation(kb, req, trace)
+    
+    if RECOMMENDATION_MATRIX and not req.symptom_text and not req.existing_drug:
+        cached = matrix_for(kb, _compute_recommendation).lookup(kb, req)
+        if cached is not None:
+            return _restamp_recommendation(cached, req)
+    
+    if recommendation_cache is not None:
+        key = _recommendation_cache_key(kb, req)
+        if key is not None:
+            cached = recommendation_cache.get_or_compute(key, lambda: _compute_recommendation(kb, req))
+            return _restamp_recommendation(cached, req)
+    
+    return _compute_recommendation(kb, req)
+
+def _recommendation_cache_key(kb, req):
+    """Normalized inputs that fully determine a recommendation, or None if not cacheable"""
+    try:
+        key = (
+            kb.fingerprint,
+            req.condition,
+            req.gender,
+            req.age_category,
+            # Case kept: interaction entries echo the names as given
+            tuple(req.medications),
+            normalize_symptom_text(req.symptom_text) if req.symptom_text else ""
+        )
+        hash(key)
+        return key
+    except (TypeError, ValueError, AttributeError):
+        # Let the uncached path raise or answer exactly as it always has
+        return None
+
+def _restamp_recommendation(cached, req):
+    """Copy of a cached recommendation with a fresh timestamp and this caller's patient fields.
+    
+    Nested objects are shared with the cache entry and must not be mutated.
+    """
+    recommendation = dict(cached)
+    recommendation["timestamp"] = datetime.now().isoformat()
+    if "patient" in recommendation:
+        recommendation["patient"] = dict(recommendation["patient"],
+                                         gender=req.gender,
+                                         age=req.age,
+                                         existing_medication=req.existing_drug if req.existing_drug else None)
+    return recommendation
+
+def _compute_recommendation(kb, req, trace=None):
+    """Uncached body of get_ai_recommendation"""
+    recommendation, top_medications = _prepare_recommendation(kb, req, trace)
+    if top_medications is None:
+        return recommendation
+    
     # Build personalized medication recommendations with confidence scoring
-    for medication, base_score in sorted_medications[:3]:  # Top 3 medications
-        score = base_score
-        adjustments = []
-        
-        # Apply age adjustments
-        if age_category in age_adjustment:
-            for drug_class, adjustment in age_adjustment[age_category].items():
-                if drug_class.lower() in medication.lower():
-                    score += adjustment
-                    adjustments.append({
-                        "factor": f"Age category ({age_category})",
-                        "adjustment": adjustment
-                    })
-        
-        # Apply gender adjustments
-        if gender in gender_adjustment:
-            for drug_class, adjustment in gender_adjustment[gender].items():
-                if drug_class.lower() in medication.lower():
-                    score += adjustment
-                    adjustments.append({
-                        "factor": f"Gender ({gender})",
-                        "adjustment": adjustment
-                    })
-        
-        # Apply condition-specific adjustments
-        if primary_condition in condition_factor:
-            for drug_class, adjustment in condition_factor[primary_condition].items():
-                if drug_class.lower() in medication.lower():
-                    score += adjustment
-                    adjustments.append({
-                        "factor": f"Condition specific ({primary_condition})",
-                        "adjustment": adjustment
-                    })
-        
-        # Apply existing medication adjustment
-        is_dangerous = False
-        if existing_drug and has_dangerous_interaction and medication.lower() == existing_drug.lower():
-            score -= 0.5
-            is_dangerous = True
-            adjustments.append({
-                "factor": "Drug interaction",
-                "adjustment": -0.5
-            })
-        
-        # Cap score between 0 and 1
-        score = max(0, min(1, score))
-        
-        medication_info = {
-            "medication": medication,
-            "confidence_score": round(score, 2),
-            "is_dangerous_with_existing_medication": is_dangerous,
-            "score_adjustments": adjustments,
-            "dosing_guidance": get_dosing_guidance(medication, age_category, gender, primary_condition)
-        }
-        
-        recommendation["recommendations"].append(medication_info)
+    age_category = recommendation["patient"]["age_category"]
+    primary_condition = recommendation["primary_condition"]
+    with span("recommendation.scoring"):
+        for medication in top_medications:
+            # Age, gender and condition adjustments are precomputed per patient profile
+            score, applied = kb.score_medication(medication, age_category, req.gender, primary_condition)
+            if trace is not None:
+                _trace_medication(trace, kb, primary_condition, medication, applied)
+            recommendation["recommendations"].append(
+                _medication_recommendation(medication, score, applied, recommendation, req.medications, trace))
     
     return recommendation
 
+def _trace_medication(trace, kb, condition, medication, applied):
+    """Record a medication's base effectiveness and each profile adjustment applied to it"""
+    trace.add("recommendation", "effectiveness", medication, condition, dict(kb.medications_for(condition))[medication])
+    for factor, adjustment in applied:
+        trace.add("recommendation", "adjustment", medication, factor, adjustment)
+
+def get_ai_recommendations_batch(patients):
+    """Score many patient records together; one result per record, in input order.
+    
+    Each record uses the same fields as the /api/ai-recommendation payload and
+    is validated the same way. A record that fails validation yields
+    {"success": False, "error": ..., "errors": [...]} without affecting the others.
+    """
+    kb = get_knowledge_base()
+    matrix = matrix_for(kb, _compute_recommendation) if RECOMMENDATION_MATRIX else None
+    results = [None] * len(patients)
+    pending = []
+    
+    for i, patient in enumerate(patients):
+        try:
+            req = RecommendationRequest.from_payload(patient)
+        except ValidationError as e:
+            results[i] = {"success": False, "error": str(e), "errors": e.errors}
+            continue
+        cached = matrix.lookup(kb, req) if matrix is not None and not req.existing_drug and not req.symptom_text else None
+        if cached is not None:
+            results[i] = {"success": True, "recommendation": _restamp_recommendation(cached, req)}
+            continue
+        recommendation, top_medications = _prepare_recommendation(kb, req)
+        results[i] = {"success": True, "recommendation": recommendation}
+        if top_medications is not None:
+            pending.append((recommendation, top_medications, req))
+    
+    if pending:
+        # One gather over the condition x profile x rank score matrix for the whole batch
+        condition_ids = [kb.condition_ids[recommendation["primary_condition"]] for recommendation, _, _ in pending]
+        profile_ids = [kb.profile_id(req.age_category, req.gender) for _, _, req in pending]
+        scores = kb.score_batch(condition_ids, profile_ids).tolist()
+        
+        for (recommendation, top_medications, req), c, p, row in zip(pending, condition_ids, profile_ids, scores):
+            for medication, score, applied in zip(top_medications, row, kb.profile_adjustments[(c, p)]):
+                recommendation["recommendations"].append(
+                    _medication_recommendation(medication, score, applied, recommendation, req.medications))
+    
+    return results
+
 def get_lifestyle_recommendations(condition):
     """Get lifestyle change recommendations based on condition"""
-    lifestyle_recommendations = {
-        "hypertension": [
-            "Reduce sodium intake to less than 2,300mg per day",
-            "Regular aerobic exercise for 30 minutes most days",
-            "Maintain healthy weight",
-            "DASH diet rich in fruits, vegetables, and low-fat dairy",
-            "Limit alcohol consumption"
-        ],
-        "diabetes": [
-            "Regular blood glucose monitoring",
-            "Balanced diet with controlled carbohydrate intake",
-            "Regular physical activity for 150 minutes per week",
-            "Maintain healthy weight",
-            "Avoid smoking"
-        ],
-        "depression": [
-            "Regular physical exercise",
-            "Maintain regular sleep schedule",
-            "Consider psychotherapy or counseling",
-            "Social engagement and support networks",
-            "Mindfulness and stress reduction techniques"
-        ],
-        "anxiety": [
-            "Breathing exercises and meditation",
-            "Regular physical activity",
-            "Limit caffeine and alcohol",
-            "Adequate sleep",
-            "Consider cognitive behavioral therapy"
-        ],
-        "insomnia": [
-            "Consistent sleep schedule",
-            "Create relaxing bedtime routine",
-            "Avoid screens before bed",
-            "Make bedroom comfortable and dark",
-            "Avoid caffeine and large meals before bed"
-        ],
-        "asthma": [
-            "Identify and avoid triggers",
-            "Use air purifiers at home",
-            "Regular exercise with appropriate precautions",
-            "Maintain healthy weight",
-            "Annual flu vaccination"
-        ],
-        "allergies": [
-            "Identify and avoid allergens",
-            "HEPA filters for home",
-            "Keep windows closed during high pollen seasons",
-            "Regular cleaning to reduce dust and pet dander",
-            "Consider allergen covers for bedding"
-        ],
-        "migraine": [
-            "Identify and avoid personal triggers",
-            "Maintain regular sleep and meal schedule",
-            "Stress management techniques",
-            "Stay hydrated",
-            "Regular physical activity"
-        ],
-        "gerd": [
-            "Avoid lying down after eating",
-            "Elevate head of bed",
-            "Avoid trigger foods (spicy, acidic, fatty)",
-            "Smaller, more frequent meals",
-            "Maintain healthy weight"
-        ],
-        "hypercholesterolemia": [
-            "Mediterranean or DASH diet",
-            "Regular physical activity",
-            "Limit saturated and trans fats",
-            "Increase fiber intake",
-            "Maintain healthy weight"
-        ]
-    }
-    
-    return lifestyle_recommendations.get(condition, ["Maintain a balanced diet", "Regular physical activity", "Adequate sleep", "Stress management", "Regular medical check-ups"])
+    return list(get_knowledge_base().lifestyle_recommendations(condition))
 
 def get_monitoring_recommendations(condition):
     """Get monitoring recommendations based on condition"""
-    monitoring_recommendations = {
-        "hypertension": [
-            "Regular blood pressure checks",
-            "Monitor for medication side effects",
-            "Periodic kidney function tests",
-            "Regular physician follow-up",
-            "Home blood pressure monitoring if recommended"
-        ],
-        "diabetes": [
-            "Regular blood glucose monitoring",
-            "HbA1c testing every 3-6 months",
-            "Annual eye examination",
-            "Regular foot examinations",
-            "Kidney function monitoring"
-        ],
-        "depression": [
-            "Regular follow-up with healthcare provider",
-            "Monitor for side effects of medication",
-            "Track mood changes",
-            "Watch for warning signs of suicidal thoughts",
-            "Evaluate effectiveness of treatment"
-        ],
-        "anxiety": [
-            "Track anxiety symptoms and triggers",
-            "Monitor response to medication",
-            "Watch for side effects",
-            "Regular therapy sessions if applicable",
-            "Evaluate stress levels"
-        ]
-    }
-    
-    return monitoring_recommendations.get(condition, ["Regular follow-up with healthcare provider", "Monitor for medication side effects", "Track symptom changes", "Report any new symptoms promptly"])
+    return list(get_knowledge_base().monitoring_recommendations(condition))
 
 def get_dosing_guidance(medication, age_category, gender, condition):
     """Provide basic dosing guidance based on medication and patient factors"""
@@ -543,48 +823,639 @@ def get_dosing_guidance(medication, age_category, gender, condition):
     
     return standard_advice
 
+# Fill the table at startup rather than on the first request
+if RECOMMENDATION_MATRIX and not SCORING_WORKER:
+    matrix_for(get_knowledge_base(), _compute_recommendation)
+
+# Bodies past this size are refused before they are read; batch requests are the largest legitimate ones
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_REQUEST_BYTES", 4 * 1024 * 1024))
+
+# Per-client token buckets for the scoring endpoints; None when RATE_LIMIT_PER_SECOND=0
+rate_limiter = limiter_from_env()
+
+def _client_id():
+    """Key for the caller's rate-limit bucket"""
+    if RATE_LIMIT_CLIENT_HEADER:
+        forwarded = request.headers.get(RATE_LIMIT_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.remote_addr
+
+def rate_limited(view):
+    """Answer 429 without running the view once the caller's token bucket is empty"""
+    @functools.wraps(view)
+    def limited(*args, **kwargs):
+        if rate_limiter is not None:
+            retry_after = rate_limiter.acquire(_client_id())
+            if retry_after:
+                response = jsonify({"success": False, "error": "Too many requests, please retry shortly."})
+                response.status_code = 429
+                response.headers["Retry-After"] = str(math.ceil(retry_after))
+                return response
+        return view(*args, **kwargs)
+    return limited
+
+def _json_payload():
+    """The request's JSON body, or None when it is missing or malformed"""
+    with span("request.parse_json"):
+        return request.get_json(silent=True)
+
+def _invalid(error):
+    """Structured 400 for a ValidationError"""
+    return jsonify({"success": False, "error": str(error), "errors": error.errors}), 400
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"success": False, "error": f"Request body exceeds {app.config['MAX_CONTENT_LENGTH']} bytes."}), 413
+
+# Fingerprinted static bundles from `python assets.py build`; None serves the unbundled sources
+asset_manifest = load_manifest()
+
+# A fingerprinted file's content never changes, so clients may keep it for a year
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+@app.context_processor
+def _asset_urls():
+    """asset_urls(name) in templates: the URLs to load for a bundle in assets.BUNDLES"""
+    return {"asset_urls": lambda name: [url_for('serve_static', path=path) for path in asset_files(asset_manifest, name)]}
+
 @app.route('/')
 def home():
     return render_template('index.html')
 
 @app.route('/static/<path:path>')
 def serve_static(path):
-    return send_from_directory('static', path)
+    """Static files; fingerprinted bundles are sent precompressed and cached for good"""
+    built = asset_manifest.fingerprinted(path) if asset_manifest is not None else None
+    if built is None:
+        # The same URL may serve new content after a deploy, so clients revalidate it every time
+        response = send_from_directory('static', path)
+        response.cache_control.no_cache = True
+        return response
+    
+    digest, encodings = built
+    encoding = next((encoding for encoding in encodings if request.accept_encodings[encoding]), None)
+    # Each variant has its own validator, so a cached gzip body is never confirmed for a brotli request
+    response = send_from_directory('static', path + ASSET_ENCODINGS[encoding] if encoding else path,
+                                   mimetype=mimetypes.guess_type(path)[0], etag=f"{digest}-{encoding or 'identity'}",
+                                   max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+def explain_options(query):
+    """(return a trace in the response, sample it to the explain log) for a scoring request's query arguments"""
+    return query.get('explain') == '1', explain_log is not None and explain_log.sample()
+
+def attach_trace(endpoint, payload, trace, respond, sampled):
+    """Log a finished trace if it was sampled and add it to the response payload if it was asked for"""
+    if trace is not None:
+        if sampled:
+            explain_log.record(endpoint, trace)
+        if respond:
+            payload["explain"] = trace.as_json()
+    return payload
 
 @app.route('/api/analyze-symptoms', methods=['POST'])
+@rate_limited
 def api_analyze_symptoms():
     """API endpoint to analyze symptoms"""
-    data = request.json
-    symptom_text = data.get('symptoms', '')
+    started = time.perf_counter()
+    try:
+        symptom_text = symptom_text_from_payload(_json_payload())
+    except ValidationError as e:
+        return _invalid(e)
     
-    results = analyze_symptoms(symptom_text)
-    return jsonify({
-        "success": True if results else False,
-        "results": results
-    })
+    respond, sampled = explain_options(request.args)
+    with explain.recording(respond or sampled) as trace:
+        results = analyze_symptoms(symptom_text)
+    with span("request.serialize"):
+        response = jsonify(attach_trace("analyze-symptoms", {
+            "success": True if results else False,
+            "results": results
+        }, trace, respond, sampled))
+    metrics.observe_request("analyze-symptoms", time.perf_counter() - started)
+    return response
+
+@app.route('/api/analyze-symptoms/live', methods=['POST'])
+@rate_limited
+def api_analyze_symptoms_live():
+    """API endpoint to re-analyze symptom text on every edit, reusing the session's previous work"""
+    started = time.perf_counter()
+    data = _json_payload()
+    try:
+        symptom_text = symptom_text_from_payload(data)
+        session_id = data.get('sessionId')
+        if not isinstance(session_id, (str, type(None))):
+            raise ValidationError([{"field": "sessionId", "message": "Must be a string."}])
+    except ValidationError as e:
+        return _invalid(e)
+    
+    session_id, results = analyze_symptoms_live(session_id, symptom_text)
+    with span("request.serialize"):
+        response = jsonify({
+            "success": True if results else False,
+            "sessionId": session_id,
+            "results": results
+        })
+    metrics.observe_request("analyze-symptoms-live", time.perf_counter() - started)
+    return response
+
+@app.route('/api/analyze-symptoms/live/<session_id>', methods=['DELETE'])
+def api_end_symptom_session(session_id):
+    """Release a live analysis session once the client is done with it"""
+    return jsonify({"success": symptom_sessions.close(session_id)})
+
+def recommendation_args(data):
+    """Pull get_ai_recommendation arguments out of an API payload"""
+    return (
+        data.get('healthProblem', ''),
+        data.get('gender', 'adult'),
+        data.get('age', 30),
+        data.get('existingDrug', ''),
+        data.get('symptomText', '')
+    )
+
+RESPONSE_FORMATS = ("full", "compact")
+
+def _json_body(body, status=200):
+    """Response for an already encoded JSON body"""
+    return app.response_class(body, status=status, mimetype="application/json")
+
+def _compressed(response):
+    """Compress a large response body as the client's Accept-Encoding allows"""
+    body, encoding = compress(response.get_data(), request.accept_encodings)
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
 
 @app.route('/api/ai-recommendation', methods=['POST'])
+@rate_limited
 def api_ai_recommendation():
     """API endpoint to get AI-powered medication recommendation"""
-    data = request.json
-    health_condition = data.get('healthProblem', '')
-    gender = data.get('gender', 'adult')
-    age = data.get('age', 30)
-    existing_drug = data.get('existingDrug', '')
-    symptom_text = data.get('symptomText', '')
-    
-    recommendation = get_ai_recommendation(
-        health_condition, 
-        gender, 
-        age, 
-        existing_drug, 
-        symptom_text
-    )
+    started = time.perf_counter()
+    response_format = request.args.get('format', 'full')
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({"success": False, "error": f"Unknown format '{response_format}'; expected full or compact."}), 400
+    data = _json_payload()
+    try:
+        req = RecommendationRequest.from_payload(data)
+    except ValidationError as e:
+        return _invalid(e)
+    
+    respond, sampled = explain_options(request.args)
+    with explain.recording(respond or sampled) as trace:
+        recommendation = recommend(req)
+    metrics.count_recommendation(_condition_label(recommendation))
+    if recommendation_store is not None:
+        recommendation_store.record(req, recommendation, data)
+    
+    with span("request.serialize"):
+        payload = {"success": True, "recommendation": recommendation}
+        if response_format == "compact":
+            dictionary = dictionary_for(get_knowledge_base(), get_dosing_guidance)
+            payload["recommendation"] = dictionary.compact(recommendation)
+        body = dumps(attach_trace("ai-recommendation", payload, trace, respond, sampled))
+        response = _json_body(body)
+    metrics.observe_request("ai-recommendation", time.perf_counter() - started)
+    return response
+
+# Upper bound on records per batch request; larger jobs should be chunked
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 10000))
+
+@app.route('/api/ai-recommendation/batch', methods=['POST'])
+@rate_limited
+def api_ai_recommendation_batch():
+    """API endpoint to score an array of patient records in one request"""
+    started = time.perf_counter()
+    response_format = request.args.get('format', 'full')
+    if response_format not in RESPONSE_FORMATS:
+        return jsonify({"success": False, "error": f"Unknown format '{response_format}'; expected full or compact."}), 400
+    data = _json_payload()
+    patients = data.get('patients') if isinstance(data, dict) else data
+    
+    if not isinstance(patients, list):
+        return jsonify({
+            "success": False,
+            "error": "Expected a JSON array of patient records or an object with a 'patients' array."
+        }), 400
+    if len(patients) > MAX_BATCH_SIZE:
+        return jsonify({
+            "success": False,
+            "error": f"Batch too large: {len(patients)} records (maximum {MAX_BATCH_SIZE})."
+        }), 400
+    
+    results = get_ai_recommendations_batch(patients)
+    for patient, result in zip(patients, results):
+        metrics.count_recommendation(_condition_label(result.get("recommendation")))
+        if recommendation_store is not None and result["success"]:
+            # Validated once already; the record stores the normalized fields
+            recommendation_store.record(RecommendationRequest.from_payload(patient), result["recommendation"], patient)
+    
+    with span("request.serialize"):
+        if response_format == "compact":
+            dictionary = dictionary_for(get_knowledge_base(), get_dosing_guidance)
+            body = dumps({
+                "success": True,
+                "results": [dict(result, recommendation=dictionary.compact(result["recommendation"]))
+                            if result["success"] else result for result in results]
+            })
+        else:
+            body = dumps({"success": True, "results": results})
+        response = _compressed(_json_body(body))
+    metrics.observe_request("ai-recommendation-batch", time.perf_counter() - started)
+    return response
+
+# How long clients may reuse the compact-format dictionary without revalidating
+DICTIONARY_MAX_AGE = int(os.environ.get("DICTIONARY_MAX_AGE", 86400))
+
+@app.route('/api/dictionary', methods=['GET'])
+def api_dictionary():
+    """Names and strings that ?format=compact responses refer to by id"""
+    dictionary = dictionary_for(get_knowledge_base(), get_dosing_guidance)
+    response = _compressed(_json_body(dictionary.body))
+    # One version per knowledge base; each encoding is a distinct representation
+    encoding = response.headers.get("Content-Encoding")
+    response.set_etag(f"{dictionary.version}-{encoding}" if encoding else dictionary.version)
+    response.cache_control.public = True
+    response.cache_control.max_age = DICTIONARY_MAX_AGE
+    return response.make_conditional(request)
+
+@app.route('/api/check-interactions', methods=['POST'])
+@rate_limited
+def api_check_interactions():
+    """API endpoint to check a full medication list for drug-drug and class-level interactions"""
+    started = time.perf_counter()
+    data = _json_payload()
+    
+    try:
+        medications = parse_medications(data.get('medications') if isinstance(data, dict) else data)
+        candidates = parse_medications(data.get('candidates')) if isinstance(data, dict) else []
+    except TypeError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not medications:
+        return jsonify({
+            "success": False,
+            "error": "Expected a 'medications' list or comma-separated string of drug names."
+        }), 400
     
+    with span("interactions.check"):
+        interactions = get_knowledge_base().interactions.check(medications, candidates)
+    with span("request.serialize"):
+        response = jsonify({
+            "success": True,
+            "medications": medications,
+            "interactions": interactions,
+            "has_high_severity": any(interaction["severity"] == "high" for interaction in interactions)
+        })
+    metrics.observe_request("check-interactions", time.perf_counter() - started)
+    return response
+
+# How long browsers may reuse an autocomplete answer
+AUTOCOMPLETE_MAX_AGE = int(os.environ.get("AUTOCOMPLETE_MAX_AGE", 3600))
+
+@app.route('/api/autocomplete', methods=['GET'])
+def api_autocomplete():
+    """Ranked condition/medication name suggestions for a typed prefix"""
+    started = time.perf_counter()
+    kind = request.args.get('type', 'all')
+    indexes = indexes_for(get_knowledge_base())
+    if kind not in indexes:
+        return jsonify({"success": False, "error": f"Unknown type '{kind}'; expected condition, medication or all."}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 10)), AUTOCOMPLETE_MAX_LIMIT))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    index = indexes[kind]
+    query = normalize_query(request.args.get('q', ''))
+    with span("autocomplete.search"):
+        matches = index.search(query, limit)
+    
+    # The answer depends only on the URL and the index contents, so the index version is a valid ETag
+    response = jsonify({
+        "success": True,
+        "query": query,
+        "results": [{"name": name, "type": match_kind} for name, match_kind in matches]
+    })
+    response.set_etag(index.version)
+    response.cache_control.public = True
+    response.cache_control.max_age = AUTOCOMPLETE_MAX_AGE
+    response = response.make_conditional(request)
+    metrics.observe_request("autocomplete", time.perf_counter() - started)
+    return response
+
+# Largest page of waiting patients returned at once
+WAITLIST_MAX_PAGE = 1000
+# Deepest page start; a page walks the heap down to offset + limit under the waitlist lock
+WAITLIST_MAX_OFFSET = 10000
+
+def _waitlist_assessment(data, req):
+    """Recommendation for a waitlist payload plus the entry fields derived from it, as admit() takes them"""
+    recommendation = recommend(req)
+    metrics.count_recommendation(_condition_label(recommendation))
+    if recommendation_store is not None:
+        recommendation_store.record(req, recommendation, data)
+    return recommendation, {
+        "urgency": urgency_for(recommendation),
+        "condition": None if recommendation.get("error") else recommendation["primary_condition"],
+        "age": req.age,
+        "gender": req.gender,
+        "dangerous_interaction": bool((recommendation.get("safety") or {}).get("has_dangerous_interaction")),
+    }
+
+def _waitlist_missing(entry_id):
+    return jsonify({"success": False, "error": f"No waiting patient with id {entry_id}."}), 404
+
+@app.route('/api/waitlist', methods=['POST'])
+@rate_limited
+def api_waitlist_admit():
+    """Assess a patient and add them to the waitlist at the urgency their assessment implies"""
+    data = _json_payload()
+    try:
+        req = RecommendationRequest.from_payload(data)
+        reference = waitlist_reference_from_payload(data)
+    except ValidationError as e:
+        return _invalid(e)
+    
+    recommendation, assessment = _waitlist_assessment(data, req)
+    try:
+        entry = waitlist.admit(reference=reference, **assessment)
+    except WaitlistFull as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({"success": True, "entry": entry, "recommendation": recommendation}), 201
+
+@app.route('/api/waitlist', methods=['GET'])
+def api_waitlist():
+    """Waiting patients in priority order, a page at a time"""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), WAITLIST_MAX_PAGE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if offset > WAITLIST_MAX_OFFSET:
+        return jsonify({"success": False, "error": f"offset must be at most {WAITLIST_MAX_OFFSET}."}), 400
     return jsonify({
         "success": True,
-        "recommendation": recommendation
+        "total": len(waitlist),
+        "offset": offset,
+        "results": waitlist.page(offset, limit)
     })
 
+@app.route('/api/waitlist/next', methods=['POST'])
+def api_waitlist_next():
+    """Take the most urgent patient off the waitlist"""
+    return jsonify({"success": True, "entry": waitlist.pop()})
+
+@app.route('/api/waitlist/<int:entry_id>', methods=['GET'])
+def api_waitlist_entry(entry_id):
+    entry = waitlist.get(entry_id)
+    if entry is None:
+        return _waitlist_missing(entry_id)
+    return jsonify({"success": True, "entry": entry})
+
+@app.route('/api/waitlist/<int:entry_id>', methods=['PATCH'])
+@rate_limited
+def api_waitlist_update(entry_id):
+    """Set a waiting patient's urgency with {"urgency": n}, or re-assess them from a new patient payload"""
+    data = _json_payload()
+    if waitlist.get(entry_id) is None:
+        # Checked first so an unknown id costs no assessment
+        return _waitlist_missing(entry_id)
+    urgency = None
+    try:
+        if isinstance(data, dict) and "urgency" in data:
+            urgency = urgency_from_payload(data)
+        else:
+            req = RecommendationRequest.from_payload(data)
+    except ValidationError as e:
+        return _invalid(e)
+    
+    if urgency is not None:
+        entry = waitlist.reprioritize(entry_id, urgency)
+        response = {"success": True, "entry": entry}
+    else:
+        recommendation, assessment = _waitlist_assessment(data, req)
+        entry = waitlist.reassess(entry_id, **assessment)
+        response = {"success": True, "entry": entry, "recommendation": recommendation}
+    if entry is None:
+        # Taken off the waitlist in the meantime
+        return _waitlist_missing(entry_id)
+    return jsonify(response)
+
+@app.route('/api/waitlist/<int:entry_id>', methods=['DELETE'])
+def api_waitlist_remove(entry_id):
+    entry = waitlist.remove(entry_id)
+    if entry is None:
+        return _waitlist_missing(entry_id)
+    return jsonify({"success": True, "entry": entry})
+
+# Largest number of occurrences /api/reminders/due returns at once
+REMINDER_MAX_RESULTS = 10000
+
+def _reminder_missing(reminder_id):
+    return jsonify({"success": False, "error": f"No reminder with id {reminder_id}."}), 404
+
+@app.route('/api/reminders', methods=['POST'])
+@rate_limited
+def api_reminder_add():
+    """Store a patient's medication reminder"""
+    try:
+        fields = reminder_from_payload(_json_payload())
+    except ValidationError as e:
+        return _invalid(e)
+    try:
+        reminder = reminders.add(**fields)
+    except RemindersFull as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    return jsonify({"success": True, "reminder": reminder}), 201
+
+@app.route('/api/reminders', methods=['GET'])
+def api_reminders():
+    """A patient's reminders by time of day"""
+    patient_id = request.args.get('patientId')
+    if not patient_id:
+        return jsonify({"success": False, "error": "patientId is required."}), 400
+    return jsonify({"success": True, "results": reminders.for_patient(patient_id)})
+
+@app.route('/api/reminders/due', methods=['GET'])
+def api_reminders_due():
+    """Reminder occurrences due in the next ?window= minutes (default 60), earliest first"""
+    try:
+        window = int(request.args.get('window', 60))
+        limit = max(1, min(int(request.args.get('limit', 1000)), REMINDER_MAX_RESULTS))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    if not 1 <= window <= REMINDER_MAX_WINDOW:
+        return jsonify({"success": False, "error": f"window must be between 1 and {REMINDER_MAX_WINDOW} minutes."}), 400
+    
+    occurrences, truncated = reminders.due(window, patient_id=request.args.get('patientId'), limit=limit)
+    return jsonify({
+        "success": True,
+        "window": window,
+        "truncated": truncated,
+        "results": occurrences
+    })
+
+@app.route('/api/reminders/<int:reminder_id>', methods=['GET'])
+def api_reminder(reminder_id):
+    reminder = reminders.get(reminder_id)
+    if reminder is None:
+        return _reminder_missing(reminder_id)
+    return jsonify({"success": True, "reminder": reminder})
+
+@app.route('/api/reminders/<int:reminder_id>', methods=['PUT'])
+@rate_limited
+def api_reminder_update(reminder_id):
+    """Replace a reminder's schedule; it keeps its id"""
+    try:
+        fields = reminder_from_payload(_json_payload())
+    except ValidationError as e:
+        return _invalid(e)
+    reminder = reminders.update(reminder_id, **fields)
+    if reminder is None:
+        return _reminder_missing(reminder_id)
+    return jsonify({"success": True, "reminder": reminder})
+
+@app.route('/api/reminders/<int:reminder_id>', methods=['DELETE'])
+def api_reminder_remove(reminder_id):
+    reminder = reminders.remove(reminder_id)
+    if reminder is None:
+        return _reminder_missing(reminder_id)
+    return jsonify({"success": True, "reminder": reminder})
+
+@app.route('/api/reports/recommendations', methods=['GET'])
+def api_report_recommendations():
+    """Recorded recommendations filtered by condition and patient attributes"""
+    if recommendation_store is None:
+        return jsonify({"success": False, "error": "Recommendation recording is disabled."}), 404
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = datetime.fromisoformat(request.args['until']) if request.args.get('until') else None
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        offset = int(request.args.get('offset', 0))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    
+    rows = recommendation_store.find(
+        condition=request.args.get('condition'),
+        gender=request.args.get('gender'),
+        age_category=request.args.get('ageCategory'),
+        existing_drug=request.args.get('existingDrug'),
+        since=since,
+        until=until,
+        limit=limit,
+        offset=offset
+    )
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat()
+        row["request"] = json.loads(row.pop("request_json"))
+        row["response"] = json.loads(row.pop("response_json"))
+    return jsonify({"success": True, "results": rows})
+
+@app.route('/api/reports/conditions', methods=['GET'])
+def api_report_conditions():
+    """Recorded request counts per condition"""
+    if recommendation_store is None:
+        return jsonify({"success": False, "error": "Recommendation recording is disabled."}), 404
+    try:
+        since = datetime.fromisoformat(request.args['since']) if request.args.get('since') else None
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({"success": True, "results": recommendation_store.condition_summary(since)})
+
+def _condition_label(recommendation):
+    """Bounded metrics label for a recommendation's condition"""
+    if not recommendation or recommendation.get("error"):
+        return "none"
+    return recommendation["primary_condition"]
+
+def _cache_metrics():
+    """Hit/miss/eviction counters and hit rate of the response caches, read at scrape time"""
+    for cache in (symptom_cache, recommendation_cache):
+        if cache is None:
+            continue
+        stats = cache.stats()
+        labels = (("cache", cache.name),)
+        yield "waitlistwizard_cache_hits_total", "counter", labels, stats["hits"]
+        yield "waitlistwizard_cache_misses_total", "counter", labels, stats["misses"]
+        yield "waitlistwizard_cache_evictions_total", "counter", labels, stats["evictions"]
+        yield "waitlistwizard_cache_hit_ratio", "gauge", labels, stats["hit_rate"]
+        yield "waitlistwizard_cache_entries", "gauge", labels, stats["size"]
+
+metrics.registry.register_collector(_cache_metrics)
+
+def _session_metrics():
+    """Live symptom-analysis session counts and memory, read at scrape time"""
+    stats = symptom_sessions.stats()
+    yield "waitlistwizard_symptom_sessions", "gauge", (), stats["sessions"]
+    yield "waitlistwizard_symptom_session_bytes", "gauge", (), stats["bytes"]
+    yield "waitlistwizard_symptom_session_evictions_total", "counter", (), stats["evictions"]
+
+metrics.registry.register_collector(_session_metrics)
+
+def _waitlist_metrics():
+    """Waitlist size and memory, read at scrape time"""
+    yield "waitlistwizard_waitlist_entries", "gauge", (), len(waitlist)
+    yield "waitlistwizard_waitlist_bytes", "gauge", (), waitlist.nbytes()
+
+metrics.registry.register_collector(_waitlist_metrics)
+
+def _reminder_metrics():
+    """Stored reminder count and index memory, read at scrape time"""
+    yield "waitlistwizard_reminders", "gauge", (), len(reminders)
+    yield "waitlistwizard_reminder_bytes", "gauge", (), reminders.nbytes()
+
+metrics.registry.register_collector(_reminder_metrics)
+
+# Sampled, anonymized request log for replay load tests; None unless TRAFFIC_CAPTURE_PATH is set
+traffic_capture = capture_from_env(symptom_matcher, FUZZY_MAX_DISTANCE)
+
+if traffic_capture is not None:
+    app.wsgi_app = traffic_capture.middleware(app.wsgi_app)
+    metrics.registry.register_collector(traffic_capture.metrics)
+
+# Sampled explain traces of scoring requests; None unless EXPLAIN_LOG_PATH is set
+explain_log = explain_log_from_env()
+
+if explain_log is not None:
+    metrics.registry.register_collector(explain_log.metrics)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint for this worker's timing histograms and counters"""
+    return metrics.registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+# Opt-in per-request profiling: with PROFILE_REQUESTS=1, a request carrying an
+# X-Profile header gets a cProfile dump instead of its normal response
+# ("X-Profile: raw" returns marshalled pstats data loadable with pstats/snakeviz).
+PROFILE_REQUESTS = os.environ.get("PROFILE_REQUESTS") == "1"
+
+if PROFILE_REQUESTS:
+    @app.before_request
+    def start_request_profiler():
+        if request.headers.get("X-Profile"):
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+    
+    @app.after_request
+    def return_request_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        if request.headers.get("X-Profile") == "raw":
+            profiler.create_stats()
+            return app.response_class(marshal.dumps(profiler.stats), mimetype="application/octet-stream",
+                                      headers={"Content-Disposition": "attachment; filename=request.prof"})
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(50)
+        return app.response_class(output.getvalue(), mimetype="text/plain")
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""In-process timing spans, histograms and counters exposed in Prometheus text format.
+
+Metrics are per process; under gunicorn each worker reports its own series.
+Set METRICS_ENABLED=0 to turn every span into a shared no-op.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+# Latency buckets in seconds, from sub-10µs stages up to slow requests
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001,
+                   0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.total, self.count
+
+
+class Registry:
+    """Named histograms and counters, each keyed by a tuple of label pairs"""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def histogram(self, name, labels=()):
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collect):
+        """Add a callable returning [(name, type, labels, value)] sampled at scrape time"""
+        self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in Prometheus text exposition format"""
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        # Copied under the lock: histogram() may add a key while this iterates
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        # Samples of one metric family must be contiguous in the exposition
+        collected = [sample for collect in self._collectors for sample in collect()]
+        for name, kind, labels, value in sorted(collected, key=lambda sample: sample[0]):
+            header(name, kind)
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+registry = Registry()
+registry.describe("waitlistwizard_stage_seconds", "Time spent in each scoring stage")
+registry.describe("waitlistwizard_request_seconds", "API request latency by endpoint")
+registry.describe("waitlistwizard_recommendations_total", "Recommendations served by primary condition")
+
+
+class _Span:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+_stage_histograms = {}
+
+
+def span(stage):
+    """Time a block into the stage histogram; a shared no-op when metrics are disabled"""
+    if not ENABLED:
+        return _NULL_SPAN
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = registry.histogram(
+            "waitlistwizard_stage_seconds", (("stage", stage),))
+    return _Span(histogram)
+
+
+def observe_request(endpoint, seconds):
+    if ENABLED:
+        registry.histogram("waitlistwizard_request_seconds", (("endpoint", endpoint),)).observe(seconds)
+
+
+def count_recommendation(condition):
+    if ENABLED:
+        registry.inc("waitlistwizard_recommendations_total", (("condition", condition),))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
@@ -0,0 +1,67 @@
+"""Per-client token-bucket rate limiting for the scoring endpoints.
+
+Each client gets a bucket of RATE_LIMIT_BURST tokens refilled at
+RATE_LIMIT_PER_SECOND; a request takes one token or is answered 429 with a
+Retry-After. Buckets live in the worker process, so with N workers a client
+can reach up to N times the rate; the limit exists to stop one client from
+monopolizing a worker, not as a global quota.
+
+Clients are identified by their socket address. Behind a trusted proxy, set
+RATE_LIMIT_CLIENT_HEADER (e.g. X-Real-IP) to key buckets on the address the
+proxy reports instead.
+
+Settings:
+    RATE_LIMIT_PER_SECOND     sustained requests per second per client, default 20; 0 disables limiting
+    RATE_LIMIT_BURST          requests a client may make at once, default 60
+    RATE_LIMIT_CLIENT_HEADER  header holding the client address, default none
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Buckets tracked at once; the least recently seen client is forgotten first
+MAX_CLIENTS = 100000
+
+
+class RateLimiter:
+    """Token buckets keyed by client id"""
+
+    def __init__(self, rate, burst, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        # client -> (tokens, time of last refill)
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def acquire(self, client):
+        """Take a token; returns 0 if allowed, else the seconds until one is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[client] = (tokens - 1, now)
+                retry_after = 0
+            else:
+                self._buckets[client] = (tokens, now)
+                self.rejected += 1
+                retry_after = (1 - tokens) / self.rate
+            self._buckets.move_to_end(client)
+            # A forgotten client comes back with a full bucket, which is what an idle one would have
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return retry_after
+
+
+CLIENT_HEADER = os.environ.get("RATE_LIMIT_CLIENT_HEADER")
+
+
+def limiter_from_env():
+    """RateLimiter configured from RATE_LIMIT_* environment variables, or None when disabled"""
+    rate = float(os.environ.get("RATE_LIMIT_PER_SECOND", 20))
+    if rate <= 0:
+        return None
+    return RateLimiter(rate, float(os.environ.get("RATE_LIMIT_BURST", 60)))
@@ -0,0 +1,120 @@
+"""Precomputed recommendations for every condition and patient profile.
+
+Without symptom text or existing medications, get_ai_recommendation depends
+only on the condition, the age category and the gender's adjustment rules
+(genders without rules all score alike). With RECOMMENDATION_MATRIX=1 each of
+those answers is computed once per knowledge base and served by index, and
+only the timestamp and the echoed patient fields are filled in per request.
+Existing medications are not a table dimension: the interaction report echoes
+the names the caller gave, so those requests take the live path, as requests
+with symptom text do.
+
+    python recommendation_matrix.py      # verify the table against the live code
+"""
+import argparse
+import sys
+
+from validation import RecommendationRequest
+
+# An age inside each category, used to compute that category's entries
+REPRESENTATIVE_AGES = {"pediatric": 10, "adult": 30, "elderly": 70}
+
+# Ages checked against the live code, including both sides of each category boundary
+CHECK_AGES = (0, 10, 17, 18, 30, 64, 65, 90, "40")
+
+
+class RecommendationMatrix:
+    """Recommendations indexed by condition id and profile id"""
+
+    def __init__(self, kb, compute):
+        # compute: the live scoring function, main._compute_recommendation
+        self.fingerprint = kb.fingerprint
+        self._profiles = len(kb.profile_ids)
+        table = [None] * (len(kb.condition_ids) * self._profiles)
+        for condition, c in kb.condition_ids.items():
+            # Conditions without medications answer with an error; those stay live
+            if not kb.medications_for(condition):
+                continue
+            for (age_category, gender), p in kb.profile_ids.items():
+                request = RecommendationRequest(condition, gender, REPRESENTATIVE_AGES[age_category], "", "")
+                table[c * self._profiles + p] = compute(kb, request)
+        self._table = tuple(table)
+
+    def __len__(self):
+        return sum(entry is not None for entry in self._table)
+
+    def lookup(self, kb, req):
+        """Precomputed recommendation for a RecommendationRequest, or None when it must be computed live.
+
+        The entry is shared and must not be mutated; its patient fields belong to
+        the representative profile, so callers restamp them.
+        """
+        try:
+            c = kb.condition_ids.get(req.condition)
+            if c is None:
+                return None
+            p = kb.profile_id(req.age_category, req.gender)
+        except (TypeError, ValueError, AttributeError):
+            # Malformed inputs take the live path, which answers them as it always has
+            return None
+        return self._table[c * self._profiles + p]
+
+
+_built = None
+
+
+def matrix_for(kb, compute):
+    """Matrix for a knowledge base, rebuilt only when its fingerprint changes"""
+    global _built
+    matrix = _built
+    if matrix is None or matrix.fingerprint != kb.fingerprint:
+        matrix = _built = RecommendationMatrix(kb, compute)
+    return matrix
+
+
+def _without_timestamp(recommendation):
+    return {key: value for key, value in recommendation.items() if key != "timestamp"}
+
+
+def check(main_module, ages=CHECK_AGES):
+    """Every difference between served table entries and the live code, as readable lines"""
+    kb = main_module.get_knowledge_base()
+    matrix = RecommendationMatrix(kb, main_module._compute_recommendation)
+    genders = list(kb.tables["gender_adjustment"]) + ["unspecified", None]
+    problems = []
+    for condition in kb.condition_ids:
+        for health_condition in (condition, condition.title()):
+            for gender in genders:
+                for age in ages:
+                    inputs = f"{health_condition!r}, {gender!r}, {age!r}"
+                    live = main_module._compute_recommendation(
+                        kb, RecommendationRequest(health_condition, gender, age, "", ""))
+                    request = RecommendationRequest(health_condition, gender, age, "", "")
+                    served = matrix.lookup(kb, request)
+                    if served is None:
+                        if not live.get("error"):
+                            problems.append(f"{inputs}: no table entry")
+                        continue
+                    served = main_module._restamp_recommendation(served, request)
+                    if _without_timestamp(served) != _without_timestamp(live):
+                        problems.append(f"{inputs}: table entry differs from the live recommendation")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the precomputed recommendation table against the live scoring code.")
+    parser.parse_args(argv)
+
+    import main as main_module
+
+    problems = check(main_module)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    matrix = matrix_for(main_module.get_knowledge_base(), main_module._compute_recommendation)
+    print(f"{len(matrix)} table entries checked against {len(CHECK_AGES)} ages each: {len(problems)} mismatches",
+          file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
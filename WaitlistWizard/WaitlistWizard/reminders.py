@@ -0,0 +1,399 @@
+"""Server-side medication reminders with a precomputed index of due times.
+
+Reminders recur weekly, as the patient app's reminder form defines them: a
+time of day plus daily, weekdays, weekends or a custom set of days. Every
+active reminder sits in one bucket of a time wheel with a bucket per minute of
+the day and carries a bitmask of its weekdays, so the occurrences due in a
+window are read off the buckets the window covers, without looking at any
+other reminder. Adding, changing, pausing or deleting a reminder moves it
+between buckets in place. Reminders live column-wise in typed arrays, a few
+dozen bytes each plus their patient id, so hundreds of thousands of patients
+fit in one process.
+
+Times of day are wall-clock times in REMINDER_TIMEZONE. Like the waitlist,
+the schedule lives in the serving process: run a single worker process, and
+set REMINDER_SNAPSHOT_PATH to keep reminders across restarts. As for the
+waitlist, only the process that changed the schedule writes the snapshot.
+
+Settings:
+    REMINDER_MAX_ENTRIES       most reminders stored at once, default 2000000
+    REMINDER_TIMEZONE          IANA time zone of reminder times, default UTC
+    REMINDER_SNAPSHOT_PATH     snapshot file, default none (not persisted)
+    REMINDER_SNAPSHOT_SECONDS  longest a change waits to be snapshotted, default 60
+"""
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from validation import DAY_NAMES, REPEAT_PATTERNS
+from waitlist import Snapshots
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 2000000
+MINUTES_PER_DAY = 24 * 60
+# A week covers every occurrence of every reminder once
+MAX_WINDOW_MINUTES = 7 * MINUTES_PER_DAY
+
+MAGIC = b"WWRM"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHxxQQI")
+
+# An id is generation << 32 | slot, as for waitlist entries
+_SLOT_BITS = 32
+_GENERATIONS = 1 << 21
+
+_FREE, _ACTIVE, _PAUSED = 0, 1, 2
+
+# Weekday bitmask of each fixed pattern, bit n for datetime.weekday() n
+_PATTERN_DAYS = {"daily": 0b1111111, "weekdays": 0b0011111, "weekends": 0b1100000}
+
+# Column name -> array typecode; every column holds one item per slot
+_COLUMNS = (
+    ("generation", "I"),
+    ("state", "B"),
+    ("minute", "H"),
+    ("days", "B"),
+    ("pattern", "B"),
+    ("patient", "I"),
+    ("medication", "I"),
+    ("dosage", "I"),
+    ("created", "d"),
+)
+
+
+class RemindersFull(Exception):
+    """Raised when adding a reminder would exceed the schedule's max_entries"""
+
+
+def _days_mask(repeat_pattern, selected_days):
+    if repeat_pattern == "custom":
+        return sum(1 << DAY_NAMES.index(day) for day in set(selected_days))
+    return _PATTERN_DAYS[repeat_pattern]
+
+
+def _intern(values, free, value):
+    """Store value in a freed index of values, or a new one at the end; returns its index"""
+    if free:
+        index = free.pop()
+        values[index] = value
+    else:
+        index = len(values)
+        values.append(value)
+    return index
+
+
+class ReminderSchedule:
+    """Weekly reminders over per-slot typed arrays, indexed by minute of the day"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, tz=timezone.utc):
+        self.max_entries = max_entries
+        self.tz = tz
+        self._columns = []
+        for name, typecode in _COLUMNS:
+            column = array(typecode)
+            setattr(self, f"_{name}", column)
+            self._columns.append(column)
+        self._free = array("I")
+        # Active slots by minute of the day, each bucket in slot order
+        self._wheel = [array("I") for _ in range(MINUTES_PER_DAY)]
+        # Patient ids, medications and dosages are stored once and referenced by index;
+        # an index is freed (its entry set to None) when no reminder refers to it any more
+        self._patients = []
+        self._patient_index = {}
+        self._patient_free = []
+        self._strings = []
+        self._string_index = {}
+        self._string_refs = array("I")
+        self._string_free = []
+        # Slots of each patient's reminders, by patient index
+        self._by_patient = {}
+        self._count = 0
+        # Bumped on every change, so snapshots are only written when something changed
+        self.changes = 0
+        # Snapshots of this schedule, started by its first change in each process; None when not persisted
+        self.snapshots = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def _changed(self):
+        self.changes += 1
+        if self.snapshots is not None:
+            self.snapshots.ensure_started()
+
+    def nbytes(self):
+        """Approximate memory held by the columns and indexes, excluding the strings"""
+        arrays = self._columns + self._wheel + list(self._by_patient.values()) + [self._free, self._string_refs]
+        return sum(column.itemsize * column.buffer_info()[1] for column in arrays)
+
+    def _slot(self, reminder_id):
+        """Slot of a stored reminder, or None for unknown and deleted ids"""
+        if not isinstance(reminder_id, int) or reminder_id < 0:
+            return None
+        slot = reminder_id & ((1 << _SLOT_BITS) - 1)
+        if slot >= len(self._state) or self._state[slot] == _FREE or \
+                self._generation[slot] != reminder_id >> _SLOT_BITS:
+            return None
+        return slot
+
+    def _string_id(self, value):
+        """Index of an interned string, taking one reference to it"""
+        index = self._string_index.get(value)
+        if index is None:
+            index = self._string_index[value] = _intern(self._strings, self._string_free, value)
+            if index == len(self._string_refs):
+                self._string_refs.append(0)
+        self._string_refs[index] += 1
+        return index
+
+    def _release_string(self, index):
+        self._string_refs[index] -= 1
+        if not self._string_refs[index]:
+            del self._string_index[self._strings[index]]
+            self._strings[index] = None
+            self._string_free.append(index)
+
+    def _patient_id(self, patient_id):
+        index = self._patient_index.get(patient_id)
+        if index is None:
+            index = self._patient_index[patient_id] = _intern(self._patients, self._patient_free, patient_id)
+        return index
+
+    def _entry(self, slot):
+        minute = self._minute[slot]
+        pattern = REPEAT_PATTERNS[self._pattern[slot]]
+        days = self._days[slot]
+        return {
+            "id": self._generation[slot] << _SLOT_BITS | slot,
+            "patient_id": self._patients[self._patient[slot]],
+            "medication": self._strings[self._medication[slot]],
+            "dosage": self._strings[self._dosage[slot]],
+            "time": f"{minute // 60:02d}:{minute % 60:02d}",
+            "repeat_pattern": pattern,
+            "selected_days": [day for i, day in enumerate(DAY_NAMES) if days >> i & 1] if pattern == "custom" else [],
+            "is_active": self._state[slot] == _ACTIVE,
+            "created_at": datetime.fromtimestamp(self._created[slot]).isoformat(),
+        }
+
+    def _schedule(self, slot, medication, minute, repeat_pattern, selected_days, dosage, active):
+        """Set a slot's schedule and put it on the wheel if it is active"""
+        self._medication[slot] = self._string_id(medication)
+        self._dosage[slot] = self._string_id(dosage)
+        self._minute[slot] = minute
+        self._pattern[slot] = REPEAT_PATTERNS.index(repeat_pattern)
+        self._days[slot] = _days_mask(repeat_pattern, selected_days)
+        self._state[slot] = _ACTIVE if active else _PAUSED
+        if active:
+            insort(self._wheel[minute], slot)
+
+    def _unschedule(self, slot):
+        """Take a slot off the wheel and drop its references to its strings"""
+        if self._state[slot] == _ACTIVE:
+            bucket = self._wheel[self._minute[slot]]
+            del bucket[bisect_left(bucket, slot)]
+        self._release_string(self._medication[slot])
+        self._release_string(self._dosage[slot])
+
+    def _assign(self, slot, patient_id):
+        patient = self._patient_id(patient_id)
+        self._patient[slot] = patient
+        self._by_patient.setdefault(patient, array("I")).append(slot)
+
+    def _unassign(self, slot):
+        patient = self._patient[slot]
+        slots = self._by_patient[patient]
+        slots.remove(slot)
+        if not slots:
+            # The patient's last reminder is gone, so is the patient id
+            del self._by_patient[patient]
+            del self._patient_index[self._patients[patient]]
+            self._patients[patient] = None
+            self._patient_free.append(patient)
+
+    def add(self, patient_id, medication, minute, repeat_pattern="daily", selected_days=(), dosage="", active=True):
+        """Store a reminder at minute of the day; returns its entry. Arguments as validation.reminder_from_payload."""
+        with self._lock:
+            if self._count >= self.max_entries:
+                raise RemindersFull(f"The reminder schedule is full ({self.max_entries} reminders).")
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._state)
+                for column in self._columns:
+                    column.append(0)
+            self._schedule(slot, medication, minute, repeat_pattern, selected_days, dosage, active)
+            self._assign(slot, patient_id)
+            self._created[slot] = time.time()
+            self._count += 1
+            self._changed()
+            return self._entry(slot)
+
+    def get(self, reminder_id):
+        """Entry of a stored reminder, or None"""
+        with self._lock:
+            slot = self._slot(reminder_id)
+            return None if slot is None else self._entry(slot)
+
+    def update(self, reminder_id, patient_id, medication, minute, repeat_pattern="daily", selected_days=(),
+               dosage="", active=True):
+        """Replace a reminder's schedule, as add() takes it, keeping its id; None if it was deleted"""
+        with self._lock:
+            slot = self._slot(reminder_id)
+            if slot is None:
+                return None
+            self._unschedule(slot)
+            self._schedule(slot, medication, minute, repeat_pattern, selected_days, dosage, active)
+            if self._patients[self._patient[slot]] != patient_id:
+                self._unassign(slot)
+                self._assign(slot, patient_id)
+            self._changed()
+            return self._entry(slot)
+
+    def remove(self, reminder_id):
+        """Delete a reminder; returns its entry, or None if it was already deleted"""
+        with self._lock:
+            slot = self._slot(reminder_id)
+            if slot is None:
+                return None
+            entry = self._entry(slot)
+            self._unschedule(slot)
+            self._unassign(slot)
+            self._state[slot] = _FREE
+            self._generation[slot] = (self._generation[slot] + 1) % _GENERATIONS
+            self._free.append(slot)
+            self._count -= 1
+            self._changed()
+            return entry
+
+    def for_patient(self, patient_id):
+        """A patient's reminders by time of day"""
+        with self._lock:
+            slots = self._by_patient.get(self._patient_index.get(patient_id), ())
+            return [self._entry(slot) for slot in sorted(slots, key=lambda slot: (self._minute[slot], slot))]
+
+    def due(self, window, now=None, patient_id=None, limit=1000):
+        """(occurrences, truncated): active reminders due in the next window minutes, earliest first.
+
+        The window starts at the current minute and counts wall-clock minutes
+        in the schedule's time zone; each occurrence is a reminder entry plus
+        its "due_at". Only the wheel buckets inside the window are visited, or
+        only the patient's reminders when patient_id is given.
+        """
+        now = (now or datetime.now(self.tz)).astimezone(self.tz).replace(tzinfo=None)
+        start = now.replace(second=0, microsecond=0)
+        end = start + timedelta(minutes=window)
+        day = start.replace(hour=0, minute=0)
+        hits = []
+        with self._lock:
+            if patient_id is not None:
+                slots = [slot for slot in self._by_patient.get(self._patient_index.get(patient_id), ())
+                         if self._state[slot] == _ACTIVE]
+                slots.sort(key=lambda slot: (self._minute[slot], slot))
+            minute, days = self._minute, self._days
+            while day < end and len(hits) <= limit:
+                first = max(0, (start - day) // timedelta(minutes=1))
+                last = min(MINUTES_PER_DAY, (end - day) // timedelta(minutes=1))
+                bit = 1 << day.weekday()
+                if patient_id is not None:
+                    hits.extend((day, minute[slot], slot) for slot in slots
+                                if first <= minute[slot] < last and days[slot] & bit)
+                else:
+                    wheel = self._wheel
+                    for m in range(first, last):
+                        bucket = wheel[m]
+                        if bucket:
+                            hits.extend((day, m, slot) for slot in bucket if days[slot] & bit)
+                            if len(hits) > limit:
+                                break
+                day += timedelta(days=1)
+            occurrences = []
+            for day, m, slot in hits[:limit]:
+                entry = self._entry(slot)
+                entry["due_at"] = (day + timedelta(minutes=m)).replace(tzinfo=self.tz).isoformat()
+                occurrences.append(entry)
+        return occurrences, len(hits) > limit
+
+    def snapshot(self, path):
+        """Write the schedule to path atomically; returns the number of reminders written"""
+        with self._lock:
+            columns = [column.tobytes() for column in self._columns]
+            free = self._free.tobytes()
+            meta = json.dumps({"patients": self._patients, "strings": self._strings}).encode()
+            header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(self._state), len(self._free), len(meta))
+            count = self._count
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            for chunk in [header, meta] + columns + [free]:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return count
+
+    @classmethod
+    def restore(cls, path, max_entries=MAX_ENTRIES, tz=timezone.utc):
+        """Schedule read back from a snapshot, its wheel and patient index rebuilt; ids stay valid"""
+        if sys.byteorder != "little":
+            raise ValueError("Reminder snapshots are read on little-endian machines only")
+        schedule = cls(max_entries, tz)
+        with open(path, "rb") as f:
+            magic, version, slots, free, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a reminder snapshot")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}; this server reads version {FORMAT_VERSION}")
+            meta = json.loads(f.read(meta_length))
+            for column in schedule._columns:
+                column.fromfile(f, slots)
+            schedule._free.fromfile(f, free)
+        patients, strings = meta["patients"], meta["strings"]
+        refs = array("I", bytes(4 * len(strings)))
+        state, wheel, minute = schedule._state, schedule._wheel, schedule._minute
+        for slot in range(slots):
+            if state[slot] != _FREE:
+                if state[slot] == _ACTIVE:
+                    # Slots are visited in order, so every bucket comes out sorted
+                    wheel[minute[slot]].append(slot)
+                schedule._by_patient.setdefault(schedule._patient[slot], array("I")).append(slot)
+                refs[schedule._medication[slot]] += 1
+                refs[schedule._dosage[slot]] += 1
+        # Entries nothing refers to any more are freed, as they would have been while running
+        for i in range(len(patients)):
+            if i not in schedule._by_patient:
+                patients[i] = None
+                schedule._patient_free.append(i)
+        for i, count in enumerate(refs):
+            if not count:
+                strings[i] = None
+                schedule._string_free.append(i)
+        schedule._patients, schedule._strings, schedule._string_refs = patients, strings, refs
+        schedule._patient_index = {patient_id: i for i, patient_id in enumerate(patients) if patient_id is not None}
+        schedule._string_index = {value: i for i, value in enumerate(strings) if value is not None}
+        schedule._count = slots - free
+        return schedule
+
+
+def reminders_from_env():
+    """Schedule configured from REMINDER_* environment variables, restored from its snapshot if there is one"""
+    max_entries = int(os.environ.get("REMINDER_MAX_ENTRIES", MAX_ENTRIES))
+    tz = ZoneInfo(os.environ.get("REMINDER_TIMEZONE", "UTC"))
+    path = os.environ.get("REMINDER_SNAPSHOT_PATH")
+    if not path:
+        return ReminderSchedule(max_entries, tz)
+    if os.path.exists(path):
+        schedule = ReminderSchedule.restore(path, max_entries, tz)
+        logger.info("Restored %d reminders from %s", len(schedule), path)
+    else:
+        schedule = ReminderSchedule(max_entries, tz)
+    schedule.snapshots = Snapshots(schedule, path, float(os.environ.get("REMINDER_SNAPSHOT_SECONDS", 60)), "reminder")
+    return schedule
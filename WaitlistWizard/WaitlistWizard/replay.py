@@ -0,0 +1,279 @@
+"""Replay captured traffic (see traffic_capture.py) against the app and report how it holds up.
+
+    python replay.py traffic.log                                  # in process, at the recorded pace
+    python replay.py traffic.log --speed 10 --concurrency 16      # ten times the recorded rate
+    python replay.py traffic.log --target http://127.0.0.1:5000 --rates 50,100,200,400 --requests 5000
+
+Requests are sent open-loop: each one is due at its recorded offset divided by
+--speed (or at even intervals with --rate), whether or not earlier ones have
+finished, and its latency counts from when it was due. Queueing behind a
+saturated server therefore shows up in the percentiles instead of quietly
+slowing the load down.
+
+--rates replays the log once per offered rate, lowest first, and stops at
+the saturation point: the first rate whose achieved throughput falls below
+--saturation-threshold of the offered rate, or whose error rate exceeds
+--max-error-rate.
+
+Errors are transport failures and 5xx responses. Responses whose status
+differs from the recorded one (a 429 from the production rate limit, say)
+are counted separately as mismatches.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import platform
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from metrics import percentile
+from traffic_capture import FORMAT
+
+
+def load_traffic(path):
+    """Captured records in arrival order; header lines of every writer are skipped"""
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get("format") == FORMAT:
+                continue
+            records.append(record)
+    records.sort(key=lambda record: record["t"])
+    return records
+
+
+def request_body(record):
+    """Bytes to send for a record; bodies that were not JSON are replayed as junk of the same length"""
+    if "b" in record:
+        return json.dumps(record["b"]).encode()
+    return b"x" * record.get("r", 0)
+
+
+class InProcessClient:
+    """Sends requests through the Flask test client, no network involved"""
+
+    def __init__(self):
+        import main
+        self._client = main.app.test_client()
+
+    def send(self, record):
+        response = self._client.open(record["p"], method=record["m"], query_string=record["q"],
+                                     data=request_body(record), content_type="application/json")
+        return response.status_code
+
+
+class HttpClient:
+    """Sends requests over one keep-alive HTTP connection, reconnecting after a failure"""
+
+    def __init__(self, host, port, timeout):
+        self._connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def send(self, record):
+        url = f"{record['p']}?{record['q']}" if record["q"] else record["p"]
+        try:
+            self._connection.request(record["m"], url, body=request_body(record),
+                                     headers={"Content-Type": "application/json"})
+            response = self._connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self._connection.close()
+            raise
+        return response.status
+
+
+def client_factory(target, timeout):
+    """Callable making one client per sending thread for 'inprocess' or an http:// URL"""
+    if target == "inprocess":
+        import main
+        # Replayed requests must not fill the audit log, trip the rate limit or be captured again
+        main.recommendation_store = None
+        main.rate_limiter = None
+        if main.traffic_capture is not None:
+            main.traffic_capture.sample_rate = 0
+        return InProcessClient
+    url = urlsplit(target)
+    if url.scheme != "http" or not url.hostname:
+        raise ValueError(f"Target must be 'inprocess' or an http:// URL, not {target!r}")
+    return lambda: HttpClient(url.hostname, url.port or 80, timeout)
+
+
+def schedule(records, count, speed=1.0, rate=None):
+    """(records, offsets in seconds) for count requests, cycling through the log as needed"""
+    chosen = list(itertools.islice(itertools.cycle(records), count))
+    if rate:
+        return chosen, [i / rate for i in range(count)]
+    first = records[0]["t"]
+    # A repeated log starts again one average gap after its last request
+    span = (records[-1]["t"] - first) * len(records) / max(1, len(records) - 1)
+    offsets = [(i // len(records) * span + record["t"] - first) / speed for i, record in enumerate(chosen)]
+    return chosen, offsets
+
+
+def replay(records, offsets, make_client, concurrency):
+    """Send records[i] offsets[i] seconds after the start from concurrency threads.
+
+    Returns ([(latency seconds from when the request was due, status or None)], elapsed seconds).
+    """
+    clients = [make_client() for _ in range(concurrency)]
+    results = [None] * len(records)
+    indexes = itertools.count()
+    start = time.perf_counter()
+
+    def send(client):
+        while True:
+            i = next(indexes)
+            if i >= len(records):
+                return
+            due = start + offsets[i]
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                status = client.send(records[i])
+            except Exception:
+                status = None
+            results[i] = (time.perf_counter() - due, status)
+
+    threads = [threading.Thread(target=send, args=(client,), daemon=True) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def _latency_stats(latencies):
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p90_ms": percentile(latencies, 0.90) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def summarize(records, offsets, results, elapsed):
+    """Latency distribution, throughput and error counts of one replay run"""
+    errors = sum(status is None or status >= 500 for _, status in results)
+    by_endpoint = defaultdict(list)
+    for record, (latency, _) in zip(records, results):
+        by_endpoint[record["p"]].append(latency)
+    return {
+        "requests": len(results),
+        "offered_rps": len(results) / offsets[-1] if offsets[-1] > 0 else None,
+        "achieved_rps": len(results) / elapsed if elapsed else 0.0,
+        **_latency_stats([latency for latency, _ in results]),
+        "errors": errors,
+        "error_rate": errors / len(results) if results else 0.0,
+        "status_mismatches": sum(status is not None and status != record["s"]
+                                 for record, (_, status) in zip(records, results)),
+        "statuses": dict(sorted(Counter(str(status) for _, status in results).items())),
+        "endpoints": {path: dict(requests=len(latencies), **_latency_stats(latencies))
+                      for path, latencies in sorted(by_endpoint.items())},
+    }
+
+
+def saturated(summary, threshold, max_error_rate):
+    """Whether a run fell behind its offered rate or failed too often"""
+    offered = summary["offered_rps"]
+    return (offered is not None and summary["achieved_rps"] < threshold * offered) \
+        or summary["error_rate"] > max_error_rate
+
+
+def _print_summary(label, summary):
+    offered = f"{summary['offered_rps']:8.1f}" if summary["offered_rps"] is not None else "       -"
+    print(f"{label:16s} offered {offered}/s  achieved {summary['achieved_rps']:8.1f}/s  "
+          f"p50 {summary['p50_ms']:8.2f}ms  p90 {summary['p90_ms']:8.2f}ms  p99 {summary['p99_ms']:8.2f}ms  "
+          f"errors {summary['error_rate']:6.2%}  mismatches {summary['status_mismatches']}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured API traffic and report latency, errors and saturation.")
+    parser.add_argument("log", help="traffic log written by traffic_capture.py")
+    parser.add_argument("--target", default="inprocess",
+                        help="'inprocess' for the Flask test client, or a base URL such as http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8, help="sending threads (default: 8)")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiple of the recorded pace (default: 1)")
+    parser.add_argument("--rate", type=float, help="send at this many requests per second instead of the recorded pace")
+    parser.add_argument("--rates", help="comma-separated rates to sweep, lowest first, to find the saturation point")
+    parser.add_argument("--requests", type=int, help="requests per run, cycling through the log (default: the log once)")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent one at a time before timing (default: 20)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP timeout in seconds (default: 30)")
+    parser.add_argument("--saturation-threshold", type=float, default=0.9,
+                        help="achieved/offered throughput below which a rate counts as saturated (default: 0.9)")
+    parser.add_argument("--max-error-rate", type=float, default=0.01,
+                        help="error rate above which a rate counts as saturated (default: 0.01)")
+    parser.add_argument("--output", help="file to write the JSON report to")
+    args = parser.parse_args(argv)
+
+    records = load_traffic(args.log)
+    if not records:
+        print(f"{args.log}: no recorded requests", file=sys.stderr)
+        return 1
+    make_client = client_factory(args.target, args.timeout)
+    count = args.requests or len(records)
+
+    warmup_client = make_client()
+    for record in itertools.islice(itertools.cycle(records), args.warmup):
+        try:
+            warmup_client.send(record)
+        except Exception:
+            pass
+
+    runs = []
+    saturation = None
+    if args.rates:
+        for rate in sorted(float(rate) for rate in args.rates.split(",")):
+            chosen, offsets = schedule(records, count, rate=rate)
+            summary = summarize(chosen, offsets, *replay(chosen, offsets, make_client, args.concurrency))
+            runs.append(summary)
+            _print_summary(f"rate {rate:g}/s", summary)
+            if saturated(summary, args.saturation_threshold, args.max_error_rate):
+                saturation = rate
+                break
+        sustained = [run["achieved_rps"] for run in runs
+                     if not saturated(run, args.saturation_threshold, args.max_error_rate)]
+        if saturation is None:
+            print(f"not saturated up to {runs[-1]['offered_rps']:.1f}/s", file=sys.stderr)
+        else:
+            print(f"saturates at {saturation:g}/s offered; highest sustained throughput "
+                  f"{max(sustained, default=0.0):.1f}/s", file=sys.stderr)
+    else:
+        chosen, offsets = schedule(records, count, speed=args.speed, rate=args.rate)
+        summary = summarize(chosen, offsets, *replay(chosen, offsets, make_client, args.concurrency))
+        runs.append(summary)
+        _print_summary("replay", summary)
+        for path, stats in summary["endpoints"].items():
+            print(f"  {path:40s} {stats['requests']:7d} requests  p50 {stats['p50_ms']:8.2f}ms  "
+                  f"p99 {stats['p99_ms']:8.2f}ms", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "log": args.log,
+            "target": args.target,
+            "concurrency": args.concurrency,
+            "recorded_requests": len(records),
+        },
+        "runs": runs,
+        "saturation_rps": saturation,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
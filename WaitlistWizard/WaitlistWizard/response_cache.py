@@ -0,0 +1,194 @@
+"""Bounded LRU/TTL memoization for recommendation and symptom-analysis results"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Sentinel for a cache miss, since None is a valid cached result
+MISSING = object()
+
+
+class MemoryBackend:
+    """Per-process LRU store with a time-to-live on every entry"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Store a value; returns the number of entries evicted to make room"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                evicted += 1
+            return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """LRU/TTL store in a local SQLite file, shared by every worker process on the host.
+
+    Values are stored as JSON, so only JSON-serializable results can be cached.
+    """
+
+    def __init__(self, path, maxsize, ttl, namespace="default"):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_lru ON response_cache (namespace, accessed)"
+            )
+
+    def _connection(self):
+        # sqlite3 connections cannot cross threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        key = json.dumps(key)
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires FROM response_cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return MISSING
+        value, expires = row
+        if expires < now:
+            conn.execute("DELETE FROM response_cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+            return MISSING
+        conn.execute(
+            "UPDATE response_cache SET accessed = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        )
+        return json.loads(value)
+
+    def set(self, key, value):
+        """Store a value; returns the number of entries evicted to make room"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (namespace, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, json.dumps(key), json.dumps(value), now + self.ttl, now),
+        )
+        count = conn.execute(
+            "SELECT COUNT(*) FROM response_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+        if count <= self.maxsize:
+            return 0
+        # Drop expired rows first, then the least recently used ones
+        cursor = conn.execute(
+            "DELETE FROM response_cache WHERE namespace = ? AND rowid IN ("
+            " SELECT rowid FROM response_cache WHERE namespace = ?"
+            " ORDER BY expires < ? DESC, accessed LIMIT ?)",
+            (self.namespace, self.namespace, now, count - self.maxsize),
+        )
+        return cursor.rowcount
+
+    def clear(self):
+        self._connection().execute("DELETE FROM response_cache WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM response_cache WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+
+class ResponseCache:
+    """Memoizes a pure function of normalized inputs and counts hits, misses and evictions"""
+
+    def __init__(self, name, backend):
+        self.name = name
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Request threads share the counters; += on an attribute is not atomic
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, calling compute() and storing its result on a miss"""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is not MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = compute()
+        evicted = self.backend.set(key, value)
+        with self._lock:
+            self.evictions += evicted
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "size": len(self.backend),
+        }
+
+
+def cache_from_env(name):
+    """Build a cache from RESPONSE_CACHE_* settings; returns None when caching is disabled.
+
+    RESPONSE_CACHE_SIZE     maximum entries per cache (0 disables caching), default 4096
+    RESPONSE_CACHE_TTL      seconds an entry stays valid, default 300
+    RESPONSE_CACHE_BACKEND  "memory" (per process) or "sqlite" (shared across workers)
+    RESPONSE_CACHE_PATH     SQLite file for the shared backend
+    """
+    maxsize = int(os.environ.get("RESPONSE_CACHE_SIZE", 4096))
+    if maxsize <= 0:
+        return None
+    ttl = float(os.environ.get("RESPONSE_CACHE_TTL", 300))
+    if os.environ.get("RESPONSE_CACHE_BACKEND", "memory") == "sqlite":
+        path = os.environ.get("RESPONSE_CACHE_PATH", "/tmp/waitlistwizard-cache.sqlite3")
+        return ResponseCache(name, SQLiteBackend(path, maxsize, ttl, namespace=name))
+    return ResponseCache(name, MemoryBackend(maxsize, ttl))
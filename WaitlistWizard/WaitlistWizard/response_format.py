@@ -0,0 +1,146 @@
+"""Response bodies for the recommendation API.
+
+Bodies are encoded with orjson when it is installed and the standard json
+module otherwise.
+
+?format=compact replaces names and repeated strings with ids into a
+dictionary served separately by /api/dictionary, which changes only with the
+knowledge base and is cacheable by its version. A compact recommendation is
+
+    {"dictionary": version, "timestamp", "patient", "condition": condition id,
+     "ai_analysis", "safety",
+     "medications": [[medication id, confidence_score, is_dangerous,
+                      [[factor id, adjustment], ...], dosing id], ...]}
+
+where lifestyle and monitoring advice come from the dictionary by condition
+id. Any name or string missing from the dictionary is sent as-is.
+
+Large bodies are compressed with brotli (when installed) or gzip, as the
+client's Accept-Encoding allows.
+
+Settings:
+    COMPRESS_MIN_BYTES  smallest body worth compressing, default 1024
+"""
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from knowledge_base import AGE_CATEGORIES
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", 1024))
+
+
+def dumps(value):
+    """JSON bytes for value"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Values orjson refuses (integers past 64 bits, for instance) still encode with json
+            pass
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+class ResponseDictionary:
+    """Ids for the names and strings that compact responses leave out"""
+
+    def __init__(self, kb, dosing_guidance):
+        # dosing_guidance: main.get_dosing_guidance
+        self.version = kb.fingerprint
+        self.conditions = sorted(kb.condition_ids, key=kb.condition_ids.get)
+        self.condition_ids = dict(kb.condition_ids)
+        medications = {}
+        factors = {"Drug interaction": 0}
+        dosing = {}
+        self._dosing_ids = {}
+        # Numbered in condition and profile id order, never mapping order, so a built knowledge
+        # base and a compiled one (whose mappings iterate sorted) hand out the same ids
+        profiles = sorted(kb.profile_ids, key=kb.profile_ids.get)
+        for condition in self.conditions:
+            for medication, _ in kb.ranked_medications[condition]:
+                medications.setdefault(medication, len(medications))
+                for age_category in AGE_CATEGORIES:
+                    text = dosing_guidance(medication, age_category, None, condition)
+                    self._dosing_ids[(medication, age_category, condition)] = dosing.setdefault(text, len(dosing))
+                for age_category, gender in profiles:
+                    for factor, _ in kb.adjustment_index[(medication, age_category, gender, condition)][1]:
+                        factors.setdefault(factor, len(factors))
+        self.medication_ids = medications
+        self.factor_ids = factors
+        self._dosing = list(dosing)
+
+        self.body = dumps({
+            "success": True,
+            "version": self.version,
+            "conditions": self.conditions,
+            "medications": list(medications),
+            "factors": list(factors),
+            "dosing": self._dosing,
+            "lifestyle": [list(kb.lifestyle_recommendations(condition)) for condition in self.conditions],
+            "monitoring": [list(kb.monitoring_recommendations(condition)) for condition in self.conditions],
+        })
+
+    def _medication(self, entry, age_category, condition):
+        dosing_id = self._dosing_ids.get((entry["medication"], age_category, condition))
+        dosing = entry["dosing_guidance"]
+        return [
+            self.medication_ids.get(entry["medication"], entry["medication"]),
+            entry["confidence_score"],
+            entry["is_dangerous_with_existing_medication"],
+            [[self.factor_ids.get(item["factor"], item["factor"]), item["adjustment"]]
+             for item in entry["score_adjustments"]],
+            dosing_id if dosing_id is not None and self._dosing[dosing_id] == dosing else dosing,
+        ]
+
+    def compact(self, recommendation):
+        """Compact form of a recommendation; error responses are returned unchanged"""
+        if not isinstance(recommendation, dict) or recommendation.get("error") or "patient" not in recommendation:
+            return recommendation
+        condition = recommendation["primary_condition"]
+        age_category = recommendation["patient"]["age_category"]
+        return {
+            "dictionary": self.version,
+            "timestamp": recommendation["timestamp"],
+            "patient": recommendation["patient"],
+            "condition": self.condition_ids.get(condition, condition),
+            "ai_analysis": recommendation["ai_analysis"],
+            "safety": recommendation["safety"],
+            "medications": [self._medication(entry, age_category, condition)
+                            for entry in recommendation["recommendations"]],
+        }
+
+
+_built = None
+
+
+def dictionary_for(kb, dosing_guidance):
+    """Dictionary for a knowledge base, rebuilt only when its fingerprint changes"""
+    global _built
+    dictionary = _built
+    if dictionary is None or dictionary.version != kb.fingerprint:
+        dictionary = _built = ResponseDictionary(kb, dosing_guidance)
+    return dictionary
+
+
+def compress(body, accept_encoding):
+    """(body, content encoding or None) for the best encoding the client accepts.
+
+    accept_encoding is a werkzeug Accept object (request.accept_encodings).
+    """
+    if len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    if brotli is not None and accept_encoding["br"]:
+        return brotli.compress(body, quality=5), "br"
+    if accept_encoding["gzip"]:
+        return gzip.compress(body, compresslevel=6), "gzip"
+    return body, None
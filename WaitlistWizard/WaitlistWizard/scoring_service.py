@@ -0,0 +1,598 @@
+"""Multi-process scoring service: one supervisor feeding N scoring workers.
+
+Workers answer both CPU-bound paths: recommendations (/api/ai-recommendation)
+and symptom analysis (/api/analyze-symptoms). Live analysis sessions stay in
+the supervisor, since each session's match state lives in one process.
+
+The supervisor encodes the active knowledge base (rule tables, precomputed
+indexes and the score matrix, in the compiled_kb.py format) together with the
+symptom vocabularies into one multiprocessing.shared_memory block. Workers
+are spawned fresh rather than forked, attach to the block and score from it
+in place, so N workers hold a single copy of the tables whatever the start
+method; each compiles its own symptom matcher from the shared vocabularies.
+Workers import main with SCORING_SERVICE_WORKER=1 and with recording,
+snapshots, capture and explain logs switched off, so they build none of the
+supervisor's serving state and no tables of their own.
+
+Requests are queued in the supervisor and sent over a pipe to the least busy
+worker, as one batch of everything that accumulated while all workers were
+occupied (up to SCORING_SERVICE_BATCH_SIZE), so the per-request IPC cost
+falls as load rises and throughput grows with the number of cores.
+
+Workers send a heartbeat every health interval and note in shared memory
+which request they are scoring. One that has exited, gone silent or spent
+longer than the health timeout on a single batch is killed and restarted.
+The request it was scoring is charged an attempt, and fails instead of being
+retried once MAX_ATTEMPTS workers have been lost on it; the rest of its
+unfinished requests go back to the other workers uncharged.
+When the active knowledge base changes, a new block is published and workers
+switch to it before their next batch.
+
+    SCORING_SERVICE_WORKERS=8 uvicorn asgi:app    # one event loop, 8 scoring processes
+    python scoring_service.py --workers 8        # throughput at 1, 2, 4 and 8 workers
+
+Run a single ASGI process in this mode; the service already spans the cores.
+
+Settings:
+    SCORING_SERVICE_WORKERS          scoring processes; unset or 0 scores in-process (default)
+    SCORING_SERVICE_BATCH_SIZE       most requests sent to a worker at once, default 64
+    SCORING_SERVICE_HEALTH_INTERVAL  seconds between worker heartbeats, default 1.0
+    SCORING_SERVICE_HEALTH_TIMEOUT   seconds a worker may be silent or stuck before a restart, default 10
+"""
+import argparse
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from multiprocessing import connection, shared_memory
+
+import compiled_kb
+import response_format
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("SCORING_SERVICE_BATCH_SIZE", 64))
+HEALTH_INTERVAL = float(os.environ.get("SCORING_SERVICE_HEALTH_INTERVAL", 1.0))
+HEALTH_TIMEOUT = float(os.environ.get("SCORING_SERVICE_HEALTH_TIMEOUT", 10.0))
+
+# Batches waiting on one worker; more would only shrink batches without adding throughput
+MAX_IN_FLIGHT = 2
+# Workers lost while scoring one request before it fails
+MAX_ATTEMPTS = 2
+# How often the supervisor picks up pipes of restarted workers
+_POLL_SECONDS = 0.1
+
+SYMPTOM_TABLES = ("condition_symptoms", "symptom_synonyms", "condition_context_keywords")
+
+# Workers start from a clean interpreter, never a fork of a process running supervisor threads
+_context = multiprocessing.get_context("spawn")
+
+# Environment a worker imports main with: the tables come from the supervisor's block, and
+# recording, snapshots, traffic capture and explain logs all stay with the supervisor
+_WORKER_ENVIRON = {"SCORING_SERVICE_WORKER": "1", "SCORING_SERVICE_WORKERS": "0", "RECORD_RECOMMENDATIONS": "0"}
+_WORKER_UNSET = ("KNOWLEDGE_BASE_PATH", "WAITLIST_SNAPSHOT_PATH", "REMINDER_SNAPSHOT_PATH", "TRAFFIC_CAPTURE_PATH",
+                 "EXPLAIN_LOG_PATH")
+
+
+class WorkerLost(RuntimeError):
+    """Raised for a request whose workers died or hung on it MAX_ATTEMPTS times"""
+
+
+def symptom_index(main_module):
+    """Symptom vocabularies as ordered (key, values) pairs; matcher tie-breaks follow table order"""
+    return {name: [(key, list(values)) for key, values in getattr(main_module, name).items()]
+            for name in SYMPTOM_TABLES}
+
+
+def publish(kb, main_module):
+    """New shared memory block holding kb and the symptom vocabularies"""
+    data = compiled_kb.encode_compiled(kb, {"symptom_index": symptom_index(main_module)})
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    block.buf[:len(data)] = data
+    return block
+
+
+def _attach(name, main_module, attached):
+    """Serve the knowledge base and symptom vocabularies published in the named block"""
+    from knowledge_base import install_shared_knowledge_base
+    from symptom_matcher import SymptomMatcher
+
+    block = shared_memory.SharedMemory(name=name)
+    # Scoring keeps views into the block, so it stays mapped for the life of the worker
+    attached.append(block)
+    kb = install_shared_knowledge_base(name, block.buf)
+    index = kb.reference["symptom_index"]
+    vocabularies = [{key: list(values) for key, values in index[table]} for table in SYMPTOM_TABLES]
+    main_module.symptom_matcher = SymptomMatcher(*vocabularies, max_fuzzy_distance=main_module.FUZZY_MAX_DISTANCE,
+                                                 dictionary=main_module.FUZZY_DICTIONARY)
+    if main_module.RECOMMENDATION_MATRIX:
+        # Filled before the first batch rather than on the first request that needs it
+        main_module.matrix_for(kb, main_module._compute_recommendation)
+
+
+def _score(asgi, job):
+    """(True, result) or (False, error message) for a ("recommend", ...) or ("analyze", ...) job.
+
+    A recommendation's result is (condition label, body, recommendation or
+    None); an analysis's is its response body.
+    """
+    kind, args = job
+    try:
+        if kind == "analyze":
+            return True, response_format.dumps(asgi._analyze_symptoms_payload(*args))
+        req, compact, record = args
+        recommendation, body = asgi._ai_recommendation_response(req, compact)
+    except Exception as e:
+        logger.exception("Scoring failed in worker %d", os.getpid())
+        return False, f"{type(e).__name__}: {e}"
+    return True, (asgi.main._condition_label(recommendation), body, recommendation if record else None)
+
+
+def _heartbeat(outbox, send_lock, busy, interval):
+    """Report liveness, and how long the current batch has been running, every interval"""
+    while True:
+        time.sleep(interval)
+        started = busy[0]
+        try:
+            with send_lock:
+                outbox.send(("heartbeat", time.perf_counter() - started if started else 0.0))
+        except OSError:
+            # The supervisor is gone; the main loop sees EOF and exits
+            return
+
+
+def _worker_main(index, name, inbox, outbox, health_interval, position):
+    """Scoring worker: attach to the shared tables, then answer batches until told to stop"""
+    os.environ.update(_WORKER_ENVIRON)
+    for setting in _WORKER_UNSET:
+        os.environ.pop(setting, None)
+    import asgi
+
+    attached = []
+    _attach(name, asgi.main, attached)
+    send_lock = threading.Lock()
+    # perf_counter() when the current batch started, 0 while idle
+    busy = [0.0]
+    threading.Thread(target=_heartbeat, args=(outbox, send_lock, busy, health_interval),
+                     name="scoring-heartbeat", daemon=True).start()
+    with send_lock:
+        outbox.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = inbox.recv()
+        except EOFError:
+            break
+        if message[0] == "score":
+            _, batch_id, jobs = message
+            busy[0] = started = time.perf_counter()
+            results = []
+            for i, job in enumerate(jobs):
+                # Read by the supervisor if this process dies or hangs on the job
+                position[0], position[1] = batch_id, i
+                results.append(_score(asgi, job))
+            position[0] = -1
+            busy[0] = 0.0
+            with send_lock:
+                outbox.send(("done", batch_id, results, time.perf_counter() - started))
+        elif message[0] == "publish":
+            try:
+                _attach(message[1], asgi.main, attached)
+            except FileNotFoundError:
+                # Already replaced by a newer block, whose name is sent next
+                pass
+        elif message[0] == "stop":
+            break
+    # Interpreter teardown would try to unmap blocks the knowledge base still has views into
+    os._exit(0)
+
+
+class _Worker:
+    """Supervisor-side state of one worker process"""
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        # Supervisor ends of the worker's pipes; None while it is being restarted
+        self.inbox = None
+        self.outbox = None
+        self.block_name = None
+        # Shared (batch id, job index) the worker is scoring, batch id -1 while idle
+        self.position = None
+        self.ready = False
+        # batch id -> [(job, future, attempts), ...]
+        self.in_flight = {}
+        self.last_seen = 0.0
+        self.busy_for = 0.0
+        self.requests = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.throughput = 0.0
+        self.sampled = (0.0, 0)
+
+
+class ScoringService:
+    """Supervisor that shares the knowledge base with worker processes and dispatches scoring to them"""
+
+    def __init__(self, main_module, workers, batch_size=BATCH_SIZE, health_interval=HEALTH_INTERVAL,
+                 health_timeout=HEALTH_TIMEOUT):
+        self.main_module = main_module
+        self.batch_size = batch_size
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.workers = [_Worker(i) for i in range(workers)]
+        # (job, future, attempts) not yet sent to a worker
+        self._pending = deque()
+        self._lock = threading.Condition()
+        self._stopped = threading.Event()
+        self._batch_ids = itertools.count()
+        self._block = None
+        self._fingerprint = None
+        # Replaced blocks, kept until no starting worker still has to attach to them
+        self._retired = []
+        self._threads = []
+        self._started = False
+        self._closed = False
+        self.lost = 0
+
+    def start(self):
+        """Publish the tables and start the workers; returns once they are spawned, not ready"""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+        self._publish(self.main_module.get_knowledge_base())
+        for worker in self.workers:
+            self._spawn(worker)
+        for target in (self._dispatch, self._collect, self._monitor):
+            thread = threading.Thread(target=target, name=f"scoring-service{target.__name__}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has attached to the tables; False on timeout"""
+        with self._lock:
+            return self._lock.wait_for(lambda: all(worker.ready for worker in self.workers), timeout)
+
+    @property
+    def queued(self):
+        """Requests waiting for a worker"""
+        return len(self._pending)
+
+    def submit(self, req, compact=False, record=False):
+        """Future for the (condition label, response body, recommendation) of a RecommendationRequest.
+
+        The body is what /api/ai-recommendation answers; the recommendation
+        itself is sent back only when record is set.
+        """
+        return self._enqueue(("recommend", (req, compact, record)))
+
+    def submit_analysis(self, symptom_text):
+        """Future for the response body /api/analyze-symptoms answers for symptom_text"""
+        return self._enqueue(("analyze", (symptom_text,)))
+
+    def _enqueue(self, job):
+        if not self._started:
+            self.start()
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Scoring service is closed")
+            self._pending.append((job, future, 0))
+            self._lock.notify_all()
+        return future
+
+    def score(self, reqs, compact=False):
+        """Response bodies for many RecommendationRequests, in order"""
+        return [future.result()[1] for future in [self.submit(req, compact) for req in reqs]]
+
+    def _publish(self, kb):
+        block = publish(kb, self.main_module)
+        with self._lock:
+            if self._block is not None:
+                self._retired.append(self._block)
+            self._block, self._fingerprint = block, kb.fingerprint
+            self._lock.notify_all()
+        logger.info("Published knowledge base %s to shared memory %s (%d bytes)", kb.fingerprint, block.name, block.size)
+
+    def _release_retired(self):
+        with self._lock:
+            starting = {worker.block_name for worker in self.workers if not worker.ready}
+            released = [block for block in self._retired if block.name not in starting]
+            self._retired = [block for block in self._retired if block.name in starting]
+        for block in released:
+            # Workers attached to it keep their mapping until they switch
+            block.close()
+            block.unlink()
+
+    def _spawn(self, worker):
+        inbox_reader, inbox_writer = _context.Pipe(duplex=False)
+        outbox_reader, outbox_writer = _context.Pipe(duplex=False)
+        position = _context.RawArray("q", [-1, -1])
+        with self._lock:
+            name = self._block.name
+        process = _context.Process(target=_worker_main, name=f"scoring-worker-{worker.index}", daemon=True,
+                                   args=(worker.index, name, inbox_reader, outbox_writer, self.health_interval,
+                                         position))
+        process.start()
+        # Only the worker holds these ends, so either side sees EOF when the other exits
+        inbox_reader.close()
+        outbox_writer.close()
+        with self._lock:
+            worker.process, worker.inbox, worker.outbox = process, inbox_writer, outbox_reader
+            worker.position = position
+            worker.block_name = name
+            worker.busy_for = 0.0
+            # Startup counts against the health timeout
+            worker.last_seen = time.monotonic()
+
+    def _available(self):
+        """Ready worker with the fewest batches in flight, or None while all are full"""
+        candidates = [worker for worker in self.workers if worker.ready and len(worker.in_flight) < MAX_IN_FLIGHT]
+        return min(candidates, key=lambda worker: len(worker.in_flight), default=None)
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: self._closed or (self._pending and self._available()))
+                if self._closed:
+                    return
+                worker = self._available()
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                batch_id = next(self._batch_ids)
+                worker.in_flight[batch_id] = batch
+                inbox = worker.inbox
+                switch = self._block.name if worker.block_name != self._block.name else None
+                worker.block_name = self._block.name
+            # This thread is the only writer to worker inboxes once they are started
+            try:
+                if switch:
+                    inbox.send(("publish", switch))
+                inbox.send(("score", batch_id, [job for job, _, _ in batch]))
+            except (OSError, ValueError):
+                # The worker died; its restart puts the batch back in the queue
+                pass
+
+    def _collect(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                readers = {worker.outbox: worker for worker in self.workers if worker.outbox is not None}
+            try:
+                ready = connection.wait(list(readers), timeout=_POLL_SECONDS)
+            except (OSError, ValueError):
+                # A pipe was closed by a restart while waiting on it
+                continue
+            for conn in ready:
+                worker = readers[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    self._restart(worker, "exited", conn)
+                    continue
+                self._handle(worker, conn, message)
+
+    def _handle(self, worker, conn, message):
+        batch, results = None, ()
+        with self._lock:
+            if worker.outbox is not conn:
+                # Sent by a process that has since been replaced
+                return
+            worker.last_seen = time.monotonic()
+            if message[0] == "heartbeat":
+                worker.busy_for = message[1]
+            elif message[0] == "ready":
+                worker.ready = True
+                self._lock.notify_all()
+            elif message[0] == "done":
+                _, batch_id, results, busy_seconds = message
+                batch = worker.in_flight.pop(batch_id, None)
+                if batch is not None:
+                    worker.requests += len(batch)
+                    worker.batches += 1
+                    worker.busy_seconds += busy_seconds
+                worker.busy_for = 0.0
+                self._lock.notify_all()
+        if batch is None:
+            return
+        for (_, future, _), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def _monitor(self):
+        while not self._stopped.wait(self.health_interval):
+            try:
+                kb = self.main_module.get_knowledge_base()
+                if kb.fingerprint != self._fingerprint:
+                    self._publish(kb)
+            except Exception:
+                # Keep the workers on the tables they already have
+                logger.exception("Could not publish the knowledge base to the scoring workers")
+            self._release_retired()
+            now = time.monotonic()
+            for worker in self.workers:
+                with self._lock:
+                    if worker.outbox is None:
+                        continue
+                    process, silent, busy_for = worker.process, now - worker.last_seen, worker.busy_for
+                    sampled_at, sampled_requests = worker.sampled
+                    if sampled_at:
+                        worker.throughput = (worker.requests - sampled_requests) / (now - sampled_at)
+                    worker.sampled = (now, worker.requests)
+                if not process.is_alive():
+                    self._restart(worker, f"exited with code {process.exitcode}")
+                elif silent > self.health_timeout:
+                    self._restart(worker, f"sent nothing for {silent:.1f}s")
+                elif busy_for > self.health_timeout:
+                    self._restart(worker, f"spent {busy_for:.1f}s on one batch")
+
+    def _restart(self, worker, reason, conn=None):
+        """Replace a dead or hung worker, charge the request it was scoring and requeue the rest"""
+        with self._lock:
+            if self._closed or worker.outbox is None or (conn is not None and worker.outbox is not conn):
+                # Shutting down, or already being restarted
+                return
+            process, inbox, outbox, position = worker.process, worker.inbox, worker.outbox, worker.position
+            in_flight = worker.in_flight
+            worker.in_flight = {}
+            worker.ready = False
+            worker.inbox = worker.outbox = None
+            worker.restarts += 1
+        logger.warning("Scoring worker %d (pid %s) %s; restarting it", worker.index, process.pid, reason)
+        process.kill()
+        process.join()
+        inbox.close()
+        outbox.close()
+
+        # Read once the process is gone, so this is the job it died or hung on, if any
+        scoring = (position[0], position[1])
+        unfinished = [(job, future, attempts + ((batch_id, i) == scoring))
+                      for batch_id, batch in in_flight.items() for i, (job, future, attempts) in enumerate(batch)]
+        failed = []
+        with self._lock:
+            for job, future, attempts in reversed(unfinished):
+                if attempts >= MAX_ATTEMPTS:
+                    failed.append(future)
+                else:
+                    self._pending.appendleft((job, future, attempts))
+            self.lost += len(failed)
+            self._lock.notify_all()
+        for future in failed:
+            future.set_exception(WorkerLost(f"Scoring worker lost {MAX_ATTEMPTS} times while handling this request"))
+        self._spawn(worker)
+
+    def close(self):
+        """Stop the workers, fail anything unfinished and release the shared memory"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            unfinished = list(self._pending) + [entry for worker in self.workers
+                                                for batch in worker.in_flight.values() for entry in batch]
+            self._pending.clear()
+            self._lock.notify_all()
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout=self.health_timeout)
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.inbox.send(("stop",))
+            except (AttributeError, OSError, ValueError):
+                pass
+            worker.process.join(timeout=self.health_timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            for conn in (worker.inbox, worker.outbox):
+                if conn is not None:
+                    conn.close()
+        for _, future, _ in unfinished:
+            if not future.done():
+                future.set_exception(RuntimeError("Scoring service is closed"))
+        for block in self._retired + [self._block]:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    def stats(self):
+        """Queue depth and each worker's health and throughput"""
+        with self._lock:
+            return {
+                "queued": len(self._pending),
+                "lost": self.lost,
+                "workers": [{
+                    "worker": worker.index,
+                    "pid": worker.process.pid if worker.process else None,
+                    "ready": worker.ready,
+                    "in_flight": sum(len(batch) for batch in worker.in_flight.values()),
+                    "requests": worker.requests,
+                    "batches": worker.batches,
+                    "busy_seconds": worker.busy_seconds,
+                    "requests_per_second": worker.throughput,
+                    "restarts": worker.restarts,
+                } for worker in self.workers],
+            }
+
+    def metrics(self):
+        """Per-worker samples for metrics.registry.register_collector"""
+        stats = self.stats()
+        yield "waitlistwizard_scoring_queued", "gauge", (), stats["queued"]
+        yield "waitlistwizard_scoring_lost_requests_total", "counter", (), stats["lost"]
+        for worker in stats["workers"]:
+            labels = (("worker", worker["worker"]),)
+            yield "waitlistwizard_scoring_worker_up", "gauge", labels, int(worker["ready"])
+            yield "waitlistwizard_scoring_worker_requests_total", "counter", labels, worker["requests"]
+            yield "waitlistwizard_scoring_worker_busy_seconds_total", "counter", labels, worker["busy_seconds"]
+            yield "waitlistwizard_scoring_worker_requests_per_second", "gauge", labels, worker["requests_per_second"]
+            yield "waitlistwizard_scoring_worker_restarts_total", "counter", labels, worker["restarts"]
+
+
+def service_from_env(main_module):
+    """ScoringService configured from SCORING_SERVICE_* environment variables, or None when disabled"""
+    workers = int(os.environ.get("SCORING_SERVICE_WORKERS") or 0)
+    if workers <= 0:
+        return None
+    return ScoringService(main_module, workers)
+
+
+def _worker_counts(workers):
+    counts = []
+    n = 1
+    while n < workers:
+        counts.append(n)
+        n *= 2
+    return counts + [workers]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure scoring service throughput at increasing worker counts.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="most workers to run (default: all cores)")
+    parser.add_argument("--requests", type=int, default=20000, help="requests scored per run (default: 20000)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"most requests per worker message (default: {BATCH_SIZE})")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    os.environ["RECORD_RECOMMENDATIONS"] = "0"
+    import main as main_module
+    from synthetic_data import generate_patients
+    from validation import RecommendationRequest
+
+    reqs = [RecommendationRequest.from_payload(patient) for patient in generate_patients(args.requests, seed=args.seed)]
+    baseline = None
+    for count in _worker_counts(args.workers):
+        service = ScoringService(main_module, count, batch_size=args.batch_size).start()
+        try:
+            service.wait_ready()
+            service.score(reqs[:count * args.batch_size])
+            before = [worker["requests"] for worker in service.stats()["workers"]]
+            started = time.perf_counter()
+            futures = [service.submit(req) for req in reqs]
+            wait(futures)
+            elapsed = time.perf_counter() - started
+            errors = sum(future.exception() is not None for future in futures)
+            stats = service.stats()
+        finally:
+            service.close()
+        throughput = len(reqs) / elapsed
+        baseline = baseline or throughput
+        print(f"{count:3d} workers: {throughput:9.0f} req/s  speedup {throughput / baseline:5.2f}x"
+              f"  efficiency {throughput / baseline / count:4.0%}  errors {errors}", file=sys.stderr)
+        for worker, done_before in zip(stats["workers"], before):
+            print(f"      worker {worker['worker']}: {(worker['requests'] - done_before) / elapsed:9.0f} req/s"
+                  f"  {worker['batches']} batches  {worker['restarts']} restarts", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
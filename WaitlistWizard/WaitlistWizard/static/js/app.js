@@ -94,6 +94,43 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   });
   
+  // Live analysis while typing; the server session keeps the previous text's
+  // matches, so each request only rescans what changed
+  let symptomSessionId = null;
+  let liveAnalysisTimer = null;
+  let liveAnalysisRequest = null;
+  
+  symptomTextInput.addEventListener('input', function() {
+    clearTimeout(liveAnalysisTimer);
+    liveAnalysisTimer = setTimeout(async function() {
+      if (liveAnalysisRequest) {
+        liveAnalysisRequest.abort();
+      }
+      liveAnalysisRequest = new AbortController();
+      
+      try {
+        const response = await fetch('/api/analyze-symptoms/live', {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({ symptoms: symptomTextInput.value, sessionId: symptomSessionId }),
+          signal: liveAnalysisRequest.signal
+        });
+        const data = await response.json();
+        symptomSessionId = data.sessionId || symptomSessionId;
+        
+        // Only show confident matches while typing; the analyze button still reports "no match"
+        if (data.success && data.results && data.results.length > 0) {
+          currentSymptomAnalysis = data.results;
+          displaySymptomAnalysis(data.results);
+        }
+      } catch (error) {
+        if (error.name !== 'AbortError') {
+          console.error('Live symptom analysis error:', error);
+        }
+      }
+    }, 300);
+  });
+  
   // Display the symptom analysis results
   function displaySymptomAnalysis(results) {
     symptomAnalysisContainer.innerHTML = `
@@ -268,6 +305,13 @@ document.addEventListener('DOMContentLoaded', function() {
     );
   }
   
+  function escapeHtml(text) {
+    // Interaction fields carry user-entered drug names, so never let them through as markup
+    return String(text).replace(/[&<>"']/g, ch => ({
+      '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[ch]);
+  }
+  
   function displayError(element, message) {
     element.textContent = message;
     element.parentElement.classList.add('error');
@@ -358,75 +402,108 @@ document.addEventListener('DOMContentLoaded', function() {
   // Autocomplete functionality
   function initializeAutocomplete() {
     // Health condition autocomplete
-    initializeAutocompleteField(healthProblemInput, healthConditionResults, healthConditionsAutocomplete);
+    initializeAutocompleteField(healthProblemInput, healthConditionResults, 'condition');
     
     // Medication autocomplete
-    initializeAutocompleteField(existingDrugInput, medicationResults, medicationsAutocomplete);
+    initializeAutocompleteField(existingDrugInput, medicationResults, 'medication');
   }
   
-  function initializeAutocompleteField(inputField, resultsContainer, dataArray) {
-    inputField.addEventListener('input', function() {
-      const inputValue = this.value.trim().toLowerCase();
+  // Ranked suggestions from the server-side index; responses are HTTP-cacheable
+  async function fetchAutocomplete(query, type, signal) {
+    const params = new URLSearchParams({ q: query, type: type, limit: 5 });
+    const response = await fetch(`/api/autocomplete?${params}`, { signal });
+    const data = await response.json();
+    return data.success ? data.results.map(result => result.name) : [];
+  }
+  
+  function showAutocompleteResults(inputField, resultsContainer, inputValue, matchingItems) {
+    // Clear previous results
+    resultsContainer.innerHTML = '';
+    
+    // If no matches, hide results
+    if (matchingItems.length === 0) {
+      resultsContainer.classList.remove('show');
+      return;
+    }
+    
+    // Create results list
+    matchingItems.forEach(item => {
+      const resultItem = document.createElement('div');
+      resultItem.className = 'autocomplete-item';
       
-      // Clear previous results
-      resultsContainer.innerHTML = '';
+      // Highlight the matching part
+      const itemText = item;
+      const matchIndex = itemText.toLowerCase().indexOf(inputValue);
       
-      // Hide results if input is empty
-      if (!inputValue) {
-        resultsContainer.classList.remove('show');
-        return;
+      if (matchIndex >= 0) {
+        const beforeMatch = itemText.substring(0, matchIndex);
+        const matchText = itemText.substring(matchIndex, matchIndex + inputValue.length);
+        const afterMatch = itemText.substring(matchIndex + inputValue.length);
+        
+        resultItem.innerHTML = `${beforeMatch}<span class="autocomplete-highlight">${matchText}</span>${afterMatch}`;
+      } else {
+        resultItem.textContent = itemText;
       }
       
-      // Filter matching items
-      const matchingItems = dataArray.filter(item => 
-        item.toLowerCase().includes(inputValue)
-      ).slice(0, 5); // Limit to top 5 matches
+      // Add click event to select this item
+      resultItem.addEventListener('click', function() {
+        inputField.value = itemText;
+        resultsContainer.classList.remove('show');
+        
+        // Trigger input event to validate
+        const inputEvent = new Event('input', { bubbles: true });
+        inputField.dispatchEvent(inputEvent);
+        
+        // Focus on next field
+        if (inputField === healthProblemInput) {
+          genderSelect.focus();
+        }
+      });
+      
+      resultsContainer.appendChild(resultItem);
+    });
+    
+    // Show results container
+    resultsContainer.classList.add('show');
+  }
+  
+  function initializeAutocompleteField(inputField, resultsContainer, type) {
+    let debounceTimer = null;
+    let pendingRequest = null;
+    
+    inputField.addEventListener('input', function() {
+      const inputValue = this.value.trim().toLowerCase();
       
-      // If no matches, hide results
-      if (matchingItems.length === 0) {
+      // Hide results if input is empty
+      if (!inputValue) {
+        clearTimeout(debounceTimer);
+        if (pendingRequest) {
+          pendingRequest.abort();
+        }
+        resultsContainer.innerHTML = '';
         resultsContainer.classList.remove('show');
         return;
       }
       
-      // Create results list
-      matchingItems.forEach(item => {
-        const resultItem = document.createElement('div');
-        resultItem.className = 'autocomplete-item';
-        
-        // Highlight the matching part
-        const itemText = item;
-        const matchIndex = itemText.toLowerCase().indexOf(inputValue);
-        
-        if (matchIndex >= 0) {
-          const beforeMatch = itemText.substring(0, matchIndex);
-          const matchText = itemText.substring(matchIndex, matchIndex + inputValue.length);
-          const afterMatch = itemText.substring(matchIndex + inputValue.length);
-          
-          resultItem.innerHTML = `${beforeMatch}<span class="autocomplete-highlight">${matchText}</span>${afterMatch}`;
-        } else {
-          resultItem.textContent = itemText;
+      // Wait for a pause in typing, and drop any lookup still in flight
+      clearTimeout(debounceTimer);
+      debounceTimer = setTimeout(async function() {
+        if (pendingRequest) {
+          pendingRequest.abort();
         }
+        pendingRequest = new AbortController();
         
-        // Add click event to select this item
-        resultItem.addEventListener('click', function() {
-          inputField.value = itemText;
-          resultsContainer.classList.remove('show');
-          
-          // Trigger input event to validate
-          const inputEvent = new Event('input', { bubbles: true });
-          inputField.dispatchEvent(inputEvent);
-          
-          // Focus on next field
-          if (inputField === healthProblemInput) {
-            genderSelect.focus();
+        let matchingItems;
+        try {
+          matchingItems = await fetchAutocomplete(inputValue, type, pendingRequest.signal);
+        } catch (error) {
+          if (error.name !== 'AbortError') {
+            console.error('Autocomplete error:', error);
           }
-        });
-        
-        resultsContainer.appendChild(resultItem);
-      });
-      
-      // Show results container
-      resultsContainer.classList.add('show');
+          return;
+        }
+        showAutocompleteResults(inputField, resultsContainer, inputValue, matchingItems);
+      }, 150);
     });
     
     // Hide results when clicking outside
@@ -613,160 +690,6 @@ document.addEventListener('DOMContentLoaded', function() {
     });
   }
   
-  // Main drug recommendation function
-  function getDrugRecommendation(healthProblem, gender, age, existingDrug) {
-    // Normalize inputs
-    const normalizedCondition = normalizeCondition(healthProblem);
-    const ageCategory = getAgeCategory(age);
-    
-    // Find best matching condition in our database
-    let matchedCondition = findBestMatchingCondition(normalizedCondition);
-    
-    // Get primary drug recommendation
-    let primaryDrug = null;
-    let drugDetails = {};
-    
-    if (matchedCondition) {
-      primaryDrug = healthConditionsDB[matchedCondition].primaryDrug;
-      drugDetails = healthConditionsDB[matchedCondition];
-    } else {
-      // Fallback for unknown conditions
-      return {
-        success: false,
-        message: "Could not find a specific recommendation for this health condition."
-      };
-    }
-    
-    // Check for drug interactions if existing drug is provided
-    let safetyInfo = {
-      safe: true,
-      message: "No known interactions with your current medication.",
-      severity: "low",
-      alternative: null
-    };
-    
-    if (existingDrug && primaryDrug) {
-      // Special check for aspirin with asthma (dangerous combination)
-      if (matchedCondition.toLowerCase() === "asthma" && existingDrug.toLowerCase().trim() === "aspirin") {
-        safetyInfo.safe = false;
-        safetyInfo.message = "WARNING: Aspirin should NOT be used by people with asthma. It can trigger bronchospasm and serious respiratory problems.";
-        safetyInfo.severity = "high";
-        safetyInfo.alternative = suggestAlternative(matchedCondition, "aspirin");
-      } else {
-        // Check for interactions between existing drug and recommended drug
-        const interaction = checkDrugInteraction(existingDrug, primaryDrug);
-        
-        if (interaction) {
-          safetyInfo.safe = false;
-          safetyInfo.message = interaction.description;
-          safetyInfo.severity = interaction.severity;
-          
-          // Suggest alternative medication
-          safetyInfo.alternative = suggestAlternative(matchedCondition, existingDrug);
-        }
-      }
-    }
-    
-    // Check for age-specific considerations
-    let ageWarning = null;
-    const drugClass = getDrugClass(primaryDrug);
-    
-    if (drugClass && ageConsiderations[ageCategory] && ageConsiderations[ageCategory][drugClass]) {
-      ageWarning = ageConsiderations[ageCategory][drugClass];
-    }
-    
-    // Check for gender-specific considerations
-    let genderWarning = null;
-    if (drugClass && genderConsiderations[gender] && genderConsiderations[gender][drugClass]) {
-      genderWarning = genderConsiderations[gender][drugClass];
-    }
-    
-    // Return complete recommendation
-    return {
-      success: true,
-      healthCondition: matchedCondition,
-      primaryDrug: primaryDrug,
-      drugDetails: drugDetails,
-      safetyInfo: safetyInfo,
-      ageWarning: ageWarning,
-      genderWarning: genderWarning,
-      alternativeDrugs: alternativeMedicationsDB[matchedCondition] || [],
-      drugClass: drugClass
-    };
-  }
-  
-  // Helper functions for drug recommendation
-  function findBestMatchingCondition(condition) {
-    // Check for exact match
-    for (const cond in healthConditionsDB) {
-      if (normalizeCondition(cond) === condition) {
-        return cond;
-      }
-    }
-    
-    // Check for partial match
-    for (const cond in healthConditionsDB) {
-      if (condition.includes(normalizeCondition(cond)) || normalizeCondition(cond).includes(condition)) {
-        return cond;
-      }
-    }
-    
-    return null;
-  }
-  
-  function checkDrugInteraction(drug1, drug2) {
-    const normalizedDrug1 = normalizeDrugName(drug1);
-    const normalizedDrug2 = normalizeDrugName(drug2);
-    
-    // Check direct interactions
-    for (const interaction in drugInteractionsDB) {
-      const [interactionDrug1, interactionDrug2] = interaction.split(',').map(d => normalizeDrugName(d));
-      
-      if ((normalizedDrug1 === interactionDrug1 && normalizedDrug2 === interactionDrug2) ||
-          (normalizedDrug1 === interactionDrug2 && normalizedDrug2 === interactionDrug1)) {
-        return drugInteractionsDB[interaction];
-      }
-    }
-    
-    // Check drug class interactions
-    const drug1Class = getDrugClass(drug1);
-    const drug2Class = getDrugClass(drug2);
-    
-    if (drug1Class && drug2Class) {
-      const classInteraction = `${drug1Class},${drug2Class}`;
-      const reverseClassInteraction = `${drug2Class},${drug1Class}`;
-      
-      if (drugInteractionsDB[classInteraction]) {
-        return drugInteractionsDB[classInteraction];
-      }
-      
-      if (drugInteractionsDB[reverseClassInteraction]) {
-        return drugInteractionsDB[reverseClassInteraction];
-      }
-    }
-    
-    return null;
-  }
-  
-  function suggestAlternative(condition, existingDrug) {
-    // Get list of alternatives for this condition
-    const alternatives = alternativeMedicationsDB[condition] || [];
-    
-    if (alternatives.length === 0) {
-      return null;
-    }
-    
-    // Find the first alternative that doesn't interact with the existing drug
-    for (const alt of alternatives) {
-      if (!checkDrugInteraction(existingDrug, alt)) {
-        return alt;
-      }
-    }
-    
-    // If all alternatives have interactions, return the first one with warning
-    return alternatives[0];
-  }
-  
   // Function to display standard recommendation results
   function displayRecommendation(recommendation) {
     outputContainer.innerHTML = '';
@@ -957,6 +880,24 @@ document.addEventListener('DOMContentLoaded', function() {
       `;
     }
     
+    // Add drug-drug interactions with current medications, if any
+    if (recommendation.safety.drug_interactions && recommendation.safety.drug_interactions.length > 0) {
+      html += `
+        <div class="dangerous-interaction">
+          <p><i class="fas fa-exclamation-triangle"></i> <strong>Drug Interactions:</strong></p>
+          <ul>
+      `;
+      
+      recommendation.safety.drug_interactions.forEach(interaction => {
+        html += `<li><strong>${escapeHtml(interaction.drugs.join(' + '))}</strong> (${escapeHtml(interaction.severity)}): ${escapeHtml(interaction.description)}</li>`;
+      });
+      
+      html += `
+          </ul>
+        </div>
+      `;
+    }
+    
     // Add top recommendations
     html += `
       <div class="top-recommendations">
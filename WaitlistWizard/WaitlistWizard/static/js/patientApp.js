@@ -47,69 +47,107 @@ function setCurrentDate() {
   document.getElementById('startDate').value = today;
 }
 
+/**
+ * Fetch ranked name suggestions from the server-side autocomplete index
+ */
+async function fetchAutocomplete(query, type, signal) {
+  const params = new URLSearchParams({ q: query, type: type, limit: 5 });
+  const response = await fetch(`/api/autocomplete?${params}`, { signal });
+  const data = await response.json();
+  return data.success ? data.results.map(result => result.name) : [];
+}
+
+/**
+ * Render autocomplete suggestions below a field
+ */
+function showAutocompleteResults(inputField, resultsContainer, inputValue, matchingItems) {
+  // Clear previous results
+  resultsContainer.innerHTML = '';
+  
+  // If no matches, hide results
+  if (matchingItems.length === 0) {
+    resultsContainer.classList.remove('show');
+    return;
+  }
+  
+  // Create results list
+  matchingItems.forEach(item => {
+    const resultItem = document.createElement('div');
+    resultItem.className = 'autocomplete-item';
+    
+    // Highlight the matching part
+    const itemText = item;
+    const matchIndex = itemText.toLowerCase().indexOf(inputValue);
+    
+    if (matchIndex >= 0) {
+      const beforeMatch = itemText.substring(0, matchIndex);
+      const matchText = itemText.substring(matchIndex, matchIndex + inputValue.length);
+      const afterMatch = itemText.substring(matchIndex + inputValue.length);
+      
+      resultItem.innerHTML = `${beforeMatch}<span class="autocomplete-highlight">${matchText}</span>${afterMatch}`;
+    } else {
+      resultItem.textContent = itemText;
+    }
+    
+    // Add click event to select this item
+    resultItem.addEventListener('click', function() {
+      inputField.value = itemText;
+      resultsContainer.classList.remove('show');
+      
+      // Trigger input event to validate
+      const inputEvent = new Event('input', { bubbles: true });
+      inputField.dispatchEvent(inputEvent);
+    });
+    
+    resultsContainer.appendChild(resultItem);
+  });
+  
+  // Show results container
+  resultsContainer.classList.add('show');
+}
+
 /**
  * Initialize autocomplete functionality for a field
  */
-function initializeAutocompleteField(inputField, resultsContainer, dataArray) {
-  if (!inputField || !resultsContainer || !dataArray) return;
+function initializeAutocompleteField(inputField, resultsContainer, type) {
+  if (!inputField || !resultsContainer) return;
+  
+  let debounceTimer = null;
+  let pendingRequest = null;
   
   inputField.addEventListener('input', function() {
     const inputValue = this.value.trim().toLowerCase();
     
-    // Clear previous results
-    resultsContainer.innerHTML = '';
-    
     // Hide results if input is empty
     if (!inputValue) {
+      clearTimeout(debounceTimer);
+      if (pendingRequest) {
+        pendingRequest.abort();
+      }
+      resultsContainer.innerHTML = '';
       resultsContainer.classList.remove('show');
       return;
     }
     
-    // Filter matching items
-    const matchingItems = dataArray.filter(item => 
-      item.toLowerCase().includes(inputValue)
-    ).slice(0, 5); // Limit to top 5 matches
-    
-    // If no matches, hide results
-    if (matchingItems.length === 0) {
-      resultsContainer.classList.remove('show');
-      return;
-    }
-    
-    // Create results list
-    matchingItems.forEach(item => {
-      const resultItem = document.createElement('div');
-      resultItem.className = 'autocomplete-item';
-      
-      // Highlight the matching part
-      const itemText = item;
-      const matchIndex = itemText.toLowerCase().indexOf(inputValue);
-      
-      if (matchIndex >= 0) {
-        const beforeMatch = itemText.substring(0, matchIndex);
-        const matchText = itemText.substring(matchIndex, matchIndex + inputValue.length);
-        const afterMatch = itemText.substring(matchIndex + inputValue.length);
-        
-        resultItem.innerHTML = `${beforeMatch}<span class="autocomplete-highlight">${matchText}</span>${afterMatch}`;
-      } else {
-        resultItem.textContent = itemText;
+    // Wait for a pause in typing, and drop any lookup still in flight
+    clearTimeout(debounceTimer);
+    debounceTimer = setTimeout(async function() {
+      if (pendingRequest) {
+        pendingRequest.abort();
       }
+      pendingRequest = new AbortController();
       
-      // Add click event to select this item
-      resultItem.addEventListener('click', function() {
-        inputField.value = itemText;
-        resultsContainer.classList.remove('show');
-        
-        // Trigger input event to validate
-        const inputEvent = new Event('input', { bubbles: true });
-        inputField.dispatchEvent(inputEvent);
-      });
-      
-      resultsContainer.appendChild(resultItem);
-    });
-    
-    // Show results container
-    resultsContainer.classList.add('show');
+      let matchingItems;
+      try {
+        matchingItems = await fetchAutocomplete(inputValue, type, pendingRequest.signal);
+      } catch (error) {
+        if (error.name !== 'AbortError') {
+          console.error('Autocomplete error:', error);
+        }
+        return;
+      }
+      showAutocompleteResults(inputField, resultsContainer, inputValue, matchingItems);
+    }, 150);
   });
   
   // Hide results when clicking outside
@@ -183,11 +221,11 @@ function initializeAutocompleteField(inputField, resultsContainer, dataArray) {
  * Initialize autocomplete for medication fields in patient section
  */
 function initializePatientAutocomplete() {
-  // Use the medicationsAutocomplete array for medication name suggestions
+  // Medication name suggestions come from /api/autocomplete
   initializeAutocompleteField(
     document.getElementById('medicationName'),
     document.getElementById('patientMedicationResults'),
-    medicationsAutocomplete
+    'medication'
   );
 }
 
@@ -0,0 +1,272 @@
+"""Audit storage for recommendation requests and responses.
+
+Requests are queued in memory and written by a background thread in batched
+inserts, so recording adds no database round trip to the request path. The
+engine is pooled; DATABASE_URL points it at Postgres, and without it a local
+SQLite file stands in. Records hold the patient's free-text symptoms, so
+nothing is recorded unless RECORD_RECOMMENDATIONS=1.
+
+Settings:
+    DATABASE_URL              SQLAlchemy URL, default sqlite:///recommendations.db
+    RECORD_RECOMMENDATIONS    set to 1 to enable recording (off by default)
+    RECORD_QUEUE_SIZE         records buffered before new ones are dropped, default 10000
+    RECORD_BATCH_SIZE         rows per insert, default 500
+    RECORD_FLUSH_SECONDS      longest a record waits in the buffer, default 1.0
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, Index, Integer, MetaData, String, Table, Text,
+                        create_engine, event, func, select)
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+recommendation_log = Table(
+    "recommendation_log", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("health_condition", String(100)),
+    Column("primary_condition", String(100)),
+    Column("gender", String(20)),
+    Column("age", Integer),
+    Column("age_category", String(20)),
+    Column("existing_drug", String(200)),
+    Column("symptom_text", Text),
+    Column("is_error", Boolean, nullable=False, default=False),
+    Column("has_dangerous_interaction", Boolean, nullable=False, default=False),
+    Column("top_medication", String(100)),
+    Column("request_json", Text, nullable=False),
+    Column("response_json", Text, nullable=False),
+    # Reporting queries filter by condition, then patient attributes, over a time range
+    Index("ix_recommendation_log_condition_patient", "primary_condition", "age_category", "gender", "created_at"),
+    Index("ix_recommendation_log_created_at", "created_at"),
+    Index("ix_recommendation_log_existing_drug", "existing_drug"),
+)
+
+
+def _make_engine(url):
+    # Hosted Postgres often hands out the legacy scheme SQLAlchemy no longer accepts
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @event.listens_for(engine, "connect")
+        def _sqlite_pragmas(dbapi_connection, _):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        return engine
+    return create_engine(url, pool_size=5, max_overflow=5, pool_pre_ping=True, pool_recycle=1800)
+
+
+def _age_or_none(age):
+    try:
+        return int(age)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text_or_none(value, limit=None):
+    if value is None or value == "":
+        return None
+    value = value if isinstance(value, str) else json.dumps(value)
+    return value[:limit] if limit else value
+
+
+def log_row(req, recommendation, request_data=None, created_at=None):
+    """Flatten one request/response pair into a recommendation_log row.
+
+    The filterable columns hold the validated RecommendationRequest fields, so
+    "Female " and "female" land in the same row group; request_json keeps the
+    payload as sent.
+    """
+    recommendation = recommendation or {}
+    patient = recommendation.get("patient") or {}
+    medications = recommendation.get("recommendations") or []
+    return {
+        "created_at": created_at or datetime.now(),
+        "health_condition": _text_or_none(req.health_condition, 100),
+        "primary_condition": recommendation.get("primary_condition"),
+        "gender": _text_or_none(req.gender, 20),
+        "age": _age_or_none(req.age),
+        "age_category": patient.get("age_category"),
+        "existing_drug": _text_or_none(", ".join(req.medications), 200),
+        "symptom_text": _text_or_none(req.symptom_text),
+        "is_error": bool(recommendation.get("error")),
+        "has_dangerous_interaction": bool((recommendation.get("safety") or {}).get("has_dangerous_interaction")),
+        "top_medication": medications[0]["medication"] if medications else None,
+        "request_json": json.dumps(request_data if isinstance(request_data, dict) else {}),
+        "response_json": json.dumps(recommendation),
+    }
+
+
+class RecommendationStore:
+    """Pooled engine plus a buffered background writer for recommendation_log"""
+
+    def __init__(self, url, queue_size=10000, batch_size=500, flush_seconds=1.0):
+        self.url = url
+        self.engine = _make_engine(url)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.written = 0
+        self._schema_ready = False
+        self._pid = None
+        self._writer = None
+        self._queue = None
+        self._start_lock = threading.Lock()
+        # Held while putting records and while flush() swaps in a new queue
+        self._queue_lock = threading.Lock()
+
+    def _ensure_started(self):
+        """Create the schema and writer thread on first use in this process"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked from a process that already used the pool; never share its connections
+                self.engine.dispose(close=False)
+            if not self._schema_ready:
+                metadata.create_all(self.engine)
+                self._schema_ready = True
+            self._start_writer()
+
+    def _start_writer(self):
+        # Threads do not survive fork, so each (pre-forked) worker starts its own writer, and a fresh
+        # lock in case the fork happened while another thread held it
+        self._queue_lock = threading.Lock()
+        self._replace_writer()
+        self._pid = os.getpid()
+
+    def _replace_writer(self):
+        """Start a writer on a new queue; returns the previous (queue, writer), if any"""
+        previous = self._queue, self._writer
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._writer = threading.Thread(target=self._run, args=(self._queue,), name="recommendation-writer",
+                                        daemon=True)
+        self._writer.start()
+        return previous
+
+    def record(self, req, recommendation, request_data=None):
+        """Queue one validated request, its response and the raw payload; never blocks the caller.
+
+        Serialization happens on the writer thread, so the recommendation must
+        not be mutated after it is handed over.
+        """
+        self._ensure_started()
+        try:
+            with self._queue_lock:
+                self._queue.put_nowait((req, recommendation, request_data, datetime.now()))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self, records):
+        while True:
+            rows = [records.get()]
+            if rows[0] is None:
+                return
+            deadline = time.monotonic() + self.flush_seconds
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    row = records.get(timeout=timeout) if timeout > 0 else records.get_nowait()
+                except queue.Empty:
+                    break
+                if row is None:
+                    self._write(rows)
+                    return
+                rows.append(row)
+            self._write(rows)
+
+    def _write(self, records):
+        try:
+            rows = [log_row(req, recommendation, request_data, created_at)
+                    for req, recommendation, request_data, created_at in records]
+            with self.engine.begin() as conn:
+                conn.execute(recommendation_log.insert(), rows)
+            self.written += len(records)
+        except Exception:
+            self.dropped += len(records)
+            logger.exception("Failed to write %d recommendation records", len(records))
+
+    def flush(self, timeout=10):
+        """Write everything buffered so far and restart the writer"""
+        if self._pid != os.getpid() or not self._writer.is_alive():
+            return
+        with self._start_lock:
+            # Records put after the swap go to the new writer; the old one drains its queue up to the sentinel
+            with self._queue_lock:
+                old_queue, old_writer = self._replace_writer()
+            old_queue.put(None)
+            old_writer.join(timeout)
+
+    def close(self, timeout=10):
+        if self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    def find(self, condition=None, gender=None, age_category=None, existing_drug=None,
+             since=None, until=None, limit=100, offset=0):
+        """Recorded recommendations matching the given attributes, newest first"""
+        query = select(recommendation_log).order_by(recommendation_log.c.created_at.desc())
+        if condition:
+            query = query.where(recommendation_log.c.primary_condition == condition.lower())
+        if age_category:
+            query = query.where(recommendation_log.c.age_category == age_category)
+        if gender:
+            query = query.where(recommendation_log.c.gender == gender)
+        if existing_drug:
+            query = query.where(recommendation_log.c.existing_drug == existing_drug)
+        if since:
+            query = query.where(recommendation_log.c.created_at >= since)
+        if until:
+            query = query.where(recommendation_log.c.created_at < until)
+        self._ensure_started()
+        with self.engine.connect() as conn:
+            rows = conn.execute(query.limit(limit).offset(offset)).mappings().all()
+        return [dict(row) for row in rows]
+
+    def condition_summary(self, since=None):
+        """Request counts and dangerous-interaction counts per condition"""
+        query = select(
+            recommendation_log.c.primary_condition,
+            func.count().label("requests"),
+            func.sum(func.cast(recommendation_log.c.has_dangerous_interaction, Integer)).label("dangerous_interactions"),
+        ).group_by(recommendation_log.c.primary_condition)
+        if since:
+            query = query.where(recommendation_log.c.created_at >= since)
+        self._ensure_started()
+        with self.engine.connect() as conn:
+            return [
+                {"condition": row.primary_condition, "requests": row.requests,
+                 "dangerous_interactions": int(row.dangerous_interactions or 0)}
+                for row in conn.execute(query)
+            ]
+
+
+def store_from_env():
+    """Build the store from environment settings, or None unless RECORD_RECOMMENDATIONS=1"""
+    if os.environ.get("RECORD_RECOMMENDATIONS", "0") != "1":
+        return None
+    store = RecommendationStore(
+        os.environ.get("DATABASE_URL", "sqlite:///recommendations.db"),
+        queue_size=int(os.environ.get("RECORD_QUEUE_SIZE", 10000)),
+        batch_size=int(os.environ.get("RECORD_BATCH_SIZE", 500)),
+        flush_seconds=float(os.environ.get("RECORD_FLUSH_SECONDS", 1.0)),
+    )
+    atexit.register(store.close)
+    return store
@@ -0,0 +1,554 @@
+"""Precompiled symptom matching engine used by analyze_symptoms"""
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque
+from functools import lru_cache
+
+# Words that carry extra weight when matched on their own
+WEIGHTED_WORDS = frozenset(["severe", "chronic", "acute", "recurring", "persistent"])
+
+# Score added once when any of a condition's context keywords is present
+CONTEXT_WEIGHT = 0.5
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_TOKEN = re.compile(r'\S+')
+
+# Tokens shorter than this are never fuzzy-corrected; too many real words are one edit apart
+FUZZY_MIN_TOKEN_LENGTH = 5
+
+
+def load_word_list(path):
+    """Lowercased words of a word list file with one word per line, such as /usr/share/dict/words"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return frozenset(line.strip().lower() for line in f if line.strip() and not line.startswith("#"))
+
+
+# Ordinary words one edit from a symptom word; never corrected, with or without a dictionary
+COMMON_WORDS = load_word_list(os.path.join(os.path.dirname(os.path.abspath(__file__)), "common_words.txt"))
+
+
+def normalize_symptom_text(symptom_text):
+    """Lowercase the text and strip punctuation, as the matcher expects"""
+    return _PUNCTUATION.sub('', symptom_text.lower())
+
+
+class AhoCorasick:
+    """Multi-pattern substring automaton; reports every pattern found in a text in one pass"""
+
+    def __init__(self, patterns):
+        # patterns: iterable of (pattern, payload); payloads of equal patterns are merged
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + (payload,)
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Merge outputs along the failure chain so matching never walks it
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Return the set of payloads whose pattern occurs anywhere in text"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def advance(self, text, start, state, states, found):
+        """Resume matching at text[start:] from state; returns the final state.
+
+        Appends the state reached after each character to states and an
+        (end, payload) pair to found for every match, so that a later call can
+        resume from any earlier position.
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        for end in range(start + 1, len(text) + 1):
+            char = text[end - 1]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            states.append(state)
+            for payload in out[state]:
+                found.append((end, payload))
+        return state
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (Levenshtein plus adjacent transpositions), capped at limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [i] * (len(b) + 1)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            # Substitution, then deletion and insertion, then transposition
+            value = previous[j - 1] if char == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == b[j - 1] and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, distance):
+    """Every string reachable from word by removing up to distance characters"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        variants |= frontier
+    return variants
+
+
+class FuzzyIndex:
+    """SymSpell-style deletion index: finds the closest vocabulary word within an edit distance"""
+
+    def __init__(self, vocabulary, max_distance):
+        self.vocabulary = frozenset(vocabulary)
+        self.max_distance = max_distance
+        # No word is within max_distance of a token longer than this, so longer tokens are never looked up
+        self.max_token_length = max(map(len, self.vocabulary), default=0) + max_distance
+        self._deletes = {}
+        for word in self.vocabulary:
+            for variant in _deletes(word, max_distance):
+                self._deletes.setdefault(variant, []).append(word)
+        # Patient text repeats the same everyday words; remember their answers
+        self.lookup = lru_cache(maxsize=65536)(self._lookup)
+
+    def _lookup(self, token, max_distance):
+        """(word, distance) of the best correction for token, or None"""
+        max_distance = min(max_distance, self.max_distance)
+        if len(token) > self.max_token_length:
+            return None
+        candidates = set()
+        for variant in _deletes(token, max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+        best = None
+        for word in sorted(candidates):
+            distance = edit_distance(token, word, max_distance)
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (word, distance)
+        return best
+
+
+class SymptomMatcher:
+    """Symptom/condition matcher compiled once from the clinical tables"""
+
+    def __init__(self, condition_symptoms, symptom_synonyms, context_keywords, max_fuzzy_distance=2, dictionary=None):
+        # dictionary: a full word list whose words are never corrected, which also lets long tokens
+        # outside it take two edits; COMMON_WORDS (tried, heard, pension) are never corrected either way
+        self.dictionary = frozenset(dictionary or ())
+        self._kept_words = COMMON_WORDS | self.dictionary
+        self.conditions = list(condition_symptoms)
+        self.symptoms = [list(condition_symptoms[c]) for c in self.conditions]
+
+        # Synonym expansion: synonym id -> main symptom, ids follow table order
+        self._expansions = []
+        self._synonyms = []
+        synonym_patterns = []
+        for main_symptom, synonyms in symptom_synonyms.items():
+            for synonym in synonyms:
+                synonym_patterns.append((synonym, len(self._expansions)))
+                self._expansions.append(main_symptom)
+                self._synonyms.append(synonym)
+        self._synonym_automaton = AhoCorasick(synonym_patterns)
+
+        # Phrase automaton over the expanded text: symptom phrases and context keywords
+        phrase_patterns = []
+        for cond_idx, symptoms in enumerate(self.symptoms):
+            for sym_idx, symptom in enumerate(symptoms):
+                phrase_patterns.append((symptom, ("symptom", cond_idx, sym_idx)))
+        self._context_keywords = {}
+        for condition, keywords in context_keywords.items():
+            if condition not in condition_symptoms:
+                continue
+            cond_idx = self.conditions.index(condition)
+            self._context_keywords[cond_idx] = list(keywords)
+            for keyword in keywords:
+                phrase_patterns.append((keyword, ("context", cond_idx, 0)))
+        self._phrase_automaton = AhoCorasick(phrase_patterns)
+
+        # Inverted index: significant word -> postings (condition, symptom, word position, weight)
+        self._word_index = {}
+        for cond_idx, symptoms in enumerate(self.symptoms):
+            for sym_idx, symptom in enumerate(symptoms):
+                for pos, word in enumerate(symptom.split()):
+                    if len(word) > 3:
+                        weight = 0.7 if word in WEIGHTED_WORDS else 0.5
+                        self._word_index.setdefault(word, []).append((cond_idx, sym_idx, pos, weight))
+
+        # Typo tolerance: which vocabulary words could have produced each symptom's match
+        self._related_words = {}
+        for condition, symptoms in condition_symptoms.items():
+            for symptom in symptoms:
+                words = set(symptom.split())
+                for synonym in symptom_synonyms.get(symptom, ()):
+                    words.update(synonym.split())
+                self._related_words[(condition, symptom)] = words
+            for keyword in context_keywords.get(condition, ()):
+                self._related_words.setdefault((condition, None), set()).update(keyword.split())
+        # Every word of every phrase the matcher looks for
+        self.words = frozenset(WEIGHTED_WORDS.union(
+            *(phrase.split() for phrase, _ in synonym_patterns + phrase_patterns)))
+        vocabulary = set()
+        for words in self._related_words.values():
+            vocabulary.update(w for w in words if len(w) >= FUZZY_MIN_TOKEN_LENGTH)
+        for synonyms in symptom_synonyms.values():
+            for synonym in synonyms:
+                vocabulary.update(w for w in synonym.split() if len(w) >= FUZZY_MIN_TOKEN_LENGTH)
+        self.fuzzy_index = FuzzyIndex(vocabulary, max_fuzzy_distance) if max_fuzzy_distance > 0 else None
+
+    def expand(self, text):
+        """Append the main symptom for every synonym present in text"""
+        matched = sorted(self._synonym_automaton.find(text))
+        if not matched:
+            return text
+        return text + "".join(f" {self._expansions[i]}" for i in matched)
+
+    def expansion(self, synonym_ids):
+        """Text expand() appends for the given synonym ids"""
+        return "".join(f" {self._expansions[i]}" for i in sorted(synonym_ids))
+
+    def match(self, text):
+        """Score every condition touched by normalized text.
+
+        Returns {condition: (score, matched_symptoms)} in condition table order;
+        conditions with no evidence at all are omitted since they score zero.
+        """
+        expanded_text, phrase_hits, word_hits, context_hits = self._evidence(text)
+        results = {}
+        for cond_idx in sorted(phrase_hits.keys() | word_hits.keys() | context_hits):
+            results[self.conditions[cond_idx]] = self.score_condition(
+                cond_idx, phrase_hits.get(cond_idx, set()), word_hits.get(cond_idx, ()), cond_idx in context_hits)
+        return results
+
+    def _evidence(self, text):
+        """(expanded text, phrase hits, word hits, context hits) by condition index"""
+        words = set(text.split())
+        expanded_text = self.expand(text)
+
+        phrase_hits = {}
+        context_hits = set()
+        for kind, cond_idx, sym_idx in self._phrase_automaton.find(expanded_text):
+            if kind == "symptom":
+                phrase_hits.setdefault(cond_idx, set()).add(sym_idx)
+            else:
+                context_hits.add(cond_idx)
+
+        word_hits = {}
+        for word in words:
+            for posting in self._word_index.get(word, ()):
+                word_hits.setdefault(posting[0], []).append(posting[1:])
+        return expanded_text, phrase_hits, word_hits, context_hits
+
+    @staticmethod
+    def _contributions(full, word_hits):
+        """(sym_idx, word position or -1 for the whole phrase, weight) in the order they are summed"""
+        # Replay contributions in symptom/word order so float sums are identical
+        events = [(sym_idx, -1, 1) for sym_idx in full]
+        events.extend(hit for hit in word_hits if hit[0] not in full)
+        events.sort()
+        return events
+
+    def score_condition(self, cond_idx, full, word_hits, context):
+        """(score, matched_symptoms) for one condition from its phrase, word and context evidence"""
+        events = self._contributions(full, word_hits)
+
+        score = 0
+        matched_symptoms = []
+        symptoms = self.symptoms[cond_idx]
+        last_sym_idx = None
+        for sym_idx, _, weight in events:
+            score += weight
+            if sym_idx != last_sym_idx:
+                matched_symptoms.append(symptoms[sym_idx])
+                last_sym_idx = sym_idx
+        if context:
+            score += CONTEXT_WEIGHT
+        return score, matched_symptoms
+
+    def explain(self, text):
+        """The evidence behind match(text) as {condition: [(rule, detail, weight), ...]}.
+
+        Rules are "phrase" for a symptom found as written, "synonym" for one
+        reached through synonym expansion, "word" for a single word of an
+        otherwise unmatched symptom and "context" for the context keywords
+        present. A condition's weights add up to its match() score.
+        """
+        expanded_text, phrase_hits, word_hits, context_hits = self._evidence(text)
+        synonyms_for = {}
+        for i in sorted(self._synonym_automaton.find(text)):
+            synonyms_for.setdefault(self._expansions[i], []).append(self._synonyms[i])
+
+        evidence = {}
+        for cond_idx in sorted(phrase_hits.keys() | word_hits.keys() | context_hits):
+            symptoms = self.symptoms[cond_idx]
+            contributions = []
+            for sym_idx, pos, weight in self._contributions(phrase_hits.get(cond_idx, set()), word_hits.get(cond_idx, ())):
+                symptom = symptoms[sym_idx]
+                if pos >= 0:
+                    contributions.append(("word", f"{symptom.split()[pos]} ({symptom})", weight))
+                elif symptom in text or symptom not in synonyms_for:
+                    contributions.append(("phrase", symptom, weight))
+                else:
+                    contributions.append(("synonym", f"{', '.join(synonyms_for[symptom])} -> {symptom}", weight))
+            if cond_idx in context_hits:
+                keywords = [keyword for keyword in self._context_keywords[cond_idx] if keyword in expanded_text]
+                contributions.append(("context", ", ".join(keywords), CONTEXT_WEIGHT))
+            evidence[self.conditions[cond_idx]] = contributions
+        return evidence
+
+    def correct(self, text, max_distance):
+        """Replace misspelled tokens with their closest vocabulary word.
+
+        Tokens allow one edit; tokens of 8 or more characters allow up to
+        max_distance only when a dictionary was given and they are not in it.
+        Dictionary words and COMMON_WORDS are never corrected. Returns (corrected_text, corrections) where corrections is a list of
+        (token, word, distance); the text is returned unchanged when nothing was corrected.
+        """
+        if self.fuzzy_index is None or max_distance <= 0:
+            return text, []
+        corrections = {}
+        for token in set(text.split()):
+            found = self.correct_token(token, max_distance)
+            if found is not None:
+                corrections[token] = found
+        if not corrections:
+            return text, []
+        corrected = _TOKEN.sub(lambda m: corrections[m.group()][0] if m.group() in corrections else m.group(), text)
+        return corrected, [(token, word, distance) for token, (word, distance) in sorted(corrections.items())]
+
+    def correct_token(self, token, max_distance):
+        """(word, distance) correcting one token, or None when it is kept as typed"""
+        if self.fuzzy_index is None or max_distance <= 0:
+            return None
+        if not FUZZY_MIN_TOKEN_LENGTH <= len(token) <= self.fuzzy_index.max_token_length:
+            return None
+        if token in self.fuzzy_index.vocabulary or token in self._word_index or token in self._kept_words:
+            return None
+        # Two edits reach many ordinary long words, so they need a dictionary to rule those out
+        return self.fuzzy_index.lookup(token, max_distance if len(token) >= 8 and self.dictionary else 1)
+
+    def fuzzy_contributions(self, condition, matched_symptoms, corrections):
+        """Corrections whose word could have produced one of a condition's matches"""
+        related = set(self._related_words.get((condition, None), ()))
+        for symptom in matched_symptoms:
+            related |= self._related_words.get((condition, symptom), set())
+        return [{"input": token, "matched": word, "distance": distance}
+                for token, word, distance in corrections if word in related]
+
+
+def common_prefix_length(a, b):
+    """Length of the longest common prefix of two strings"""
+    hi = min(len(a), len(b))
+    if a[:hi] == b[:hi]:
+        return hi
+    # Bisect on slice comparisons, which run in C, instead of walking characters
+    lo = 0
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class IncrementalMatch:
+    """Matcher state for one text that changes a little at a time, as while a patient types.
+
+    Keeps the tokens and their corrections, the automaton state after every
+    character together with the matches found so far, and each condition's
+    (score, matched_symptoms). update() keeps everything before the first
+    changed character, rescans only from there, and rescores only the
+    conditions whose evidence changed; its answers equal correct() + match()
+    on the full text.
+    """
+
+    def __init__(self, matcher, max_distance):
+        self.matcher = matcher
+        self.max_distance = max_distance
+        self.text = ""
+        self.corrected = ""
+        # Per token: end offset in text, end offset in corrected, and (token, word, correction)
+        self._ends = []
+        self._corrected_ends = []
+        self._tokens = []
+        self._word_counts = Counter()
+        self._corrections = Counter()
+        # cond_idx -> {(sym_idx, pos, weight)} from the words present
+        self._word_hits = {}
+        # Automaton state after each character of corrected, and the (end, payload) matches found
+        self._synonym_states = array("I", [0])
+        self._synonym_found = []
+        self._synonym_counts = Counter()
+        self._phrase_states = array("I", [0])
+        self._phrase_found = []
+        self._phrase_counts = Counter()
+        # Phrase payloads present in the expanded text, and cond_idx -> (score, matched_symptoms)
+        self._present = set()
+        self._scores = {}
+
+    def update(self, text):
+        """Move to new normalized text; returns (matches, corrections) as match() and correct() would"""
+        dirty = set()
+        corrected = self._retokenize(text, dirty)
+        corrected_from = common_prefix_length(self.corrected, corrected)
+        self.corrected = corrected
+
+        synonyms = self.matcher._synonym_automaton
+        self._rescan(synonyms, self._synonym_states, self._synonym_found, self._synonym_counts, corrected_from)
+        self._rescan(self.matcher._phrase_automaton, self._phrase_states, self._phrase_found,
+                     self._phrase_counts, corrected_from)
+
+        # The expansion is a few words, so it is rescanned from the end-of-text state every time
+        present = set(self._phrase_counts)
+        if self._synonym_counts:
+            expansion_found = []
+            self.matcher._phrase_automaton.advance(self.matcher.expansion(self._synonym_counts), 0,
+                                                   self._phrase_states[-1], [], expansion_found)
+            present.update(payload for _, payload in expansion_found)
+        dirty.update(cond_idx for _, cond_idx, _ in present ^ self._present)
+        self._present = present
+
+        if dirty:
+            full = {}
+            context_hits = set()
+            for kind, cond_idx, sym_idx in present:
+                if cond_idx not in dirty:
+                    continue
+                if kind == "symptom":
+                    full.setdefault(cond_idx, set()).add(sym_idx)
+                else:
+                    context_hits.add(cond_idx)
+            for cond_idx in dirty:
+                word_hits = self._word_hits.get(cond_idx, ())
+                if cond_idx in full or word_hits or cond_idx in context_hits:
+                    self._scores[cond_idx] = self.matcher.score_condition(
+                        cond_idx, full.get(cond_idx, set()), word_hits, cond_idx in context_hits)
+                else:
+                    self._scores.pop(cond_idx, None)
+
+        conditions = self.matcher.conditions
+        matches = {conditions[cond_idx]: self._scores[cond_idx] for cond_idx in sorted(self._scores)}
+        return matches, sorted(self._corrections)
+
+    def _retokenize(self, text, dirty):
+        """Re-read tokens from the first one the edit can touch; returns the new corrected text"""
+        changed_from = common_prefix_length(self.text, text)
+        # A token ending exactly at the edit may have been extended, so only earlier ones are kept
+        keep = bisect_left(self._ends, changed_from)
+        for token, word, correction in self._tokens[keep:]:
+            self._remove_word(word, dirty)
+            if correction is not None:
+                self._discount(self._corrections, (token, *correction))
+        del self._ends[keep:], self._corrected_ends[keep:], self._tokens[keep:]
+
+        position = self._ends[-1] if keep else 0
+        corrected_position = self._corrected_ends[-1] if keep else 0
+        pieces = [self.corrected[:corrected_position]]
+        for token_match in _TOKEN.finditer(text, position):
+            token = token_match.group()
+            correction = self.matcher.correct_token(token, self.max_distance)
+            word = token
+            if correction is not None:
+                word = correction[0]
+                self._corrections[(token, *correction)] += 1
+            pieces.append(text[position:token_match.start()])
+            pieces.append(word)
+            corrected_position += token_match.start() - position + len(word)
+            position = token_match.end()
+            self._ends.append(position)
+            self._corrected_ends.append(corrected_position)
+            self._tokens.append((token, word, correction))
+            self._add_word(word, dirty)
+        pieces.append(text[position:])
+        self.text = text
+        return "".join(pieces)
+
+    def _rescan(self, automaton, states, found, counts, start):
+        """Drop matches ending past start and scan the corrected text again from there"""
+        while found and found[-1][0] > start:
+            self._discount(counts, found.pop()[1])
+        del states[start + 1:]
+        first = len(found)
+        automaton.advance(self.corrected, start, states[start], states, found)
+        for _, payload in found[first:]:
+            counts[payload] += 1
+
+    def _add_word(self, word, dirty):
+        self._word_counts[word] += 1
+        if self._word_counts[word] == 1:
+            for cond_idx, *hit in self.matcher._word_index.get(word, ()):
+                self._word_hits.setdefault(cond_idx, set()).add(tuple(hit))
+                dirty.add(cond_idx)
+
+    def _remove_word(self, word, dirty):
+        if not self._discount(self._word_counts, word):
+            for cond_idx, *hit in self.matcher._word_index.get(word, ()):
+                hits = self._word_hits[cond_idx]
+                hits.discard(tuple(hit))
+                if not hits:
+                    del self._word_hits[cond_idx]
+                dirty.add(cond_idx)
+
+    @staticmethod
+    def _discount(counts, key):
+        """Decrement a counter entry, deleting it at zero; returns the remaining count"""
+        remaining = counts[key] - 1
+        if remaining:
+            counts[key] = remaining
+        else:
+            del counts[key]
+        return remaining
+
+    def nbytes(self):
+        """Approximate memory held by this state, for session eviction"""
+        return (sys.getsizeof(self.text) + sys.getsizeof(self.corrected)
+                + self._synonym_states.itemsize * (len(self._synonym_states) + len(self._phrase_states))
+                # Token lists hold a pointer each, plus the small ints and tuples they point to
+                + 120 * len(self._ends)
+                + 80 * (len(self._synonym_found) + len(self._phrase_found)))
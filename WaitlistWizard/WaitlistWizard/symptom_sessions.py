@@ -0,0 +1,115 @@
+"""Live symptom-analysis sessions behind /api/analyze-symptoms/live.
+
+Each session holds an IncrementalMatch for one patient's text box, so a
+keystroke costs work proportional to the edit rather than to the whole text.
+Sessions live in a per-process LRU: idle ones expire after a TTL, and the
+least recently used are dropped whenever the estimated memory of all
+sessions exceeds a cap. A request for an unknown or evicted session simply
+starts a new one, so eviction only costs the client one full scan; the same
+happens when a request lands on a different worker process.
+
+Settings:
+    SYMPTOM_SESSION_TTL        idle seconds before a session expires, default 900
+    SYMPTOM_SESSION_MAX_BYTES  memory cap across all sessions, default 64 MiB
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from symptom_matcher import IncrementalMatch
+
+
+class SymptomSession:
+    """One client's incremental match state, updated under its own lock"""
+
+    def __init__(self, matcher, max_distance):
+        self.state = IncrementalMatch(matcher, max_distance)
+        self.lock = threading.Lock()
+        self.nbytes = self.state.nbytes()
+        self.expires = 0.0
+
+
+class SessionStore:
+    """LRU of live sessions bounded by idle time and total estimated bytes"""
+
+    def __init__(self, matcher, max_distance, ttl, max_bytes):
+        self.matcher = matcher
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def open(self, session_id=None):
+        """(session_id, session) for a live session, starting a new one if it is unknown or expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session_id = secrets.token_urlsafe(16)
+                session = SymptomSession(self.matcher, self.max_distance)
+                self._sessions[session_id] = session
+                self._bytes += session.nbytes
+            self._sessions.move_to_end(session_id)
+            session.expires = now + self.ttl
+            return session_id, session
+
+    def update(self, session_id, text):
+        """Apply new normalized text to a session; returns (matches, corrections)"""
+        session_id, session = self.open(session_id)
+        with session.lock:
+            result = session.state.update(text)
+            nbytes = session.state.nbytes()
+        with self._lock:
+            # The session may have been evicted meanwhile; then it no longer counts
+            if self._sessions.get(session_id) is session:
+                self._bytes += nbytes - session.nbytes
+                session.nbytes = nbytes
+                self._evict(keep=session_id)
+        return session_id, result
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._bytes -= session.nbytes
+            return session is not None
+
+    def _expire(self, now):
+        # Sessions are kept in last-use order, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.expires >= now:
+                break
+            del self._sessions[session_id]
+            self._bytes -= session.nbytes
+
+    def _evict(self, keep):
+        # The session just used is never evicted, even if it alone exceeds the cap
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            session_id, session = self._sessions.popitem(last=False)
+            if session_id == keep:
+                self._sessions[session_id] = session
+                self._sessions.move_to_end(session_id, last=False)
+                break
+            self._bytes -= session.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self._bytes, "evictions": self.evictions}
+
+
+def sessions_from_env(matcher, max_distance):
+    """SessionStore configured from SYMPTOM_SESSION_* environment variables"""
+    return SessionStore(
+        matcher,
+        max_distance,
+        ttl=float(os.environ.get("SYMPTOM_SESSION_TTL", 900)),
+        max_bytes=int(os.environ.get("SYMPTOM_SESSION_MAX_BYTES", 64 * 1024 * 1024)),
+    )
@@ -0,0 +1,106 @@
+"""Synthetic patient data generated from the clinical tables, for benchmarks and load tests"""
+import random
+
+from main import condition_symptoms, medication_effectiveness, symptom_synonyms
+
+GENDERS = ["male", "female", "other"]
+
+# One representative age per age category
+AGES = [8, 42, 77]
+
+EXISTING_DRUGS = ["", "", "", "aspirin", "ibuprofen", "caffeine", "alcohol", "warfarin", "Lisinopril"]
+
+_OPENERS = [
+    "I have been having", "For the past few days I've had", "Lately I notice", "My main problem is",
+    "I keep getting", "Since last week there is", "I am worried about", "It started with"
+]
+_CONNECTORS = [", and", " and also", ". I also have", ", plus", ". Sometimes", " along with", "; there is"]
+_FILLERS = [
+    "it gets worse at night", "mostly in the morning", "after I eat", "when I walk upstairs",
+    "it comes and goes", "my family says I look pale", "nothing seems to help", "I work long shifts"
+]
+_MODIFIERS = ["", "", "", "severe ", "chronic ", "mild ", "persistent ", "recurring "]
+
+
+def _symptom_phrase(rng, condition):
+    symptom = rng.choice(condition_symptoms[condition])
+    # Sometimes describe it the way patients do, with a synonym instead of the clinical term
+    if symptom in symptom_synonyms and rng.random() < 0.4:
+        symptom = rng.choice(symptom_synonyms[symptom])
+    return rng.choice(_MODIFIERS) + symptom
+
+
+def symptom_text(rng, condition=None, min_symptoms=1, max_symptoms=4, noise=0.3):
+    """One realistic free-text symptom description, mostly about one condition"""
+    condition = condition or rng.choice(list(condition_symptoms))
+    parts = [rng.choice(_OPENERS), " ", _symptom_phrase(rng, condition)]
+    for _ in range(rng.randint(min_symptoms, max_symptoms) - 1):
+        # Occasionally mix in a symptom of another condition, as real patients do
+        other = rng.choice(list(condition_symptoms)) if rng.random() < noise else condition
+        parts += [rng.choice(_CONNECTORS), " ", _symptom_phrase(rng, other)]
+    if rng.random() < noise:
+        parts += [", ", rng.choice(_FILLERS)]
+    return "".join(parts) + "."
+
+
+def generate_symptom_texts(n, seed=0, **kwargs):
+    """Yield n (condition, text) pairs; deterministic for a given seed"""
+    rng = random.Random(seed)
+    conditions = list(condition_symptoms)
+    for _ in range(n):
+        condition = rng.choice(conditions)
+        yield condition, symptom_text(rng, condition, **kwargs)
+
+
+def generate_patients(n, seed=0, symptom_rate=0.5):
+    """Yield n /api/ai-recommendation payloads; deterministic for a given seed"""
+    rng = random.Random(seed)
+    conditions = list(medication_effectiveness)
+    for _ in range(n):
+        condition = rng.choice(conditions)
+        has_symptoms = rng.random() < symptom_rate
+        yield {
+            "healthProblem": "unknown" if has_symptoms and rng.random() < 0.5 else condition,
+            "gender": rng.choice(GENDERS),
+            "age": rng.randint(1, 95),
+            "existingDrug": rng.choice(EXISTING_DRUGS),
+            "symptomText": symptom_text(rng, condition) if has_symptoms else ""
+        }
+
+
+def long_symptom_text(rng, target_chars=4000):
+    """A rambling multi-paragraph description of at least target_chars characters"""
+    parts = []
+    size = 0
+    while size < target_chars:
+        part = symptom_text(rng, min_symptoms=3, max_symptoms=6, noise=0.6)
+        parts.append(part)
+        size += len(part) + 1
+    return " ".join(parts)
+
+
+def adversarial_symptom_texts(target_chars=4000):
+    """Inputs that stress the matcher: near-miss prefixes, repetition, punctuation, huge tokens"""
+    near_misses = " ".join(symptom[:-1] for symptoms in condition_symptoms.values() for symptom in symptoms)
+    return {
+        "repeated-prefix": ("shortness of shortness of breat " * (target_chars // 32 + 1))[:target_chars],
+        "near-miss-phrases": (near_misses + " ") * (target_chars // len(near_misses) + 1),
+        "single-char": "a" * target_chars,
+        "punctuation": ("!?.,;:-" * (target_chars // 7 + 1))[:target_chars],
+        "one-huge-token": "headache" * (target_chars // 8),
+        "every-symptom": " ".join(s for symptoms in condition_symptoms.values() for s in symptoms),
+    }
+
+
+_NAME_SYLLABLES = ["ba", "ce", "di", "fo", "gu", "ha", "je", "ki", "lo", "mu", "na", "pe", "qui", "ro", "sa",
+                   "te", "vi", "wo", "xa", "ze", "zy", "tr", "ph", "ol", "in", "ex"]
+
+
+def synthetic_names(count, seed=0):
+    """count made-up drug and condition names of one to three words, for sizing the autocomplete index"""
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice(_NAME_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    return [" ".join(word() for _ in range(rng.randint(1, 3))).title() for _ in range(count)]
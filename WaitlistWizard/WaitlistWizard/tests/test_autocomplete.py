@@ -0,0 +1,55 @@
+"""PrefixIndex against a brute-force ranking of every entry"""
+import random
+import time
+
+import pytest
+
+from autocomplete import EXACT, PREFIX, SUBSTRING, WORD_PREFIX, PrefixIndex, normalize_query
+from synthetic_data import synthetic_names
+
+
+@pytest.fixture(scope="module")
+def index():
+    return PrefixIndex((name, "medication") for name in synthetic_names(5000, seed=7))
+
+
+def _brute_force(index, query, limit):
+    ranked = []
+    for name, lowered in zip(index.names, index.lowered):
+        if lowered == query:
+            tier = EXACT
+        elif lowered.startswith(query):
+            tier = PREFIX
+        elif f" {query}" in lowered:
+            tier = WORD_PREFIX
+        elif query in lowered:
+            tier = SUBSTRING
+        else:
+            continue
+        ranked.append((tier, len(lowered), lowered, name))
+    return tuple((name, "medication") for *_, name in sorted(ranked)[:limit])
+
+
+def _queries(index, count, seed=3):
+    rng = random.Random(seed)
+    queries = ["a", "q", "zq", "xaz", "e o", "quiqu", "nothing like it"]
+    for lowered in rng.sample(index.lowered, count):
+        start = rng.randrange(len(lowered))
+        queries.append(lowered[start:start + rng.randint(1, 6)].strip() or lowered[:1])
+    return queries
+
+
+def test_search_matches_brute_force(index):
+    for query in _queries(index, 300):
+        for limit in (1, 10, 50):
+            assert index._search(normalize_query(query), limit) == _brute_force(index, query, limit), (query, limit)
+
+
+def test_short_queries_do_not_scan_every_entry():
+    big = PrefixIndex((name, "medication") for name in synthetic_names(50_000, seed=7))
+    queries = [q for q in _queries(big, 200) if len(q) <= 2]
+    started = time.perf_counter()
+    for query in queries:
+        big._search(query, 10)
+    # A full scan of 50k names costs milliseconds per query; the gram postings answer in microseconds
+    assert (time.perf_counter() - started) / len(queries) < 0.001
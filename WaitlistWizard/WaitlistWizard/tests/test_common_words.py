@@ -0,0 +1,20 @@
+"""common_words.txt is what common_words.py generates from the current symptom vocabulary"""
+import pytest
+
+import common_words
+import main
+from symptom_matcher import COMMON_WORDS, SymptomMatcher
+
+
+def test_shipped_list_is_up_to_date():
+    wordfreq = pytest.importorskip("wordfreq")
+    matcher = SymptomMatcher(main.condition_symptoms, main.symptom_synonyms, main.condition_context_keywords,
+                             max_fuzzy_distance=1)
+    assert set(common_words.common_words(matcher, wordfreq.top_n_list("en", 30000))) == COMMON_WORDS
+
+
+def test_default_matcher_keeps_common_words():
+    assert main.FUZZY_MAX_DISTANCE == 1
+    for word in ["tried", "right", "pension", "heard"]:
+        assert main.symptom_matcher.correct_token(word, main.FUZZY_MAX_DISTANCE) is None
+    assert main.symptom_matcher.correct_token("dizzyness", main.FUZZY_MAX_DISTANCE) == ("dizziness", 1)
@@ -0,0 +1,19 @@
+"""compiled_kb.py's reference tables and compile step against the shipped sources"""
+import compiled_kb
+import main
+from knowledge_base import KnowledgeBase
+
+
+def test_reference_tables_parse_the_shipped_sources():
+    tables = compiled_kb.reference_tables(main)
+    assert tables["condition_symptoms"] is main.condition_symptoms
+    assert tables["health_conditions"]["hypertension"]["primaryDrug"]
+
+
+def test_compile_writes_a_loadable_file(tmp_path):
+    path = tmp_path / "knowledge_base.kb"
+    assert compiled_kb.main([str(path)]) == 0
+    kb = KnowledgeBase.load(str(path))
+    assert kb.fingerprint == main.get_knowledge_base().fingerprint
+    expected = compiled_kb.reference_tables(main)["health_conditions"]
+    assert kb.reference["health_conditions"]["hypertension"]["primaryDrug"] == expected["hypertension"]["primaryDrug"]
@@ -0,0 +1,58 @@
+"""IncrementalMatch against correct() + match() on the full text after every edit"""
+import random
+
+import pytest
+
+import main
+from symptom_matcher import IncrementalMatch, SymptomMatcher, normalize_symptom_text
+
+# Misspellings the fuzzy index corrects, and ordinary words it must leave alone
+EXTRA_WORDS = ["dizzyness", "shortnes", "breth", "hedache", "tried", "heard", "right", "a", "the", "and", "x"]
+
+
+def _vocabulary():
+    words = set(main.symptom_synonyms)
+    for phrases in list(main.condition_symptoms.values()) + list(main.symptom_synonyms.values()):
+        for phrase in phrases:
+            words.update(phrase.split())
+    return sorted(words) + EXTRA_WORDS
+
+
+def _edit(text, rng, vocabulary):
+    """One keystroke-sized change: type part of a word, delete a span, insert a word or backspace"""
+    op = rng.random()
+    if op < 0.5 or not text:
+        word = rng.choice(vocabulary)
+        return text + rng.choice([" ", "", "  "]) + word[:rng.randint(1, len(word))]
+    if op < 0.7:
+        start = rng.randrange(len(text))
+        return text[:start] + text[start + rng.randint(1, 8):]
+    if op < 0.85:
+        at = rng.randrange(len(text) + 1)
+        return text[:at] + rng.choice(vocabulary + [" "]) + text[at:]
+    return text[:-rng.randint(1, 3)]
+
+
+@pytest.mark.parametrize("max_distance, dictionary", [(0, None), (1, None), (2, None), (2, {"tried", "heard"})])
+def test_updates_equal_full_analysis(max_distance, dictionary):
+    matcher = SymptomMatcher(main.condition_symptoms, main.symptom_synonyms, main.condition_context_keywords,
+                             max_fuzzy_distance=max_distance, dictionary=dictionary)
+    vocabulary = _vocabulary()
+    rng = random.Random(max_distance)
+    for _ in range(100):
+        state = IncrementalMatch(matcher, max_distance)
+        text = ""
+        for _ in range(30):
+            text = _edit(text, rng, vocabulary)
+            normalized = normalize_symptom_text(text)
+            corrected, corrections = matcher.correct(normalized, max_distance)
+            assert state.update(normalized) == (matcher.match(corrected), corrections), normalized
+
+
+@pytest.mark.parametrize("max_distance", [1, 2])
+def test_common_words_are_kept_without_a_dictionary(max_distance):
+    matcher = SymptomMatcher(main.condition_symptoms, main.symptom_synonyms, main.condition_context_keywords,
+                             max_fuzzy_distance=max_distance)
+    text = normalize_symptom_text("Blurry vision at night since I tried the new pills; right eye, heard a pension")
+    assert matcher.correct(text, max_distance) == (text, [])
+    assert matcher.correct("dizzyness", max_distance) == ("dizziness", [("dizzyness", "dizziness", 1)])
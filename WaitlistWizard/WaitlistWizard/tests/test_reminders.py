@@ -0,0 +1,174 @@
+"""ReminderSchedule.due() against walking every reminder through every day of the window"""
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from reminders import ReminderSchedule
+from validation import DAY_NAMES, REPEAT_PATTERNS
+from waitlist import Snapshots
+
+# datetime.weekday() numbers each fixed pattern repeats on
+PATTERN_WEEKDAYS = {"daily": range(7), "weekdays": range(5), "weekends": (5, 6)}
+
+
+def _repeats_on(reminder, day):
+    if reminder["repeat_pattern"] == "custom":
+        return DAY_NAMES[day.weekday()] in reminder["selected_days"]
+    return day.weekday() in PATTERN_WEEKDAYS[reminder["repeat_pattern"]]
+
+
+def reference_due(reminders, window, now, patient_id=None):
+    """(due_at, id) of every occurrence in the window, found by checking each reminder on each day"""
+    start = now.replace(second=0, microsecond=0, tzinfo=None)
+    end = start + timedelta(minutes=window)
+    occurrences = []
+    for reminder_id, reminder in reminders.items():
+        if not reminder["active"] or patient_id not in (None, reminder["patient_id"]):
+            continue
+        day = start.replace(hour=0, minute=0)
+        while day < end:
+            due_at = day + timedelta(minutes=reminder["minute"])
+            if start <= due_at < end and _repeats_on(reminder, day):
+                occurrences.append((due_at, reminder_id))
+            day += timedelta(days=1)
+    # Occurrences at the same minute come in slot order, the low bits of the id
+    return sorted(occurrences, key=lambda occurrence: (occurrence[0], occurrence[1] & 0xFFFFFFFF))
+
+
+def _due(schedule, window, now, patient_id=None):
+    occurrences, truncated = schedule.due(window, now=now, patient_id=patient_id, limit=10 ** 6)
+    assert not truncated
+    return [(datetime.fromisoformat(entry["due_at"]).replace(tzinfo=None), entry["id"]) for entry in occurrences]
+
+
+def _random_reminder(rng):
+    pattern = rng.choice(REPEAT_PATTERNS)
+    return {
+        "patient_id": f"p{rng.randrange(20)}",
+        "medication": rng.choice(["Metformin", "Lisinopril", "Aspirin"]),
+        # Bias towards the ends of the day, where windows cross midnight
+        "minute": rng.choice([rng.randrange(1440), rng.randrange(10), 1439 - rng.randrange(10)]),
+        "repeat_pattern": pattern,
+        "selected_days": rng.sample(DAY_NAMES, rng.randint(0, 7)) if pattern == "custom" else [],
+        "dosage": rng.choice(["", "10mg"]),
+        "active": rng.random() < 0.8,
+    }
+
+
+def _random_schedule(tz, rng, steps=600):
+    schedule, reminders = ReminderSchedule(tz=tz), {}
+    for _ in range(steps):
+        op = rng.random()
+        if op < 0.6 or not reminders:
+            reminder = _random_reminder(rng)
+            reminders[schedule.add(**reminder)["id"]] = reminder
+        elif op < 0.8:
+            reminder_id, reminder = rng.choice(list(reminders)), _random_reminder(rng)
+            assert schedule.update(reminder_id, **reminder)["id"] == reminder_id
+            reminders[reminder_id] = reminder
+        else:
+            reminder_id = rng.choice(list(reminders))
+            assert schedule.remove(reminder_id)["id"] == reminder_id
+            del reminders[reminder_id]
+            assert schedule.get(reminder_id) is None
+    return schedule, reminders
+
+
+@pytest.mark.parametrize("tz", [timezone.utc, ZoneInfo("America/New_York")], ids=["utc", "new-york"])
+def test_due_matches_reference_across_day_boundaries(tz):
+    rng = random.Random(21)
+    schedule, reminders = _random_schedule(tz, rng)
+    # Friday night through the weekend into Monday, and the night the New York clocks go forward
+    starts = [datetime(2026, 3, 6, 23, 55, 30), datetime(2026, 3, 7, 23, 59), datetime(2026, 3, 8, 0, 0),
+              datetime(2026, 3, 8, 1, 58), datetime(2026, 3, 9, 0, 1)]
+    starts += [datetime(2026, 3, 6) + timedelta(minutes=rng.randrange(4 * 1440)) for _ in range(10)]
+    for start in starts:
+        now = start.replace(tzinfo=tz)
+        for window in (1, 10, 90, 1440, 1500, 7 * 1440):
+            assert _due(schedule, window, now) == reference_due(reminders, window, now), (start, window)
+            patient_id = f"p{rng.randrange(20)}"
+            assert _due(schedule, window, now, patient_id) == reference_due(reminders, window, now, patient_id)
+
+
+def test_weekday_reminder_follows_the_day_after_midnight():
+    schedule = ReminderSchedule()
+    weekdays = schedule.add("p1", "Aspirin", 5, "weekdays")
+    daily = schedule.add("p1", "Metformin", 5, "daily")
+    # Friday 23:58, window reaching Saturday 00:08
+    occurrences, truncated = schedule.due(10, now=datetime(2026, 3, 6, 23, 58, tzinfo=timezone.utc))
+    assert [entry["id"] for entry in occurrences] == [daily["id"]]
+    assert occurrences[0]["due_at"] == "2026-03-07T00:05:00+00:00"
+    assert not truncated
+    # Sunday 23:58, window reaching Monday 00:08
+    occurrences, _ = schedule.due(10, now=datetime(2026, 3, 8, 23, 58, tzinfo=timezone.utc))
+    assert [entry["id"] for entry in occurrences] == [weekdays["id"], daily["id"]]
+
+
+def test_due_truncates_at_limit():
+    rng = random.Random(3)
+    schedule, reminders = _random_schedule(timezone.utc, rng)
+    now = datetime(2026, 3, 6, 12, 0, tzinfo=timezone.utc)
+    expected = reference_due(reminders, 7 * 1440, now)
+    occurrences, truncated = schedule.due(7 * 1440, now=now, limit=10)
+    assert [entry["id"] for entry in occurrences] == [reminder_id for _, reminder_id in expected[:10]]
+    assert truncated == (len(expected) > 10)
+
+
+def test_snapshot_restore_keeps_schedule(tmp_path):
+    tz = ZoneInfo("America/New_York")
+    schedule, reminders = _random_schedule(tz, random.Random(4))
+    path = tmp_path / "reminders.snap"
+    assert schedule.snapshot(path) == len(reminders)
+    restored = ReminderSchedule.restore(path, tz=tz)
+    assert len(restored) == len(schedule)
+    now = datetime(2026, 3, 7, 22, 30, tzinfo=tz)
+    assert _due(restored, 7 * 1440, now) == reference_due(reminders, 7 * 1440, now)
+    for patient in range(20):
+        assert restored.for_patient(f"p{patient}") == schedule.for_patient(f"p{patient}")
+
+
+def _interned(schedule):
+    return set(schedule._patient_index), set(schedule._string_index)
+
+
+def _referenced(reminders):
+    return ({reminder["patient_id"] for reminder in reminders.values()},
+            {reminder[field] for reminder in reminders.values() for field in ("medication", "dosage")})
+
+
+def test_interned_strings_are_released_with_their_last_reminder(tmp_path):
+    rng = random.Random(5)
+    schedule, reminders = _random_schedule(timezone.utc, rng)
+    assert _interned(schedule) == _referenced(reminders)
+    path = tmp_path / "reminders.snap"
+    schedule.snapshot(path)
+    assert _interned(ReminderSchedule.restore(path)) == _referenced(reminders)
+    # Churn through distinct ids and names; freed indexes are reused, so the tables stay small
+    for i in range(200):
+        entry = schedule.add(f"churn{i}", f"Drug{i}", i, dosage=f"{i}mg")
+        schedule.update(entry["id"], f"churn{i}", f"Other{i}", i)
+        schedule.remove(entry["id"])
+    for reminder_id in list(reminders):
+        schedule.remove(reminder_id)
+    assert _interned(schedule) == (set(), set())
+    assert len(schedule._patients) <= 21 and len(schedule._strings) <= 8
+
+
+def test_forked_worker_owns_the_snapshot(tmp_path):
+    path = tmp_path / "reminders.snap"
+    schedule = ReminderSchedule()
+    schedule.snapshots = Snapshots(schedule, path, 3600, "reminder")
+    pid = os.fork()
+    if pid == 0:
+        try:
+            schedule.add("p1", "Metformin", 480)
+            schedule.snapshots.close()
+        finally:
+            os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    # The forking parent's stale copy never replaces the worker's snapshot
+    schedule.snapshots.close()
+    assert len(ReminderSchedule.restore(path)) == 1
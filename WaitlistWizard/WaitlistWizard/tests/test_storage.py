@@ -0,0 +1,44 @@
+"""RecommendationStore rows and the flush handover between writers"""
+import threading
+import time
+
+from storage import RecommendationStore
+from validation import RecommendationRequest
+
+PAYLOAD = {"healthProblem": "Hypertension", "gender": "  Female ", "age": "42",
+           "existingDrug": "Aspirin; ibuprofen", "symptomText": "headache"}
+RECOMMENDATION = {"primary_condition": "hypertension", "patient": {"age_category": "adult"},
+                  "recommendations": [{"medication": "Amlodipine"}]}
+
+
+def _store(tmp_path):
+    return RecommendationStore(f"sqlite:///{tmp_path / 'recommendations.db'}", flush_seconds=0.01)
+
+
+def test_rows_hold_the_validated_fields(tmp_path):
+    store = _store(tmp_path)
+    store.record(RecommendationRequest.from_payload(PAYLOAD), RECOMMENDATION, PAYLOAD)
+    store.flush()
+    [row] = store.find(gender="female")
+    assert (row["gender"], row["age"], row["existing_drug"]) == ("female", 42, "Aspirin, ibuprofen")
+    assert '"  Female "' in row["request_json"]
+    store.close()
+
+
+def test_flush_loses_no_record_put_while_it_runs(tmp_path):
+    store = _store(tmp_path)
+    req = RecommendationRequest.from_payload(PAYLOAD)
+    store.record(req, RECOMMENDATION, PAYLOAD)
+    def produce():
+        for _ in range(2000):
+            store.record(req, RECOMMENDATION, PAYLOAD)
+
+    producers = [threading.Thread(target=produce) for _ in range(3)]
+    for producer in producers:
+        producer.start()
+    while any(producer.is_alive() for producer in producers):
+        time.sleep(0.001)
+        store.flush()
+    store.flush()
+    assert store.written + store.dropped == 1 + 3 * 2000
+    store.close()
@@ -0,0 +1,141 @@
+"""Waitlist against a sorted list of (urgency, admission order) as a reference model"""
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from waitlist import Snapshots, Waitlist, WaitlistFull
+
+
+class ReferenceWaitlist:
+    """Naive model: every id with its urgency and admission number, sorted on demand"""
+
+    def __init__(self):
+        self.entries = {}
+        self.admitted = 0
+
+    def admit(self, entry_id, urgency):
+        self.entries[entry_id] = (urgency, self.admitted)
+        self.admitted += 1
+
+    def order(self):
+        return sorted(self.entries, key=lambda entry_id: (-self.entries[entry_id][0], self.entries[entry_id][1]))
+
+
+def _ids(entries):
+    return [entry["id"] for entry in entries]
+
+
+def _random_operations(waitlist, reference, rng, steps):
+    stale = []
+    for step in range(steps):
+        op = rng.random()
+        if op < 0.4 or not reference.entries:
+            urgency = rng.randint(0, 3000) / 100
+            entry = waitlist.admit(urgency, rng.choice(["asthma", "diabetes", None]), rng.randint(0, 120),
+                                   rng.choice(["male", "female", "other"]), rng.random() < 0.1, f"ref-{step}")
+            reference.admit(entry["id"], urgency)
+        elif op < 0.55:
+            entry_id = rng.choice(list(reference.entries))
+            urgency = rng.randint(0, 3000) / 100
+            assert waitlist.reprioritize(entry_id, urgency)["urgency"] == urgency
+            reference.entries[entry_id] = (urgency, reference.entries[entry_id][1])
+        elif op < 0.7:
+            entry_id = rng.choice(list(reference.entries))
+            assert waitlist.remove(entry_id)["id"] == entry_id
+            del reference.entries[entry_id]
+            stale.append(entry_id)
+        elif op < 0.85:
+            expected = reference.order()[0]
+            assert waitlist.pop()["id"] == expected
+            del reference.entries[expected]
+            stale.append(expected)
+        else:
+            offset = rng.randint(0, len(reference.entries))
+            limit = rng.randint(1, 40)
+            assert _ids(waitlist.page(offset, limit)) == reference.order()[offset:offset + limit]
+        if stale and rng.random() < 0.05:
+            # Slots are reused, but an old id must never reach the patient who took the slot over
+            entry_id = rng.choice(stale)
+            assert waitlist.get(entry_id) is None
+            assert waitlist.remove(entry_id) is None
+        assert len(waitlist) == len(reference.entries)
+
+
+def test_pop_and_page_follow_urgency_then_admission_order():
+    waitlist, reference = Waitlist(), ReferenceWaitlist()
+    _random_operations(waitlist, reference, random.Random(1), 5000)
+    assert _ids(waitlist.page(0, len(waitlist))) == reference.order()
+    while reference.entries:
+        expected = reference.order()[0]
+        assert waitlist.pop()["id"] == expected
+        del reference.entries[expected]
+    assert waitlist.pop() is None
+
+
+def test_equal_urgencies_leave_in_admission_order():
+    waitlist = Waitlist()
+    ids = [waitlist.admit(5.0, None, 40, "female")["id"] for _ in range(20)]
+    assert [waitlist.pop()["id"] for _ in range(20)] == ids
+
+
+def test_snapshot_restore_keeps_entries_and_order(tmp_path):
+    waitlist, reference = Waitlist(), ReferenceWaitlist()
+    rng = random.Random(2)
+    _random_operations(waitlist, reference, rng, 3000)
+    path = tmp_path / "waitlist.snap"
+    assert waitlist.snapshot(path) == len(waitlist)
+
+    restored = Waitlist.restore(path)
+    assert restored.page(0, len(restored)) == waitlist.page(0, len(waitlist))
+    # The restored waitlist carries on from the same admission order and slot generations
+    _random_operations(restored, reference, rng, 1000)
+    assert _ids(restored.page(0, len(restored))) == reference.order()
+
+
+def test_full_waitlist_refuses_admission():
+    waitlist = Waitlist(max_entries=2)
+    waitlist.admit(1.0, None, 30, "male")
+    waitlist.admit(2.0, None, 30, "male")
+    with pytest.raises(WaitlistFull):
+        waitlist.admit(3.0, None, 30, "male")
+
+
+def _snapshot_len(path):
+    return len(Waitlist.restore(path)) if path.exists() else None
+
+
+def test_forked_worker_owns_the_snapshot(tmp_path):
+    path = tmp_path / "waitlist.snap"
+    waitlist = Waitlist()
+    waitlist.snapshots = Snapshots(waitlist, path, 3600, "waitlist")
+    # As under a preloading gunicorn master: the parent forks a worker, which admits a patient and exits
+    pid = os.fork()
+    if pid == 0:
+        try:
+            waitlist.admit(5.0, "asthma", 40, "female")
+            waitlist.snapshots.close()
+        finally:
+            os._exit(0)
+    assert os.waitpid(pid, 0)[1] == 0
+    assert _snapshot_len(path) == 1
+    # The parent's copy is stale since the fork; its exit must not overwrite the worker's snapshot,
+    # even once it has changed its own copy
+    waitlist.admit(1.0, "asthma", 40, "female")
+    waitlist.admit(1.0, "asthma", 40, "female")
+    waitlist.snapshots.close()
+    assert _snapshot_len(path) == 1
+
+
+def test_snapshot_thread_starts_on_first_change(tmp_path):
+    path = tmp_path / "waitlist.snap"
+    waitlist = Waitlist()
+    waitlist.snapshots = Snapshots(waitlist, path, 0.01, "waitlist")
+    assert not any(thread.name == "waitlist-snapshot" for thread in threading.enumerate())
+    waitlist.admit(5.0, "asthma", 40, "female")
+    deadline = time.monotonic() + 5
+    while _snapshot_len(path) != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _snapshot_len(path) == 1
@@ -0,0 +1,310 @@
+"""Sampled, anonymized capture of API traffic for replay load tests (see replay.py).
+
+A sampled request's body is read and queued as raw bytes together with its
+status, duration and response size; a background thread anonymizes it and
+appends one JSON line per request, so the request path only pays for the
+copy. Records look like
+
+    {"t": unix time, "m": method, "p": path, "q": query string,
+     "b": anonymized JSON body, "s": status, "d": milliseconds, "n": response bytes}
+
+with "r": body length in place of "b" when the body was not JSON. Each
+process starts its part of the log with a {"format": ...} header line;
+several workers may append to the same file.
+
+Anonymization keeps what drives the scoring cost and outcome and nothing
+else: words the symptom matcher looks for (and near-misses it would correct)
+are kept and every other word is masked letter for letter, numbers are kept
+only when short (durations, temperatures) and never as part of a dashed,
+slashed or dotted group such as a phone number or date, drug names and
+conditions outside the knowledge base are masked, ages are coarsened to five
+years within their age category, and unknown fields are dropped. Invalid
+values are replaced by stand-ins that fail validation the same way.
+
+Settings:
+    TRAFFIC_CAPTURE_PATH        log file to append to; capture is off without it
+    TRAFFIC_CAPTURE_RATE        fraction of requests recorded, default 0.01
+    TRAFFIC_CAPTURE_ENDPOINTS   comma-separated paths to sample, default
+                                /api/analyze-symptoms,/api/ai-recommendation
+    TRAFFIC_CAPTURE_MAX_BYTES   log size at which capture stops, default 1 GiB
+    TRAFFIC_CAPTURE_QUEUE_SIZE  records buffered before new ones are dropped, default 10000
+"""
+import atexit
+import io
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from interactions import normalize_drug, parse_medications
+from knowledge_base import age_category_for, get_knowledge_base
+from validation import GENDERS, MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "waitlistwizard-traffic"
+VERSION = 1
+
+DEFAULT_ENDPOINTS = ("/api/analyze-symptoms", "/api/ai-recommendation")
+
+# Larger bodies (big batches) are left out of the sample rather than copied
+MAX_BODY_BYTES = 256 * 1024
+
+# Youngest age of each category, so coarsened ages never change category
+_CATEGORY_FLOOR = {"pediatric": 0, "adult": 18, "elderly": 65}
+
+# A run of digit groups joined by - / . : is taken as one number, so a phone number or date is judged whole
+_WORD = re.compile(r"\d+(?:[-/.:]\d+)*|[\w']+")
+
+# Numbers kept as written: up to three digits, with at most one short decimal part (38.5, 101.2)
+_SHORT_NUMBER = re.compile(r"\d{1,3}(?:\.\d{1,2})?")
+
+
+def _mask(text):
+    return re.sub(r"\w", "x", text)
+
+
+class Anonymizer:
+    """Strips a request payload down to what scoring depends on"""
+
+    def __init__(self, kb, matcher, max_distance):
+        self.fingerprint = kb.fingerprint
+        self.conditions = frozenset(kb.condition_ids)
+        tables = kb.tables
+        drugs = set()
+        for condition, medications in tables["medication_effectiveness"].items():
+            drugs.update(medications)
+        for pair in tables["drug_interactions"]:
+            drugs.update(pair)
+        for _, drug in tables["dangerous_combinations"]:
+            drugs.add(drug)
+        for drug_class, members in tables["drug_classes"].items():
+            drugs.add(drug_class)
+            drugs.update(members)
+        self.drugs = frozenset(normalize_drug(drug) for drug in drugs)
+        self._matcher = matcher
+        self._max_distance = max_distance
+
+    def _word(self, match):
+        word = match.group()
+        if word[0].isdigit():
+            return word if _SHORT_NUMBER.fullmatch(word) else _mask(word)
+        lowered = word.lower()
+        if lowered in self._matcher.words:
+            return word
+        # Typos of symptom words are kept, so fuzzy matching still has work to do on replay
+        if self._matcher.correct_token(lowered, self._max_distance) is not None:
+            return word
+        return "x" * len(word)
+
+    def text(self, value):
+        if not isinstance(value, str):
+            return True if value else None
+        return _WORD.sub(self._word, value)
+
+    def condition(self, value):
+        if not isinstance(value, str):
+            return True if value else None
+        return value if value.lower() in self.conditions else _mask(value)
+
+    def gender(self, value):
+        if not isinstance(value, str):
+            return True if value else None
+        return value if value.strip().lower() in GENDERS else "invalid"
+
+    def age(self, value):
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            return value if value is None else "invalid"
+        try:
+            years = int(value.strip()) if isinstance(value, str) else int(value)
+        except (ValueError, OverflowError):
+            return "invalid"
+        if not 0 <= years <= MAX_AGE:
+            return years
+        return max(_CATEGORY_FLOOR[age_category_for(years)], years // 5 * 5)
+
+    def drugs_field(self, value):
+        try:
+            names = parse_medications(value)
+        except TypeError:
+            return True
+        names = [name if normalize_drug(name) in self.drugs else _mask(name) for name in names]
+        return ", ".join(names) if isinstance(value, str) else names
+
+    def payload(self, data):
+        """Anonymized copy of a JSON request body"""
+        if isinstance(data, list):
+            return [self.payload(item) if isinstance(item, dict) else None for item in data]
+        if not isinstance(data, dict):
+            return None
+        fields = {
+            "healthProblem": self.condition,
+            "gender": self.gender,
+            "age": self.age,
+            "existingDrug": self.drugs_field,
+            "symptomText": self.text,
+            "symptoms": self.text,
+            "patients": self.payload,
+        }
+        return {key: fields[key](value) for key, value in data.items() if key in fields}
+
+
+class TrafficCapture:
+    """Request sampler plus a background writer appending anonymized records to a log file"""
+
+    def __init__(self, path, matcher, max_distance, sample_rate=0.01, endpoints=DEFAULT_ENDPOINTS,
+                 max_bytes=1 << 30, queue_size=10000):
+        # matcher: the symptom matcher whose words and typo correction decide what text is kept
+        self.path = path
+        self.sample_rate = sample_rate
+        self.endpoints = frozenset(endpoints)
+        self.max_bytes = max_bytes
+        self.queue_size = queue_size
+        self.captured = 0
+        self.dropped = 0
+        self._matcher = matcher
+        self._max_distance = max_distance
+        self._anonymizer = None
+        self._file = None
+        self._pid = None
+        self._writer = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Threads do not survive fork, so each (pre-forked) worker starts its own writer and log part
+                self._file = None
+                self._queue = queue.Queue(maxsize=self.queue_size)
+                self._writer = threading.Thread(target=self._run, name="traffic-writer", daemon=True)
+                self._writer.start()
+                self._pid = os.getpid()
+
+    def sample(self, method, path):
+        """Whether to record this request"""
+        return path in self.endpoints and method == "POST" and random.random() < self.sample_rate
+
+    def record(self, started, method, path, query, body, status, seconds, size):
+        """Queue one sampled request; never blocks the caller"""
+        if len(body) > MAX_BODY_BYTES:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((started, method, path, query, body, status, seconds, size))
+        except queue.Full:
+            self.dropped += 1
+
+    def middleware(self, wsgi_app):
+        """WSGI middleware recording the sampled requests wsgi_app serves"""
+        def capture(environ, start_response):
+            method, path = environ["REQUEST_METHOD"], environ.get("PATH_INFO", "")
+            if not self.sample(method, path):
+                return wsgi_app(environ, start_response)
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                length = -1
+            if not 0 <= length <= MAX_BODY_BYTES:
+                return wsgi_app(environ, start_response)
+            body = environ["wsgi.input"].read(length)
+            environ["wsgi.input"] = io.BytesIO(body)
+            response = {}
+
+            def capture_start_response(status, headers, exc_info=None):
+                response["status"] = int(status.split(" ", 1)[0])
+                response["size"] = next((int(value) for name, value in headers
+                                         if name.lower() == "content-length"), None)
+                return start_response(status, headers, exc_info)
+
+            started = time.time()
+            timer = time.perf_counter()
+            result = wsgi_app(environ, capture_start_response)
+            self.record(started, method, path, environ.get("QUERY_STRING", ""), body,
+                        response.get("status"), time.perf_counter() - timer, response.get("size"))
+            return result
+        return capture
+
+    def _line(self, started, method, path, query, body, status, seconds, size):
+        kb = get_knowledge_base()
+        if self._anonymizer is None or self._anonymizer.fingerprint != kb.fingerprint:
+            self._anonymizer = Anonymizer(kb, self._matcher, self._max_distance)
+        record = {"t": round(started, 3), "m": method, "p": path, "q": query}
+        try:
+            record["b"] = self._anonymizer.payload(json.loads(body))
+        except ValueError:
+            record["r"] = len(body)
+        record.update({"s": status, "d": round(seconds * 1000, 3), "n": size})
+        return json.dumps(record, separators=(",", ":")) + "\n"
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            # Drain whatever else is waiting so a burst costs one write
+            while len(records) < 1000:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            records = [record for record in records if record is not None]
+            try:
+                self._write(records)
+            except Exception:
+                self.dropped += len(records)
+                logger.exception("Failed to write %d traffic records", len(records))
+            if stop:
+                return
+
+    def _write(self, records):
+        if not records:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            header = {"format": FORMAT, "version": VERSION, "pid": os.getpid(),
+                      "started": datetime.now().isoformat(), "sample_rate": self.sample_rate}
+            self._file.write(json.dumps(header) + "\n")
+        # Other workers may be appending too, so the size comes from the file itself
+        if os.fstat(self._file.fileno()).st_size >= self.max_bytes:
+            self.dropped += len(records)
+            return
+        self._file.write("".join(self._line(*record) for record in records))
+        self._file.flush()
+        self.captured += len(records)
+
+    def close(self, timeout=10):
+        """Write everything queued so far and stop the writer"""
+        if self._pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def metrics(self):
+        """Captured and dropped record counts, read at scrape time"""
+        yield "waitlistwizard_traffic_captured_total", "counter", (), self.captured
+        yield "waitlistwizard_traffic_dropped_total", "counter", (), self.dropped
+
+
+def capture_from_env(matcher, max_distance):
+    """Build the capture from environment settings, or None when TRAFFIC_CAPTURE_PATH is unset"""
+    path = os.environ.get("TRAFFIC_CAPTURE_PATH")
+    if not path:
+        return None
+    endpoints = os.environ.get("TRAFFIC_CAPTURE_ENDPOINTS")
+    capture = TrafficCapture(
+        path, matcher, max_distance,
+        sample_rate=float(os.environ.get("TRAFFIC_CAPTURE_RATE", 0.01)),
+        endpoints=[p.strip() for p in endpoints.split(",") if p.strip()] if endpoints else DEFAULT_ENDPOINTS,
+        max_bytes=int(os.environ.get("TRAFFIC_CAPTURE_MAX_BYTES", 1 << 30)),
+        queue_size=int(os.environ.get("TRAFFIC_CAPTURE_QUEUE_SIZE", 10000)),
+    )
+    atexit.register(capture.close)
+    return capture
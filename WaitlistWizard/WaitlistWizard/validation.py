@@ -0,0 +1,238 @@
+"""Validation of API payloads before they reach the scoring code.
+
+Payloads are checked and normalized once, up front, so malformed or oversized
+input is rejected with a 400 listing every bad field instead of failing deep
+inside scoring (or after an expensive symptom analysis). Valid payloads
+become a RecommendationRequest whose fields the scoring functions use as-is.
+
+Settings:
+    MAX_SYMPTOM_TEXT_LENGTH  longest accepted symptom description, default 10000 characters
+"""
+import math
+import os
+
+from interactions import parse_medications
+from knowledge_base import age_category_for
+
+MAX_SYMPTOM_TEXT_LENGTH = int(os.environ.get("MAX_SYMPTOM_TEXT_LENGTH", 10000))
+
+# Condition and gender values are short names
+MAX_NAME_LENGTH = 200
+MAX_MEDICATIONS = 50
+MAX_MEDICATION_NAME_LENGTH = 100
+MAX_AGE = 130
+# Derived urgencies stay below 200 (see waitlist.urgency_for); overrides may go above
+MAX_URGENCY = 1000
+
+GENDERS = ("male", "female", "other")
+DEFAULT_GENDER = "other"
+DEFAULT_AGE = 30
+
+# Reminder recurrences, as the patient app's reminder form offers them
+REPEAT_PATTERNS = ("daily", "weekdays", "weekends", "custom")
+# Day names of the custom pattern, in datetime.weekday() order
+DAY_NAMES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class ValidationError(ValueError):
+    """Raised with one {"field", "message"} entry per invalid field"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{error['field']}: {error['message']}" if error["field"] else error["message"]
+                                   for error in errors))
+
+
+class RecommendationRequest:
+    """Inputs of one recommendation, normalized once.
+
+    Built directly from get_ai_recommendation's arguments the fields are taken
+    as given, and the age category and medication list are derived when first
+    used, so invalid values fail exactly where they always did. from_payload()
+    instead validates everything up front.
+    """
+    __slots__ = ("health_condition", "condition", "gender", "age", "existing_drug", "symptom_text",
+                 "_age_category", "_medications")
+
+    def __init__(self, health_condition, gender, age, existing_drug=None, symptom_text=None):
+        self.health_condition = health_condition
+        self.condition = health_condition.lower() if health_condition else ""
+        self.gender = gender
+        self.age = age
+        self.existing_drug = existing_drug
+        self.symptom_text = symptom_text
+        self._age_category = None
+        self._medications = None
+
+    @property
+    def age_category(self):
+        if self._age_category is None:
+            self._age_category = age_category_for(self.age)
+        return self._age_category
+
+    @property
+    def medications(self):
+        """Existing medication names, parsed from a list or a comma-separated string"""
+        if self._medications is None:
+            self._medications = parse_medications(self.existing_drug)
+        return self._medications
+
+    @classmethod
+    def from_payload(cls, data):
+        """Validated request from an /api/ai-recommendation payload; raises ValidationError"""
+        if not isinstance(data, dict):
+            raise ValidationError([{"field": "", "message": "Request body must be a JSON object."}])
+        errors = []
+
+        health_condition = data.get("healthProblem") or ""
+        if not isinstance(health_condition, str):
+            errors.append({"field": "healthProblem", "message": "Must be a string."})
+        elif len(health_condition) > MAX_NAME_LENGTH:
+            errors.append({"field": "healthProblem", "message": f"Must be at most {MAX_NAME_LENGTH} characters."})
+
+        gender = data.get("gender") or DEFAULT_GENDER
+        if not isinstance(gender, str) or gender.strip().lower() not in GENDERS:
+            errors.append({"field": "gender", "message": f"Must be one of {', '.join(GENDERS)}."})
+        else:
+            gender = gender.strip().lower()
+
+        age = data.get("age", DEFAULT_AGE)
+        try:
+            age = _parse_age(age)
+        except ValueError as e:
+            errors.append({"field": "age", "message": str(e)})
+
+        existing_drug = data.get("existingDrug") or ""
+        medications = None
+        try:
+            medications = parse_medications(existing_drug)
+        except TypeError as e:
+            errors.append({"field": "existingDrug", "message": str(e)})
+        else:
+            if len(medications) > MAX_MEDICATIONS:
+                errors.append({"field": "existingDrug", "message": f"At most {MAX_MEDICATIONS} medications."})
+            elif any(len(name) > MAX_MEDICATION_NAME_LENGTH for name in medications):
+                errors.append({"field": "existingDrug",
+                               "message": f"Medication names must be at most {MAX_MEDICATION_NAME_LENGTH} characters."})
+
+        symptom_text = data.get("symptomText") or ""
+        try:
+            check_symptom_text(symptom_text)
+        except ValidationError as e:
+            errors.append(dict(e.errors[0], field="symptomText"))
+
+        if errors:
+            raise ValidationError(errors)
+        request = cls(health_condition, gender, age, existing_drug, symptom_text)
+        request._age_category = age_category_for(age)
+        request._medications = medications
+        return request
+
+
+def _parse_age(value):
+    """Whole years from a number or numeric string"""
+    if isinstance(value, bool):
+        raise ValueError("Must be a number of years.")
+    if isinstance(value, str):
+        value = value.strip()
+        if not value.isdigit():
+            raise ValueError("Must be a number of years.")
+        value = int(value)
+    elif isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError("Must be a number of years.")
+        value = int(value)
+    elif not isinstance(value, int):
+        raise ValueError("Must be a number of years.")
+    if not 0 <= value <= MAX_AGE:
+        raise ValueError(f"Must be between 0 and {MAX_AGE}.")
+    return value
+
+
+def check_symptom_text(text):
+    """Raise ValidationError unless text is a string within MAX_SYMPTOM_TEXT_LENGTH"""
+    if not isinstance(text, str):
+        raise ValidationError([{"field": "symptoms", "message": "Must be a string."}])
+    if len(text) > MAX_SYMPTOM_TEXT_LENGTH:
+        raise ValidationError([{"field": "symptoms",
+                                "message": f"Must be at most {MAX_SYMPTOM_TEXT_LENGTH} characters."}])
+    return text
+
+
+def symptom_text_from_payload(data):
+    """Validated symptom text from an /api/analyze-symptoms payload; raises ValidationError"""
+    if not isinstance(data, dict):
+        raise ValidationError([{"field": "", "message": "Request body must be a JSON object."}])
+    return check_symptom_text(data.get("symptoms") or "")
+
+
+def waitlist_reference_from_payload(data):
+    """Optional caller reference (a chart number, say) for a waitlist entry; raises ValidationError"""
+    reference = data.get("reference")
+    if reference is not None and (not isinstance(reference, str) or len(reference) > MAX_NAME_LENGTH):
+        raise ValidationError([{"field": "reference",
+                                "message": f"Must be a string of at most {MAX_NAME_LENGTH} characters."}])
+    return reference or None
+
+
+def urgency_from_payload(data):
+    """Explicit waitlist urgency from a payload; raises ValidationError"""
+    urgency = data.get("urgency")
+    if isinstance(urgency, bool) or not isinstance(urgency, (int, float)) or not math.isfinite(urgency) \
+            or not 0 <= urgency <= MAX_URGENCY:
+        raise ValidationError([{"field": "urgency", "message": f"Must be a number between 0 and {MAX_URGENCY}."}])
+    return float(urgency)
+
+
+def _reminder_minute(value):
+    """Minute of the day for an "HH:MM" time"""
+    hours, _, minutes = value.partition(":") if isinstance(value, str) else ("", "", "")
+    if not (len(hours) in (1, 2) and len(minutes) == 2 and hours.isdigit() and minutes.isdigit()) \
+            or int(hours) > 23 or int(minutes) > 59:
+        raise ValueError("Must be a time of day as HH:MM.")
+    return int(hours) * 60 + int(minutes)
+
+
+def reminder_from_payload(data):
+    """ReminderSchedule.add() arguments from an /api/reminders payload; raises ValidationError"""
+    if not isinstance(data, dict):
+        raise ValidationError([{"field": "", "message": "Request body must be a JSON object."}])
+    errors = []
+
+    fields = {}
+    for field, key, limit, required in (("patientId", "patient_id", MAX_NAME_LENGTH, True),
+                                        ("medication", "medication", MAX_MEDICATION_NAME_LENGTH, True),
+                                        ("dosage", "dosage", MAX_NAME_LENGTH, False)):
+        value = data.get(field) or ""
+        if not isinstance(value, str) or len(value) > limit:
+            errors.append({"field": field, "message": f"Must be a string of at most {limit} characters."})
+        elif required and not value.strip():
+            errors.append({"field": field, "message": "Required."})
+        else:
+            fields[key] = value.strip()
+
+    try:
+        fields["minute"] = _reminder_minute(data.get("time"))
+    except ValueError as e:
+        errors.append({"field": "time", "message": str(e)})
+
+    repeat_pattern = data.get("repeatPattern") or "daily"
+    if repeat_pattern not in REPEAT_PATTERNS:
+        errors.append({"field": "repeatPattern", "message": f"Must be one of {', '.join(REPEAT_PATTERNS)}."})
+    fields["repeat_pattern"] = repeat_pattern
+
+    selected_days = data.get("selectedDays") or []
+    if not isinstance(selected_days, list) or not all(day in DAY_NAMES for day in selected_days):
+        errors.append({"field": "selectedDays", "message": f"Must be a list of {', '.join(DAY_NAMES)}."})
+    elif repeat_pattern == "custom" and not selected_days:
+        errors.append({"field": "selectedDays", "message": "Select at least one day for a custom repeat."})
+    fields["selected_days"] = selected_days if repeat_pattern == "custom" else []
+
+    is_active = data.get("isActive", True)
+    if not isinstance(is_active, bool):
+        errors.append({"field": "isActive", "message": "Must be true or false."})
+    fields["active"] = is_active
+
+    if errors:
+        raise ValidationError(errors)
+    return fields
@@ -0,0 +1,446 @@
+"""Priority waitlist of assessed patients.
+
+Patients are admitted at an urgency derived from their assessment (see
+urgency_for) and leave in order of urgency, earliest admission first among
+equals. The queue is an indexed binary heap whose entries live column-wise
+in typed arrays, under 50 bytes per patient plus any caller reference, so a
+million waiting patients fit in tens of megabytes; admission, reprioritizing,
+removal and taking the next patient are all O(log n). Urgencies are kept to
+hundredths, which lets the heap order on one integer per entry. Slots of departed
+entries are reused, and an entry id carries its slot's generation, so a stale
+id never reaches the patient who took the slot over.
+
+The waitlist lives in the serving process: run a single worker process
+(WEB_CONCURRENCY=1, threads are fine) or each worker keeps a waitlist of its
+own. With WAITLIST_SNAPSHOT_PATH set it is restored from that file at startup
+and written back every WAITLIST_SNAPSHOT_SECONDS after a change and at exit,
+by the process that made the changes; a process that forks workers (a
+preloading gunicorn master) never writes it (see Snapshots).
+
+Settings:
+    WAITLIST_MAX_ENTRIES       most patients waiting at once, default 2000000
+    WAITLIST_SNAPSHOT_PATH     snapshot file, default none (not persisted)
+    WAITLIST_SNAPSHOT_SECONDS  longest a change waits to be snapshotted, default 60
+"""
+import atexit
+import heapq
+import json
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from validation import GENDERS
+
+logger = logging.getLogger(__name__)
+
+MAX_ENTRIES = 2000000
+
+# Urgency added for a dangerous combination with an existing medication; more than any symptom score
+DANGEROUS_INTERACTION_URGENCY = 100.0
+
+MAGIC = b"WWWL"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sHxxQQQQI")
+
+# An id is generation << 32 | slot; generations wrap so ids stay exact in JavaScript numbers
+_SLOT_BITS = 32
+_GENERATIONS = 1 << 21
+_NO_CONDITION = 0xFFFF
+
+# Heap keys hold the urgency in hundredths above the inverted admission number, so a
+# larger key is more urgent, or as urgent and admitted earlier
+_SEQ_BITS = 40
+_SEQ_MASK = (1 << _SEQ_BITS) - 1
+_URGENCY_LIMIT = (1 << (64 - _SEQ_BITS)) / 100
+
+# Column name -> array typecode; every column holds one item per slot
+_COLUMNS = (
+    ("key", "Q"),
+    ("admitted", "d"),
+    ("generation", "I"),
+    # Index in the heap, -1 for a free slot
+    ("position", "q"),
+    ("condition", "H"),
+    ("age", "B"),
+    ("gender", "B"),
+    ("dangerous", "B"),
+)
+
+
+class WaitlistFull(Exception):
+    """Raised when admitting a patient would exceed the waitlist's max_entries"""
+
+
+def _key(urgency, seq):
+    if not 0 <= urgency < _URGENCY_LIMIT:
+        raise ValueError(f"Urgency must be between 0 and {_URGENCY_LIMIT}")
+    return round(urgency * 100) << _SEQ_BITS | (_SEQ_MASK - seq)
+
+
+def urgency_for(recommendation):
+    """Waitlist urgency of a recommendation: its best symptom match score (0-98), plus
+    DANGEROUS_INTERACTION_URGENCY when an existing medication is dangerous for the condition"""
+    analysis = (recommendation.get("ai_analysis") or {}).get("symptom_analysis")
+    urgency = analysis[0]["match_data"]["score"] if analysis else 0.0
+    if (recommendation.get("safety") or {}).get("has_dangerous_interaction"):
+        urgency += DANGEROUS_INTERACTION_URGENCY
+    return round(urgency, 2)
+
+
+class Waitlist:
+    """Indexed max-heap of waiting patients over per-slot typed arrays"""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._columns = []
+        for name, typecode in _COLUMNS:
+            column = array(typecode)
+            setattr(self, f"_{name}", column)
+            self._columns.append(column)
+        # Caller references by slot; None when not given
+        self._references = []
+        # Slots in heap order
+        self._heap = array("I")
+        self._free = array("I")
+        self._next_seq = 0
+        # Condition names are stored once and referenced by index
+        self._conditions = []
+        self._condition_index = {}
+        # Bumped on every change, so snapshots are only written when something changed
+        self.changes = 0
+        # Snapshots of this waitlist, started by its first change in each process; None when not persisted
+        self.snapshots = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _changed(self):
+        self.changes += 1
+        if self.snapshots is not None:
+            self.snapshots.ensure_started()
+
+    def nbytes(self):
+        """Approximate memory held by the heap and columns, excluding references"""
+        columns = self._columns + [self._heap, self._free]
+        return sum(column.itemsize * column.buffer_info()[1] for column in columns) + 8 * len(self._references)
+
+    def _sift_up(self, pos):
+        heap, position, key = self._heap, self._position, self._key
+        slot = heap[pos]
+        slot_key = key[slot]
+        while pos:
+            parent = (pos - 1) >> 1
+            above = heap[parent]
+            # Keys are unique, admission numbers never repeat
+            if key[above] > slot_key:
+                break
+            heap[pos] = above
+            position[above] = pos
+            pos = parent
+        heap[pos] = slot
+        position[slot] = pos
+
+    def _sift_down(self, pos):
+        heap, position, key = self._heap, self._position, self._key
+        count = len(heap)
+        slot = heap[pos]
+        slot_key = key[slot]
+        while True:
+            child = 2 * pos + 1
+            if child >= count:
+                break
+            below = heap[child]
+            if child + 1 < count and key[heap[child + 1]] > key[below]:
+                child += 1
+                below = heap[child]
+            if slot_key > key[below]:
+                break
+            heap[pos] = below
+            position[below] = pos
+            pos = child
+        heap[pos] = slot
+        position[slot] = pos
+
+    def _slot(self, entry_id):
+        """Slot of a waiting entry, or None for unknown and departed ids"""
+        if not isinstance(entry_id, int) or entry_id < 0:
+            return None
+        slot = entry_id & ((1 << _SLOT_BITS) - 1)
+        if slot >= len(self._position) or self._position[slot] < 0 or \
+                self._generation[slot] != entry_id >> _SLOT_BITS:
+            return None
+        return slot
+
+    def _condition_id(self, condition):
+        if condition is None:
+            return _NO_CONDITION
+        index = self._condition_index.get(condition)
+        if index is None:
+            if len(self._conditions) >= _NO_CONDITION:
+                raise ValueError("Too many distinct conditions on the waitlist")
+            index = self._condition_index[condition] = len(self._conditions)
+            self._conditions.append(condition)
+        return index
+
+    def _entry(self, slot):
+        condition = self._condition[slot]
+        return {
+            "id": self._generation[slot] << _SLOT_BITS | slot,
+            "reference": self._references[slot],
+            "urgency": (self._key[slot] >> _SEQ_BITS) / 100,
+            "condition": None if condition == _NO_CONDITION else self._conditions[condition],
+            "age": self._age[slot],
+            "gender": GENDERS[self._gender[slot]],
+            "dangerous_interaction": bool(self._dangerous[slot]),
+            "admitted_at": datetime.fromtimestamp(self._admitted[slot]).isoformat(),
+        }
+
+    def admit(self, urgency, condition, age, gender, dangerous_interaction=False, reference=None):
+        """Add a patient; returns their entry. Gender must be one of validation.GENDERS."""
+        with self._lock:
+            if len(self._heap) >= self.max_entries:
+                raise WaitlistFull(f"The waitlist is full ({self.max_entries} patients).")
+            key = _key(urgency, self._next_seq)
+            condition = self._condition_id(condition)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._position)
+                for column in self._columns:
+                    column.append(0)
+                self._references.append(None)
+            self._key[slot] = key
+            self._admitted[slot] = time.time()
+            self._condition[slot] = condition
+            self._age[slot] = age
+            self._gender[slot] = GENDERS.index(gender)
+            self._dangerous[slot] = 1 if dangerous_interaction else 0
+            self._references[slot] = reference
+            self._next_seq += 1
+            self._heap.append(slot)
+            self._sift_up(len(self._heap) - 1)
+            self._changed()
+            return self._entry(slot)
+
+    def get(self, entry_id):
+        """Entry for an id, or None once it has left the waitlist"""
+        with self._lock:
+            slot = self._slot(entry_id)
+            return None if slot is None else self._entry(slot)
+
+    def _set_urgency(self, slot, urgency):
+        previous = self._key[slot]
+        # Admission order is kept, so the entry keeps its place among equal urgencies
+        key = self._key[slot] = _key(urgency, _SEQ_MASK - (previous & _SEQ_MASK))
+        if key > previous:
+            self._sift_up(self._position[slot])
+        elif key < previous:
+            self._sift_down(self._position[slot])
+        self._changed()
+
+    def reprioritize(self, entry_id, urgency):
+        """Give a waiting entry a new urgency; returns the entry, or None if it has left"""
+        with self._lock:
+            slot = self._slot(entry_id)
+            if slot is None:
+                return None
+            self._set_urgency(slot, urgency)
+            return self._entry(slot)
+
+    def reassess(self, entry_id, urgency, condition, age, gender, dangerous_interaction=False):
+        """Replace a waiting entry's assessment, as admit() takes it; None if it has left"""
+        with self._lock:
+            slot = self._slot(entry_id)
+            if slot is None:
+                return None
+            self._condition[slot] = self._condition_id(condition)
+            self._age[slot] = age
+            self._gender[slot] = GENDERS.index(gender)
+            self._dangerous[slot] = 1 if dangerous_interaction else 0
+            self._set_urgency(slot, urgency)
+            return self._entry(slot)
+
+    def _take(self, slot):
+        """Unlink a slot from the heap and free it; returns its entry"""
+        entry = self._entry(slot)
+        pos = self._position[slot]
+        last = self._heap.pop()
+        if last != slot:
+            self._heap[pos] = last
+            self._position[last] = pos
+            self._sift_up(pos)
+            self._sift_down(self._position[last])
+        self._position[slot] = -1
+        self._generation[slot] = (self._generation[slot] + 1) % _GENERATIONS
+        self._references[slot] = None
+        self._free.append(slot)
+        self._changed()
+        return entry
+
+    def remove(self, entry_id):
+        """Take an entry off the waitlist; returns it, or None if it had already left"""
+        with self._lock:
+            slot = self._slot(entry_id)
+            return None if slot is None else self._take(slot)
+
+    def pop(self):
+        """Take the most urgent entry off the waitlist; None when it is empty"""
+        with self._lock:
+            return self._take(self._heap[0]) if self._heap else None
+
+    def page(self, offset=0, limit=50):
+        """Entries offset..offset+limit in priority order.
+
+        Walks the heap best-first, so a page costs O((offset + limit) log) and
+        the waitlist is never sorted as a whole.
+        """
+        with self._lock:
+            heap, key = self._heap, self._key
+            count = len(heap)
+            slots = []
+            candidates = [(-key[heap[0]], 0)] if count else []
+            seen = 0
+            while candidates and len(slots) < limit:
+                _, pos = heapq.heappop(candidates)
+                if seen >= offset:
+                    slots.append(heap[pos])
+                seen += 1
+                for child in (2 * pos + 1, 2 * pos + 2):
+                    if child < count:
+                        heapq.heappush(candidates, (-key[heap[child]], child))
+            return [self._entry(slot) for slot in slots]
+
+    def snapshot(self, path):
+        """Write the waitlist to path atomically; returns the number of entries written"""
+        with self._lock:
+            columns = [column.tobytes() for column in self._columns]
+            heap, free = self._heap.tobytes(), self._free.tobytes()
+            meta = json.dumps({
+                "conditions": self._conditions,
+                "references": {slot: reference for slot, reference in enumerate(self._references)
+                               if reference is not None},
+            }).encode()
+            header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(self._position), len(self._heap), len(self._free),
+                                  self._next_seq, len(meta))
+            count = len(self._heap)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            for chunk in [header, meta] + columns + [heap, free]:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return count
+
+    @classmethod
+    def restore(cls, path, max_entries=MAX_ENTRIES):
+        """Waitlist read back from a snapshot; ids handed out before it was taken stay valid"""
+        if sys.byteorder != "little":
+            raise ValueError("Waitlist snapshots are read on little-endian machines only")
+        waitlist = cls(max_entries)
+        with open(path, "rb") as f:
+            magic, version, slots, waiting, free, next_seq, meta_length = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a waitlist snapshot")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}; this server reads version {FORMAT_VERSION}")
+            meta = json.loads(f.read(meta_length))
+            for column in waitlist._columns:
+                column.fromfile(f, slots)
+            waitlist._heap.fromfile(f, waiting)
+            waitlist._free.fromfile(f, free)
+        waitlist._next_seq = next_seq
+        waitlist._conditions = meta["conditions"]
+        waitlist._condition_index = {condition: i for i, condition in enumerate(meta["conditions"])}
+        waitlist._references = [None] * slots
+        for slot, reference in meta["references"].items():
+            waitlist._references[int(slot)] = reference
+        return waitlist
+
+
+class Snapshots:
+    """Periodic and at-exit snapshots of a store with snapshot(path) and a changes counter.
+
+    Nothing runs until the store first changes in a process: that process then
+    starts the snapshot thread, and writes the final snapshot at exit. Threads
+    do not survive fork, so a forked worker starts its own on its first change,
+    while the process that forked stops writing altogether; otherwise its copy,
+    stale since the fork, would overwrite what the workers saved.
+    """
+
+    def __init__(self, store, path, interval, name):
+        self.store = store
+        self.path = path
+        self.interval = interval
+        self.name = name
+        # store.changes as of the snapshot file
+        self._saved = store.changes
+        self._pid = None
+        self._forked = False
+        self._start_lock = threading.Lock()
+        os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+        atexit.register(self.close)
+
+    def _before_fork(self):
+        self._forked = True
+
+    def _after_fork_in_child(self):
+        self._forked = False
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _owner(self):
+        return self._pid == os.getpid() and not self._forked
+
+    def ensure_started(self):
+        """Start this process's snapshot thread, once; called on every change"""
+        if self._pid == os.getpid() or self._forked:
+            return
+        with self._start_lock:
+            if self._pid != os.getpid() and not self._forked:
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name=f"{self.name}-snapshot", daemon=True).start()
+
+    def save(self):
+        """Write the snapshot if the store changed since the last one"""
+        changes = self.store.changes
+        if changes != self._saved:
+            self.store.snapshot(self.path)
+            self._saved = changes
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self._owner():
+                return
+            try:
+                self.save()
+            except OSError:
+                # Try again after the next interval; the previous snapshot is still intact
+                logger.exception("Could not write snapshot %s", self.path)
+
+    def close(self):
+        """Final snapshot at exit, from the process that owns the store's changes only"""
+        if self._owner():
+            self.save()
+
+
+def waitlist_from_env():
+    """Waitlist configured from WAITLIST_* environment variables, restored from its snapshot if there is one"""
+    max_entries = int(os.environ.get("WAITLIST_MAX_ENTRIES", MAX_ENTRIES))
+    path = os.environ.get("WAITLIST_SNAPSHOT_PATH")
+    if not path:
+        return Waitlist(max_entries)
+    if os.path.exists(path):
+        waitlist = Waitlist.restore(path, max_entries)
+        logger.info("Restored %d waiting patients from %s", len(waitlist), path)
+    else:
+        waitlist = Waitlist(max_entries)
+    waitlist.snapshots = Snapshots(waitlist, path, float(os.environ.get("WAITLIST_SNAPSHOT_SECONDS", 60)), "waitlist")
+    return waitlist